@@ -1,10 +1,19 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
+import typing
 from chainlit.server import app as fastapi_app
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from strawberry.fastapi import GraphQLRouter
 from core.schema import schema
 from core.logger import logger
 from strawberry.subscriptions import GRAPHQL_TRANSPORT_WS_PROTOCOL, GRAPHQL_WS_PROTOCOL
 from core.i18n import _t
+from core.health import cached_deep_health
+from core.cancellation import CancellationToken
+from core.headless import analyze_events, analyze_result, sse_event
+from core.sessions import SessionStore
+import core.services as services
 
 # Include GraphQL Router with subscription protocols enabled
 graphql_app = GraphQLRouter(
@@ -24,6 +33,15 @@ async def health_check():
 health_route = fastapi_app.routes.pop()
 fastapi_app.routes.insert(0, health_route)
 
+@fastapi_app.get("/health/deep")
+async def deep_health_check():
+    """Readiness for load balancers and on-call tooling: 200 when able to serve, 503 otherwise."""
+    report = await cached_deep_health()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+deep_health_route = fastapi_app.routes.pop()
+fastapi_app.routes.insert(0, deep_health_route)
+
 @fastapi_app.get("/api/translations")
 async def get_translations(lang: str = "zh-TW"):
     keys = [
@@ -41,4 +59,98 @@ async def get_translations(lang: str = "zh-TW"):
 trans_route = fastapi_app.routes.pop()
 fastapi_app.routes.insert(0, trans_route)
 
+# --- Headless analysis API for SIEM / automation clients ---
+api_sessions = SessionStore()
+
+class AnalyzeRequest(BaseModel):
+    input: str = Field(..., min_length=1, description="Alert, log excerpt or question to analyze")
+    session_id: typing.Optional[str] = Field(None, description="Reuse to keep multi-turn history")
+    lang: str = Field("en", description="UI language code for the answer (en, zh-TW, ja, ...)")
+    translate: bool = Field(False, description="Translate English security answers into lang")
+    stream: bool = Field(False, description="Stream Server-Sent Events instead of one JSON object")
+    fresh: bool = Field(False, description="Always run the model, even when a precomputed playbook answer matches")
+
+async def _run_analysis(req: AnalyzeRequest, cancel_token: CancellationToken) -> typing.AsyncGenerator[dict, None]:
+    """One turn under the session lock; the session history is updated only when the turn completes."""
+    session_lock = api_sessions.lock(req.session_id) if req.session_id else None
+    if session_lock:
+        await session_lock.acquire()
+    try:
+        history = api_sessions.history(req.session_id) if req.session_id else []
+        events = analyze_events(services.assistant_service, req.input.strip(), history, lang=req.lang,
+                                translate=req.translate, cancel_token=cancel_token, fresh=req.fresh)
+        try:
+            async for chunk in events:
+                if chunk["type"] == "done":
+                    if req.session_id and not cancel_token.cancelled:
+                        api_sessions.append(req.session_id, chunk["history_input"], chunk["content"])
+                    chunk = {k: v for k, v in chunk.items() if k != "history_input"}
+                    chunk["session_id"] = req.session_id
+                yield chunk
+        finally:
+            await events.aclose()
+    finally:
+        if session_lock:
+            session_lock.release()
+
+@fastapi_app.post("/api/analyze")
+async def analyze(req: AnalyzeRequest, request: Request):
+    """Runs the classify -> RAG -> generate (-> translate) pipeline without the Chainlit UI.
+
+    Returns one JSON object, or an SSE stream (meta/progress/token/final/translation_*/done events)
+    when "stream" is true or the client sends Accept: text/event-stream. With STRUCTURED_OUTPUT_ENABLED,
+    security answers also carry the grammar-constrained object as "analysis" (in the final event when streaming).
+    """
+    try:
+        await services.ensure_models_loaded()
+    except Exception as e:
+        logger.error(f"Analyze API: models unavailable: {e}")
+        return JSONResponse({"error": f"Models unavailable: {e}"}, status_code=503)
+
+    cancel_token = CancellationToken()
+    wants_stream = req.stream or "text/event-stream" in request.headers.get("accept", "")
+    if wants_stream:
+        async def event_stream():
+            try:
+                with services.telemetry.trace("API Analyze", input=req.input, metadata={"lang": req.lang, "stream": True}):
+                    async for chunk in _run_analysis(req, cancel_token):
+                        yield sse_event(chunk)
+            except Exception as e:
+                logger.error(f"Analyze API stream error: {e}")
+                yield sse_event({"type": "error", "error": str(e)})
+            finally:
+                # Client disconnects close this generator; stop generating for nobody
+                cancel_token.cancel("disconnected")
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    try:
+        with services.telemetry.trace("API Analyze", input=req.input, metadata={"lang": req.lang, "stream": False}) as trace:
+            result = await analyze_result(_run_analysis(req, cancel_token))
+            trace["output"] = result["content"]
+    except Exception as e:
+        logger.error(f"Analyze API error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    result.pop("history_input", None)
+    result["session_id"] = req.session_id
+    return JSONResponse(result)
+
+analyze_route = fastapi_app.routes.pop()
+fastapi_app.routes.insert(0, analyze_route)
+
+@fastapi_app.post("/api/warmup")
+async def warmup():
+    """Loads the models and starts the hardware monitor without a chat session (used by workers.py and routers)."""
+    services.start_hardware_monitor()
+    try:
+        await services.ensure_models_loaded()
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        return JSONResponse({"ready": False, "error": str(e)}, status_code=503)
+    return JSONResponse({"ready": True})
+
+warmup_route = fastapi_app.routes.pop()
+fastapi_app.routes.insert(0, warmup_route)
+
 logger.info("✅ FastAPI routes and GraphQL initialized.")
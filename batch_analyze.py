@@ -0,0 +1,225 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Bulk offline log analysis through the same classify -> RAG -> generate path as the chat UI.
+# Usage: python batch_analyze.py alerts.jsonl auth.log -o results.jsonl --concurrency 4
+# Re-running the same command resumes from the checkpoint written next to the output file;
+# failed items go to <output>.errors and are retried on resume.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import typing
+
+from core.config import MODEL_SEC_PATH, MODEL_LLAMA3_PATH, PLAYBOOKS_PATH
+from core.i18n import get_lang_name
+from core.logger import logger
+
+TEXT_FIELDS = ("text", "message", "content", "log", "input")
+
+def iter_inputs(paths: typing.List[str], text_field: str = None, group_lines: int = 1) -> typing.Iterator[typing.Tuple[str, str]]:
+    """Lazily yields (item_id, text) pairs. JSONL lines are records, other files are grouped log lines."""
+    for path in paths:
+        is_jsonl = path.endswith((".jsonl", ".ndjson"))
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            if is_jsonl:
+                for lineno, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping malformed JSON at {path}:{lineno}")
+                        continue
+                    if isinstance(record, str):
+                        yield f"{path}:{lineno}", record
+                        continue
+                    fields = [text_field] if text_field else TEXT_FIELDS
+                    text = next((record[k] for k in fields if k in record), None)
+                    if text is None:
+                        logger.warning(f"No text field in {path}:{lineno}")
+                        continue
+                    yield str(record.get("id", f"{path}:{lineno}")), str(text)
+            else:
+                buf, start = [], 1
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    if not buf:
+                        start = lineno
+                    buf.append(line.rstrip("\n"))
+                    if len(buf) >= group_lines:
+                        yield f"{path}:{start}", "\n".join(buf)
+                        buf = []
+                if buf:
+                    yield f"{path}:{start}", "\n".join(buf)
+
+def load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def load_output_ids(path: str) -> set:
+    """Ids of the records already in the output file. A crash after a record is written but before its
+    checkpoint line leaves it out of the checkpoint, so a resumed run skips these ids as well."""
+    if not os.path.exists(path):
+        return set()
+    ids = set()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line of an interrupted write: the item is retried
+                continue
+            if isinstance(record, dict) and "id" in record:
+                ids.add(str(record["id"]))
+    return ids
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.time()
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.security = 0
+        self.completion_tokens = 0
+
+    def summary(self) -> str:
+        elapsed = max(time.time() - self.started, 1e-6)
+        return (
+            f"done={self.done} failed={self.failed} skipped={self.skipped} security={self.security} "
+            f"| {self.done / elapsed:.2f} items/s, {self.completion_tokens / elapsed:.1f} tok/s "
+            f"| elapsed {elapsed:.1f}s"
+        )
+
+async def analyze_item(assistant_service, item_id: str, text: str, target_lang: str) -> dict:
+    result = {"id": item_id, "input": text}
+    start = time.time()
+    async for chunk in assistant_service.generate_response(text, [], target_lang=target_lang):
+        if chunk["type"] == "meta":
+            result["model"] = chunk["author"]
+            result["is_security"] = chunk["is_security"]
+        elif chunk["type"] == "final":
+            result["analysis"] = chunk["full_content"]
+            result["tokens"] = chunk["tokens"]
+            result["generation_s"] = round(chunk["elapsed"], 3)
+
+    if result.get("is_security") and target_lang != "English":
+        async for chunk in assistant_service.translate_response(result["analysis"], target_lang):
+            if chunk["type"] == "final":
+                result["translation"] = chunk["full_content"]
+    result["elapsed_s"] = round(time.time() - start, 3)
+    return result
+
+def load_assistant_service(args):
+    import core.services as services
+
+    services.llm_manager.load_general_model(MODEL_LLAMA3_PATH)
+    services.llm_manager.load_security_model(MODEL_SEC_PATH)
+    services.llm_manager.load_router_model()
+    services.vector_db.setup_model()
+    if args.sync_playbooks:
+        services.vector_db.ingest_playbooks(PLAYBOOKS_PATH)
+    return services.assistant_service
+
+async def run_batch(args, assistant_service=None) -> BatchStats:
+    if assistant_service is None:
+        assistant_service = load_assistant_service(args)
+
+    checkpoint_path = args.checkpoint or f"{args.output}.ckpt"
+    completed = set() if args.restart else load_checkpoint(checkpoint_path) | load_output_ids(args.output)
+    if completed:
+        logger.info(f"Resuming: {len(completed)} items already completed.")
+
+    target_lang = get_lang_name(args.lang)
+    stats = BatchStats()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    mode = "w" if args.restart else "a"
+    torn = not args.restart and _ends_mid_line(args.output)
+
+    # Failures go to their own file: a resumed run retries them, and the output keeps one record per item
+    errors_path = args.errors or f"{args.output}.errors"
+
+    with open(args.output, mode, encoding="utf-8") as out, open(checkpoint_path, mode, encoding="utf-8") as ckpt, \
+            open(errors_path, mode, encoding="utf-8") as errors:
+        if torn:
+            # Start appended records on a fresh line instead of gluing the first one to the torn record
+            out.write("\n")
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    queue.task_done()
+                    return
+                item_id, text = item
+                try:
+                    result = await analyze_item(assistant_service, item_id, text, target_lang)
+                    stats.done += 1
+                    stats.security += int(bool(result.get("is_security")))
+                    stats.completion_tokens += result.get("tokens", {}).get("completion", 0)
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    ckpt.write(item_id + "\n")
+                    ckpt.flush()
+                except Exception as e:
+                    logger.error(f"Item {item_id} failed: {e}")
+                    stats.failed += 1
+                    # Not checkpointed, so a resumed run retries it
+                    errors.write(json.dumps({"id": item_id, "input": text, "error": str(e),
+                                             "failed_at": time.time()}, ensure_ascii=False) + "\n")
+                    errors.flush()
+                if (stats.done + stats.failed) % args.report_every == 0:
+                    print(f"[batch] {stats.summary()}", file=sys.stderr)
+                queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        enqueued = 0
+        for item_id, text in iter_inputs(args.inputs, args.field, args.group_lines):
+            if item_id in completed:
+                stats.skipped += 1
+                continue
+            await queue.put((item_id, text))
+            enqueued += 1
+            if args.limit and enqueued >= args.limit:
+                break
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offline Foundation-Sec log analysis.")
+    parser.add_argument("inputs", nargs="+", help="JSONL files (one record per line) or plain log files")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.ckpt)")
+    parser.add_argument("--errors", help="JSONL file failed items are appended to (default: <output>.errors)")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing checkpoint and overwrite output")
+    parser.add_argument("-c", "--concurrency", type=int, default=2,
+                        help="In-flight items; in-process models serialize generation, remote backends batch")
+    parser.add_argument("--field", help="JSON field holding the text (default: first of %s)" % ", ".join(TEXT_FIELDS))
+    parser.add_argument("--group-lines", type=int, default=1, help="Log lines per item for plain log files")
+    parser.add_argument("--lang", default="en", help="Translate security answers into this UI language code")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after N items (0 = no limit)")
+    parser.add_argument("--report-every", type=int, default=25, help="Print throughput every N items")
+    parser.add_argument("--sync-playbooks", action="store_true", help="Ingest playbooks.json before running")
+    args = parser.parse_args(argv)
+    args.concurrency = max(1, args.concurrency)
+    args.report_every = max(1, args.report_every)
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    stats = asyncio.run(run_batch(args))
+    print(f"[batch] finished: {stats.summary()}", file=sys.stderr)
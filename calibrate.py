@@ -0,0 +1,159 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Hardware calibration: sweeps llama.cpp GPU layers, threads and batch sizes for each local GGUF,
+# measures prefill/decode rates on a standard prompt set and writes a per-machine profile
+# that LLMManager._load_model picks up automatically on the next start.
+# Usage: python calibrate.py [--role security] [--max-tokens 48] [--skip-gpu-sweep]
+import argparse
+import gc
+import os
+import sys
+import time
+import typing
+
+from core.config import MODEL_ROLES, LLM_TUNING_PROFILE_PATH
+from core.logger import logger
+from core.memory_profiles import resolve_profile, runtime_settings
+from core.tuning import (
+    CALIBRATION_PROMPTS, estimate_seconds, thread_candidates,
+    gpu_layer_candidates, batch_candidates, save_model_result
+)
+
+def measure(llm, prompts: typing.List[str], max_tokens: int) -> typing.Tuple[float, float]:
+    """Returns (prefill tokens/s, decode tokens/s) over the prompt set."""
+    # Warm-up: the first evaluation compiles GPU kernels and faults in the mmap'd weights
+    for _ in llm.create_completion("Hello", max_tokens=2, temperature=0.0, stream=True):
+        pass
+    prompt_tokens = decode_tokens = 0
+    prefill_time = decode_time = 0.0
+    for prompt in prompts:
+        llm.reset()  # no KV prefix reuse between prompts, so prefill is measured every time
+        prompt_tokens += len(llm.tokenize(prompt.encode("utf-8")))
+        start = time.perf_counter()
+        first = None
+        generated = 0
+        for _ in llm.create_completion(prompt, max_tokens=max_tokens, temperature=0.0, stream=True):
+            if first is None:
+                first = time.perf_counter()
+            generated += 1
+        end = time.perf_counter()
+        if first is None:
+            continue
+        prefill_time += first - start
+        decode_time += end - first
+        decode_tokens += max(0, generated - 1)
+    prefill_tps = prompt_tokens / prefill_time if prefill_time > 0 else 0.0
+    decode_tps = decode_tokens / decode_time if decode_time > 0 else 0.0
+    return prefill_tps, decode_tps
+
+class Calibrator:
+    def __init__(self, llm_manager, path: str, context_size: int, max_tokens: int, memory: dict = None):
+        self.llm_manager = llm_manager
+        self.path = path
+        self.context_size = context_size
+        self.memory = memory
+        self.max_tokens = max_tokens
+        self.block_count = 0
+        self.trials = 0
+
+    def trial(self, params: dict) -> typing.Optional[dict]:
+        """Loads the model with params, measures it and frees it. Returns metrics, or None if it failed to load/run."""
+        self.trials += 1
+        llm = None
+        try:
+            llm = self.llm_manager._load_model(self.path, context_size=self.context_size, memory=self.memory, **params)
+            if not self.block_count:
+                arch = llm.metadata.get("general.architecture", "llama")
+                self.block_count = int(llm.metadata.get(f"{arch}.block_count", 0) or 0)
+            prefill_tps, decode_tps = measure(llm, CALIBRATION_PROMPTS, self.max_tokens)
+        except Exception as e:
+            logger.warning(f"Calibration trial failed ({params}): {e}")
+            return None
+        finally:
+            if llm is not None and hasattr(llm, "close"):
+                llm.close()
+            del llm
+            gc.collect()
+        metrics = {"prefill_tps": round(prefill_tps, 1), "decode_tps": round(decode_tps, 1),
+                   "reference_seconds": round(estimate_seconds(prefill_tps, decode_tps), 2)}
+        print(f"  {params} -> prefill {metrics['prefill_tps']} tok/s, decode {metrics['decode_tps']} tok/s, "
+              f"ref request {metrics['reference_seconds']}s", file=sys.stderr)
+        return metrics
+
+    def sweep(self, best: dict, best_metrics: dict, key: str, candidates: list) -> typing.Tuple[dict, dict]:
+        """One coordinate-descent stage: varies `key` with everything else fixed at the current best."""
+        for value in candidates:
+            params = dict(best)
+            if isinstance(key, tuple):
+                params.update(zip(key, value))
+            else:
+                params[key] = value
+            if params == best:
+                continue
+            metrics = self.trial(params)
+            if metrics and metrics["reference_seconds"] < best_metrics["reference_seconds"]:
+                best, best_metrics = params, metrics
+        return best, best_metrics
+
+def calibrate_role(role: str, args, hw) -> typing.Optional[dict]:
+    from core.llm import LLMManager
+    cfg = MODEL_ROLES[role]
+    path = cfg["path"]
+    if cfg["backend"] != "llama_cpp" or not path or not os.path.exists(path):
+        print(f"[calibrate] {role}: no local GGUF configured, skipping", file=sys.stderr)
+        return None
+
+    # Measure with the context size and KV cache settings the app will load this model with
+    settings = runtime_settings(role, resolve_profile(ram_total_gb=hw.ram_total))
+    n_ctx = settings.pop("n_ctx")
+    print(f"[calibrate] {role}: {os.path.basename(path)} (ctx={n_ctx})", file=sys.stderr)
+    calibrator = Calibrator(LLMManager(), path, n_ctx, args.max_tokens, memory=settings)
+    cpu_count = hw.cpu_count or os.cpu_count() or 4
+    # Baseline is today's untuned behaviour, with every parameter explicit so an existing profile cannot leak in
+    best = {"n_gpu_layers": cfg["n_gpu_layers"], "n_threads": max(1, cpu_count // 2),
+            "n_threads_batch": cpu_count, "n_batch": 512, "n_ubatch": 512}
+    best_metrics = calibrator.trial(best)
+    if best_metrics is None:
+        print(f"[calibrate] {role}: baseline failed to load, skipping", file=sys.stderr)
+        return None
+    baseline_seconds = best_metrics["reference_seconds"]
+
+    if not args.skip_gpu_sweep:
+        best, best_metrics = calibrator.sweep(best, best_metrics, "n_gpu_layers", gpu_layer_candidates(calibrator.block_count))
+    # Decode is latency bound and usually best on performance cores only; prefill is compute bound
+    threads = thread_candidates(cpu_count, hw.p_cores)
+    best, best_metrics = calibrator.sweep(best, best_metrics, "n_threads", threads)
+    best, best_metrics = calibrator.sweep(best, best_metrics, "n_threads_batch", threads)
+    best, best_metrics = calibrator.sweep(best, best_metrics, ("n_batch", "n_ubatch"), batch_candidates(n_ctx))
+
+    best_metrics["baseline_reference_seconds"] = baseline_seconds
+    best_metrics["trials"] = calibrator.trials
+    save_model_result(path, best, best_metrics, args.output)
+    print(f"[calibrate] {role}: best {best} -> {best_metrics['reference_seconds']}s per reference request "
+          f"(baseline {baseline_seconds}s, {calibrator.trials} trials)", file=sys.stderr)
+    return best
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate llama.cpp runtime parameters for this machine.")
+    parser.add_argument("--role", action="append", choices=sorted(MODEL_ROLES),
+                        help="Model role to calibrate (repeatable, default: every local GGUF role)")
+    parser.add_argument("--max-tokens", type=int, default=48, help="Tokens generated per prompt when measuring decode")
+    parser.add_argument("--skip-gpu-sweep", action="store_true", help="Keep the configured n_gpu_layers")
+    parser.add_argument("-o", "--output", default=LLM_TUNING_PROFILE_PATH, help="Profile file to write")
+    args = parser.parse_args(argv)
+    args.max_tokens = max(8, args.max_tokens)
+    return args
+
+if __name__ == "__main__":
+    from core.hardware import HardwareMonitor
+    args = parse_args()
+    hw = HardwareMonitor()
+    roles = args.role or list(MODEL_ROLES)
+    # Roles sharing a GGUF (router defaults to the general model's layers) are calibrated once
+    seen = set()
+    for role in roles:
+        path = MODEL_ROLES[role]["path"]
+        if path in seen:
+            continue
+        seen.add(path)
+        calibrate_role(role, args, hw)
+    print(f"[calibrate] profile written to {args.output}", file=sys.stderr)
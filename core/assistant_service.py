@@ -1,25 +1,233 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
 import asyncio
+import contextlib
 import time
 import typing
 from core.llm import LLMManager
 from core.database import VectorDBManager
-from core.config import TRANSLATION_SYSTEM_MESSAGE
+from core.i18n import LANG_NAMES
+from core.log_compactor import LogCompactor
+from core.long_input import LongInputAnalyzer
+from core.cancellation import CancellationToken, estimate_savings
+from core.coalescing import RequestCoalescer, coalesce_key
+from core.repetition import RepetitionDetector
+from core.structured_output import MarkdownStream, parse_analysis, render_markdown, response_format
+from core.config import (
+    TRANSLATION_SYSTEM_MESSAGE,
+    REDUCE_INSTRUCTION,
+    LOG_COMPACTION_ENABLED,
+    MAP_REDUCE_ENABLED,
+    COALESCING_ENABLED,
+    PIPELINE_OVERLAP_ENABLED,
+    LOOP_DETECTION_ENABLED,
+    STRUCTURED_OUTPUT_ENABLED,
+    STRUCTURED_OUTPUT_MAX_TOKENS,
+    PLAYBOOK_FAST_PATH_ENABLED,
+    PLAYBOOK_FAST_PATH_MIN_SCORE,
+    PLAYBOOK_FAST_PATH_MAX_CHARS,
+    MODEL_ROLES
+)
 from core.logger import logger
-from langfuse import observe
+
+GENERATION_STOP = ["<|eot_id|>", "<|end_of_text|>", "</s>", "[INST]", "User:", "Question:", "Context:", "Analysis Instruction:"]
+# With a grammar the output cannot drift into a new turn; prose stop strings could cut a JSON string short
+STRUCTURED_STOP = ["<|eot_id|>", "<|end_of_text|>"]
+
+def security_user_prompt(context_str: str, prompt_input: str) -> str:
+    # Use direct instructions to bypass structural looping hallucinations
+    return (
+        f"BACKGROUND CONTEXT:\n{context_str}\n\n"
+        f"Analyze the following technical query based on the background if relevant: {prompt_input}\n\n"
+        f"RESPONSE (in English):"
+    )
+
+async def _timed(fn, *args) -> typing.Tuple[typing.Any, float]:
+    start = time.perf_counter()
+    result = await asyncio.to_thread(fn, *args)
+    return result, time.perf_counter() - start
 
 class AssistantService:
     """Orchestrates LLM calls, RAG context, and translation logic."""
-    def __init__(self, llm_manager: LLMManager, vector_db: VectorDBManager):
+    def __init__(self, llm_manager: LLMManager, vector_db: VectorDBManager, telemetry=None, governor=None):
         self.llm = llm_manager
         self.vector_db = vector_db
+        self.telemetry = telemetry
+        # Optional InferenceGovernor: admission, max_tokens caps and translation routing under hardware pressure
+        self.governor = governor
+        self.log_compactor = LogCompactor()
+        # Work not done because requests were stopped, abandoned or superseded
+        self.cancel_stats = {"cancelled": 0, "tokens_saved": 0, "seconds_saved": 0.0}
+        self.coalescer = RequestCoalescer()
+        # Generations stopped early because they started looping
+        self.loop_stats = {"detected": 0, "tokens_saved": 0, "seconds_saved": 0.0}
+        # Security questions answered from a precomputed playbook answer instead of the model
+        self.precomputed_stats = {"served": 0}
 
-    @observe(as_type="generation")
-    async def generate_response(self, user_input: str, chat_history: list, target_lang: str = "Traditional Chinese") -> typing.AsyncGenerator[dict, None]:
-        """Classifies intent, fetches context, and streams main response."""
-        
-        # 1. Classify Intent
-        is_security = await asyncio.to_thread(self.llm.classify_intent, user_input)
+    def _record_cancellation(self, name: str, reason: str, generated: int, max_tokens: int, elapsed: float) -> dict:
+        savings = estimate_savings(generated, max_tokens, elapsed)
+        savings["reason"] = reason
+        self.cancel_stats["cancelled"] += 1
+        self.cancel_stats["tokens_saved"] += savings["tokens_saved"]
+        self.cancel_stats["seconds_saved"] = round(self.cancel_stats["seconds_saved"] + savings["seconds_saved"], 2)
+        logger.info(f"{name} cancelled ({reason}) after {generated} tokens; "
+                    f"saved up to {savings['tokens_saved']} tokens / {savings['seconds_saved']}s")
+        return savings
+
+    def _record_loop(self, loop: dict, generated: int, max_tokens: int, elapsed: float) -> dict:
+        savings = estimate_savings(generated, max_tokens, elapsed)
+        self.loop_stats["detected"] += 1
+        self.loop_stats["tokens_saved"] += savings["tokens_saved"]
+        self.loop_stats["seconds_saved"] = round(self.loop_stats["seconds_saved"] + savings["seconds_saved"], 2)
+        logger.warning(f"Generation loop detected ({loop['method']}) after {generated} tokens; trimmed "
+                       f"{loop['trimmed_tokens']} repeated tokens, saved up to {savings['tokens_saved']} tokens")
+        return {**loop, **savings}
+
+    async def generate_response(self, user_input: str, chat_history: list, target_lang: str = "Traditional Chinese",
+                                cancel_token: CancellationToken = None, fresh: bool = False) -> typing.AsyncGenerator[dict, None]:
+        """Streams the answer, sharing one generation between identical concurrent requests.
+
+        Requests with the same normalized input, models, language and history that arrive while
+        an identical one is running replay its stream instead of classifying and generating again.
+        fresh=True always runs the model, even when a precomputed playbook answer matches.
+        """
+        if not COALESCING_ENABLED:
+            source = self._admitted_response(user_input, chat_history, target_lang, cancel_token, fresh)
+        else:
+            models = "|".join(f"{role}={cfg['backend']}:{cfg['path'] or cfg['endpoint']}" for role, cfg in sorted(MODEL_ROLES.items()))
+            key = coalesce_key(user_input, models + ("|fresh" if fresh else ""), target_lang, chat_history)
+            source = self.coalescer.subscribe(
+                key, lambda token: self._admitted_response(user_input, list(chat_history), target_lang, token, fresh), cancel_token)
+        try:
+            async for chunk in source:
+                yield chunk
+        finally:
+            await source.aclose()
+
+    async def _admitted_response(self, user_input: str, chat_history: list, target_lang: str,
+                                 cancel_token: CancellationToken = None, fresh: bool = False) -> typing.AsyncGenerator[dict, None]:
+        """_generate_response behind the governor's admission gate (coalesced followers share the leader's slot)."""
+        if self.governor is None:
+            admission = contextlib.nullcontext()
+        else:
+            admission = self.governor.admit()
+        async with admission:
+            source = self._generate_response(user_input, chat_history, target_lang, cancel_token, fresh)
+            try:
+                async for chunk in source:
+                    yield chunk
+            finally:
+                await source.aclose()
+
+    def _precomputed_answer(self, hit: typing.Optional[dict], prompt_input: str) -> typing.Optional[dict]:
+        """The retrieved playbook when its stored answer can stand in for a generation: a confident match on a short input."""
+        if not PLAYBOOK_FAST_PATH_ENABLED or not hit or "en" not in hit["answers"]:
+            return None
+        if hit["score"] < PLAYBOOK_FAST_PATH_MIN_SCORE or len(prompt_input) > PLAYBOOK_FAST_PATH_MAX_CHARS:
+            return None
+        if STRUCTURED_OUTPUT_ENABLED and not hit.get("analysis"):
+            # Structured clients expect the parsed object; an answer stored in prose mode has none
+            return None
+        return hit
+
+    async def _prepare(self, prompt_input: str, fresh: bool = False
+                       ) -> typing.Tuple[bool, typing.Optional[dict], typing.Optional[dict], dict]:
+        """Classifies intent and retrieves the best playbook: (is_security, hit, precomputed playbook, stage timings).
+
+        With PIPELINE_OVERLAP_ENABLED, retrieval runs speculatively alongside classification (its
+        result is dropped for general chat) and the security model prefills its system prompt
+        while retrieval is still running. "saved_s" is the sum of the stages minus the wall time.
+        """
+        start = time.perf_counter()
+        stages = {"overlap": PIPELINE_OVERLAP_ENABLED}
+        hit, precomputed = None, None
+        if not PIPELINE_OVERLAP_ENABLED:
+            is_security, stages["classify_s"] = await _timed(self.llm.classify_intent, prompt_input)
+            if is_security:
+                hit, stages["retrieval_s"] = await _timed(self.vector_db.query_playbook, prompt_input)
+                precomputed = None if fresh else self._precomputed_answer(hit, prompt_input)
+        else:
+            retrieval = asyncio.create_task(_timed(self.vector_db.query_playbook, prompt_input))
+            prefill = None
+            if self.llm.keyword_intent(prompt_input):
+                # Keyword hit: no router call needed, so the security model can start on its system prompt right away
+                logger.info("Intent classified as 'Security' via keyword match.")
+                is_security, stages["classify_s"], stages["classified_by"] = True, 0.0, "keyword"
+                prefill = asyncio.create_task(_timed(self.llm.prefill_system_prompt, True))
+            else:
+                is_security, stages["classify_s"] = await _timed(self.llm.classify_intent, prompt_input)
+                stages["classified_by"] = "model"
+                if is_security and not retrieval.done():
+                    prefill = asyncio.create_task(_timed(self.llm.prefill_system_prompt, True))
+
+            if is_security:
+                hit, stages["retrieval_s"] = await retrieval
+                precomputed = None if fresh else self._precomputed_answer(hit, prompt_input)
+            else:
+                # Speculation lost: the worker thread finishes on its own and the context is discarded
+                retrieval.cancel()
+                stages["retrieval_discarded"] = True
+            if prefill is not None and precomputed is not None:
+                # The stored answer is served without the model; let the prefill finish in the background
+                prefill.add_done_callback(lambda task: task.cancelled() or task.exception())
+            elif prefill is not None:
+                try:
+                    stages["prefill_tokens"], stages["prefill_s"] = await prefill
+                except Exception as e:
+                    logger.warning(f"System prompt prefill failed: {e}")
+        stages["wall_s"] = time.perf_counter() - start
+        sequential = sum(stages.get(k, 0.0) for k in ("classify_s", "retrieval_s", "prefill_s"))
+        stages["saved_s"] = max(0.0, sequential - stages["wall_s"])
+        stages = {k: round(v, 3) if isinstance(v, float) else v for k, v in stages.items()}
+        logger.info(f"Pre-generation stages: {stages}")
+        return is_security, hit, precomputed, stages
+
+    def _precomputed_chunks(self, playbook: dict, target_lang: str, stages: dict, start: float) -> typing.List[dict]:
+        """meta/token/final chunks for a stored playbook answer, with the stored translation for target_lang."""
+        answer = playbook["answers"]["en"]
+        lang_code = next((code for code, name in LANG_NAMES.items() if name == target_lang), None)
+        translation = playbook["answers"].get(lang_code) if lang_code not in (None, "en") else None
+        info = {"playbook_id": playbook["id"], "title": playbook["title"], "score": round(playbook["score"], 3),
+                "translation": {"lang": lang_code, "content": translation} if translation else None}
+        self.precomputed_stats["served"] += 1
+        logger.info(f"Serving precomputed answer of playbook '{playbook['title']}' (score {info['score']})")
+        final = {"type": "final", "full_content": answer, "elapsed": time.time() - start,
+                 "tokens": {"total": 0, "prompt": 0, "completion": 0}, "speculative": None, "cancelled": None,
+                 "loop": None, "precomputed": info}
+        if STRUCTURED_OUTPUT_ENABLED:
+            # Same shape as a live structured answer: the stored text is the markdown of this object
+            final["structured"] = playbook["analysis"]
+        return [
+            {"type": "meta", "author": "Foundation-Sec", "is_security": True, "compaction": None, "map_reduce": False,
+             "governor": self.governor.level if self.governor is not None else None, "stages": stages,
+             "precomputed": info},
+            {"type": "token", "content": answer},
+            final,
+        ]
+
+    async def _generate_response(self, user_input: str, chat_history: list, target_lang: str = "Traditional Chinese",
+                                 cancel_token: CancellationToken = None, fresh: bool = False) -> typing.AsyncGenerator[dict, None]:
+        """Classifies intent, fetches context, and streams main response.
+
+        When cancel_token is cancelled the loop stops between tokens, the model is released,
+        and the final chunk carries a "cancelled" summary of the work saved.
+        """
+        start = time.time()
+
+        # 0. Compact pasted logs into "template x count" summaries before routing, retrieval and prompting
+        prompt_input = user_input
+        compaction = self.log_compactor.compact(user_input) if LOG_COMPACTION_ENABLED else None
+        if compaction:
+            prompt_input = compaction.text
+            logger.info(f"Compacted log input: {compaction.lines} lines -> {compaction.templates} templates (x{compaction.ratio})")
+
+        # 1. Classify Intent (overlapped with retrieval and system-prompt prefill)
+        is_security, hit, precomputed, stages = await self._prepare(prompt_input, fresh)
+        if precomputed is not None and not compaction:
+            # Fast path: a short question that confidently matches a playbook gets its stored answer
+            for chunk in self._precomputed_chunks(precomputed, target_lang, stages, start):
+                yield chunk
+            return
+        context_str = VectorDBManager.format_context(hit)
         active_llm = self.llm.get_active_model(is_security)
         active_name = "Foundation-Sec" if is_security else "Llama3-Taiwan"
         active_system_msg = self.llm.get_active_system_message(is_security)
@@ -29,114 +237,250 @@ class AssistantService:
         chat_messages.extend(chat_history)
 
         if is_security:
-            context_str = await asyncio.to_thread(self.vector_db.query_context, user_input)
-            # Use direct instructions to bypass structural looping hallucinations
-            enforced_input = (
-                f"BACKGROUND CONTEXT:\n{context_str}\n\n"
-                f"Analyze the following technical query based on the background if relevant: {user_input}\n\n"
-                f"RESPONSE (in English):"
-            )
-            chat_messages.append({"role": "user", "content": enforced_input})
+            chat_messages.append({"role": "user", "content": security_user_prompt(context_str, prompt_input)})
         else:
             if target_lang != "Traditional Chinese":
-                enforced_input = f"{user_input}\n\n[Action: Please respond in {target_lang} only.]"
+                enforced_input = f"{prompt_input}\n\n[Action: Please respond in {target_lang} only.]"
                 chat_messages.append({"role": "user", "content": enforced_input})
             else:
-                chat_messages.append({"role": "user", "content": user_input})
+                chat_messages.append({"role": "user", "content": prompt_input})
 
         # 3. Stream Main Response
         temperature = 0.4 if is_security else 0.2
         max_tokens = 350 if is_security else 1536
-        
-        logger.info(f"Generating response using {active_name}...")
-        stream = active_llm.create_chat_completion(
-            messages=chat_messages,
-            stream=True,
+        structured = is_security and STRUCTURED_OUTPUT_ENABLED
+        if structured:
+            # Not capped by the governor: a cut grammar output is an unclosed object that never parses.
+            # The schema's maxItems/maxLength already bound the answer.
+            max_tokens = STRUCTURED_OUTPUT_MAX_TOKENS
+        elif self.governor is not None:
+            max_tokens = self.governor.cap_max_tokens(max_tokens)
+
+        meta = {"type": "meta", "author": active_name, "is_security": is_security,
+                "compaction": compaction.stats() if compaction else None, "map_reduce": False,
+                "governor": self.governor.level if self.governor is not None else None, "stages": stages}
+        if compaction:
+            meta["history_input"] = compaction.text
+
+        # 3a. Long input: map chunks to findings, then reduce them into the usual structured answer
+        long_input = None
+        if is_security and MAP_REDUCE_ENABLED:
+            analyzer = LongInputAnalyzer(active_llm, self.llm.context_size("security"), max_tokens)
+            if not await analyzer.fits(chat_messages):
+                long_input = analyzer
+                meta["map_reduce"] = True
+                # Keep only a stub of the raw input in history so follow-up turns still fit the context
+                meta["history_input"] = f"[Long input: {len(prompt_input)} chars, analyzed in segments]\n{prompt_input[:1000]}"
+
+        yield meta
+        gen_start_time = time.time()
+        generation = self.telemetry.start_generation("generate_response", active_name, input=prompt_input) if self.telemetry else None
+
+        if long_input:
+            findings, segments = [], 0
+            analysis = long_input.analyze(prompt_input)
+            try:
+                async for chunk in analysis:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+                    if chunk["type"] == "findings":
+                        findings, segments = chunk["findings"], chunk["segments"]
+                    else:
+                        yield chunk
+            finally:
+                # Cancels the in-flight map tasks
+                await analysis.aclose()
+            if cancel_token is not None and cancel_token.cancelled:
+                cancelled = self._record_cancellation("generate_response", cancel_token.reason, 0, max_tokens, 0.0)
+                yield {"type": "final", "full_content": "", "elapsed": time.time() - gen_start_time,
+                       "tokens": {"total": sum(long_input.usage.values()), **long_input.usage}, "speculative": None,
+                       "cancelled": cancelled}
+                return
+            merged = "\n\n".join(f"[Segment findings {i}]\n{f}" for i, f in enumerate(findings, 1) if f)
+            reduce_input = REDUCE_INSTRUCTION.format(segments=segments, findings=merged)
+            chat_messages = [
+                {"role": "system", "content": active_system_msg},
+                {"role": "user", "content": f"BACKGROUND CONTEXT:\n{context_str}\n\n{reduce_input}\n\nRESPONSE (in English):"},
+            ]
+            if not await long_input.fits(chat_messages):
+                # The findings fit the reduce budget, so the retrieved context is what overflows; drop it
+                logger.warning("Reduce prompt over the context window, dropping the background context")
+                chat_messages[1]["content"] = f"{reduce_input}\n\nRESPONSE (in English):"
+                if not await long_input.fits(chat_messages):
+                    raise ValueError(f"Reduce prompt for {segments} segments does not fit the "
+                                     f"{long_input.n_ctx}-token context window")
+
+        logger.info(f"Generating response using {active_name}{' (structured)' if structured else ''}...")
+        params = {"response_format": response_format(), "stop": STRUCTURED_STOP} if structured else {"stop": GENERATION_STOP}
+        stream = active_llm.stream_chat(
+            chat_messages,
             temperature=temperature,
             top_p=0.9,
             repeat_penalty=1.1,
             max_tokens=max_tokens,
-            stop=["<|eot_id|>", "<|end_of_text|>", "</s>", "[INST]", "User:", "Question:", "Context:", "Analysis Instruction:"]
+            **params
         )
 
         assistant_response = ""
-        gen_start_time = time.time()
-        
-        yield {"type": "meta", "author": active_name, "is_security": is_security}
-
-        while True:
-            chunk = await asyncio.to_thread(next, stream, None)
-            if chunk is None:
-                break
-            
-            if "choices" in chunk and len(chunk["choices"]) > 0:
-                delta = chunk["choices"][0].get("delta", {})
-                if "content" in delta:
-                    text_chunk = delta["content"]
-                    assistant_response += text_chunk
-                    yield {"type": "token", "content": text_chunk}
+        spec_stats = None
+        generated = 0
+        aborted = None
+        cancelled = None
+        loop = None
+        # The grammar bounds structured output, and trimming a repeated tail would break its JSON
+        loop_detector = RepetitionDetector() if LOOP_DETECTION_ENABLED and not structured else None
+        markdown = MarkdownStream() if structured else None
+
+        try:
+            async for chunk in stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    aborted = cancel_token.reason
+                    break
+                if "speculative" in chunk:
+                    spec_stats = chunk["speculative"]
+                if "choices" in chunk and len(chunk["choices"]) > 0:
+                    delta = chunk["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        text_chunk = delta["content"]
+                        assistant_response += text_chunk
+                        generated += 1
+                        if markdown is not None:
+                            # Consumers see markdown as the JSON streams in
+                            text_chunk = markdown.feed(text_chunk)
+                        if text_chunk:
+                            yield {"type": "token", "content": text_chunk}
+                        if loop_detector is not None and loop_detector.feed(text_chunk):
+                            # Degenerate repetition: stop decoding now instead of running out max_tokens
+                            break
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away (task cancelled or generator closed) without using the token
+            aborted = "abandoned"
+            raise
+        finally:
+            await stream.aclose()
+            if aborted:
+                cancelled = self._record_cancellation("generate_response", aborted, generated, max_tokens,
+                                                      time.time() - gen_start_time)
 
         gen_elapsed = time.time() - gen_start_time
+        if loop_detector is not None and loop_detector.detected:
+            assistant_response = loop_detector.kept_text()
+            loop = self._record_loop(loop_detector.detected, generated, max_tokens, gen_elapsed)
+        full_content = assistant_response
+        analysis = None
+        if structured:
+            analysis = parse_analysis(assistant_response)
+            if analysis is None and not cancelled:
+                logger.warning(f"Structured output did not parse ({generated} tokens), returning the partial rendering")
+            full_content = render_markdown(analysis) if analysis else markdown.text
         
-        # Simple token count estimation if not provided by llama-cpp
-        p_tokens = len(active_llm.tokenize(str(chat_messages).encode("utf-8")))
-        c_tokens = len(active_llm.tokenize(assistant_response.encode("utf-8")))
+        # Simple token count estimation if not provided by the backend (remote backends may tokenize over HTTP)
+        p_tokens = len(await asyncio.to_thread(active_llm.tokenize, str(chat_messages).encode("utf-8")))
+        c_tokens = len(await asyncio.to_thread(active_llm.tokenize, assistant_response.encode("utf-8")))
+        if long_input:
+            p_tokens += long_input.usage["prompt"]
+            c_tokens += long_input.usage["completion"]
         
-        yield {
+        tokens = {"total": p_tokens + c_tokens, "prompt": p_tokens, "completion": c_tokens}
+        if self.telemetry:
+            self.telemetry.finish_generation(
+                generation, output=assistant_response, usage=tokens,
+                metadata={"is_security": is_security, "map_reduce": bool(long_input), "speculative": spec_stats,
+                          "cancelled": cancelled, "stages": stages, "loop": loop, "structured": structured}
+            )
+
+        final = {
             "type": "final",
-            "full_content": assistant_response,
+            "full_content": full_content,
             "elapsed": gen_elapsed,
-            "tokens": {"total": p_tokens + c_tokens, "prompt": p_tokens, "completion": c_tokens}
+            "tokens": tokens,
+            "speculative": spec_stats,
+            "cancelled": cancelled,
+            "loop": loop
         }
-        
-        # TODO: manual trace update logic needs mapping to the new API if possible, for now simplify by letting the decorator handle it
+        if structured:
+            # The parsed object (None if the output was cut off); full_content is its markdown rendering
+            final["structured"] = analysis
+        yield final
+
+    async def translate_response(self, text: str, target_lang: str,
+                                 cancel_token: CancellationToken = None) -> typing.AsyncGenerator[dict, None]:
+        """Translates English response to target layout using the general model.
 
-    @observe(as_type="generation")
-    async def translate_response(self, text: str, target_lang: str) -> typing.AsyncGenerator[dict, None]:
-        """Translates English response to target layout using the general model."""
+        Under hardware pressure the governor may route translation to the router model, or skip
+        it: the original text is then passed through and the final chunk carries "skipped".
+        """
         if not self.llm.llm_general:
             return
 
+        translator = self.governor.translation_backend(self.llm) if self.governor is not None else self.llm.llm_general
+        if translator is None:
+            logger.info(f"Translation to {target_lang} skipped by governor ({self.governor.level})")
+            yield {"type": "meta", "author": "Translator"}
+            yield {"type": "token", "content": text}
+            yield {"type": "final", "full_content": text, "elapsed": 0.0, "tokens": {"total": 0, "prompt": 0, "completion": 0},
+                   "cancelled": None, "skipped": f"governor {self.governor.level}"}
+            return
+
         logger.info(f"Translating response to {target_lang}...")
         trans_messages = [
             {"role": "system", "content": TRANSLATION_SYSTEM_MESSAGE.format(target_lang=target_lang)},
             {"role": "user", "content": f"Text to translate:\n{text}"},
         ]
 
-        trans_stream = self.llm.llm_general.create_chat_completion(
-            messages=trans_messages,
-            stream=True,
+        max_tokens = 600
+        trans_stream = translator.stream_chat(
+            trans_messages,
             temperature=0.1,
-            max_tokens=600,
+            max_tokens=max_tokens,
             stop=["<|eot_id|>", "<|end_of_text|>"]
         )
 
         chinese_response = ""
         trans_start_time = time.time()
+        translator_name = "Llama3-Taiwan" if translator is self.llm.llm_general else "Router"
+        generation = self.telemetry.start_generation("translate_response", translator_name, input=text) if self.telemetry else None
+        generated = 0
+        aborted = None
+        cancelled = None
 
         yield {"type": "meta", "author": "Translator"}
 
-        while True:
-            chunk = await asyncio.to_thread(next, trans_stream, None)
-            if chunk is None:
-                break
-            
-            if "choices" in chunk and len(chunk["choices"]) > 0:
-                delta = chunk["choices"][0].get("delta", {})
-                if "content" in delta:
-                    text_chunk = delta["content"]
-                    chinese_response += text_chunk
-                    yield {"type": "token", "content": text_chunk}
+        try:
+            async for chunk in trans_stream:
+                if cancel_token is not None and cancel_token.cancelled:
+                    aborted = cancel_token.reason
+                    break
+                if "choices" in chunk and len(chunk["choices"]) > 0:
+                    delta = chunk["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        text_chunk = delta["content"]
+                        chinese_response += text_chunk
+                        generated += 1
+                        yield {"type": "token", "content": text_chunk}
+        except (asyncio.CancelledError, GeneratorExit):
+            aborted = "abandoned"
+            raise
+        finally:
+            await trans_stream.aclose()
+            if aborted:
+                cancelled = self._record_cancellation("translate_response", aborted, generated, max_tokens,
+                                                      time.time() - trans_start_time)
 
         trans_elapsed = time.time() - trans_start_time
-        tp_tokens = len(self.llm.llm_general.tokenize(str(trans_messages).encode("utf-8")))
-        tc_tokens = len(self.llm.llm_general.tokenize(chinese_response.encode("utf-8")))
+        tp_tokens = len(await asyncio.to_thread(translator.tokenize, str(trans_messages).encode("utf-8")))
+        tc_tokens = len(await asyncio.to_thread(translator.tokenize, chinese_response.encode("utf-8")))
+
+        tokens = {"total": tp_tokens + tc_tokens, "prompt": tp_tokens, "completion": tc_tokens}
+        if self.telemetry:
+            self.telemetry.finish_generation(
+                generation, output=chinese_response, usage=tokens, metadata={"target_lang": target_lang, "cancelled": cancelled}
+            )
 
         yield {
             "type": "final",
             "full_content": chinese_response,
             "elapsed": trans_elapsed,
-            "tokens": {"total": tp_tokens + tc_tokens, "prompt": tp_tokens, "completion": tc_tokens}
+            "tokens": tokens,
+            "cancelled": cancelled
         }
-        
-        # TODO: manual trace update logic needs mapping to the new API if possible
@@ -0,0 +1,60 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import threading
+import typing
+
+class CancellationToken:
+    """Cooperative cancellation flag shared by the UI callbacks and the generation loops.
+
+    Generation loops check it between tokens, so a stop/disconnect frees the shared
+    model after at most one more token instead of after max_tokens.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: typing.List[typing.Callable[[], None]] = []
+        self.reason: typing.Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    async def wait(self):
+        """Returns once the token is cancelled; cancel() may be called from any thread."""
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        callback = lambda: loop.call_soon_threadsafe(woken.set)
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._callbacks.append(callback)
+        try:
+            await woken.wait()
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+def estimate_savings(generated: int, max_tokens: int, elapsed: float) -> dict:
+    """Upper-bound estimate of the work an aborted generation did not do.
+
+    The remaining max_tokens budget is priced at the decode rate observed so far;
+    the model may have stopped earlier on its own, so this is a ceiling.
+    """
+    tokens_saved = max(0, max_tokens - generated)
+    rate = generated / elapsed if elapsed > 0 and generated else 0.0
+    return {
+        "generated": generated,
+        "tokens_saved": tokens_saved,
+        "seconds_saved": round(tokens_saved / rate, 2) if rate else 0.0,
+    }
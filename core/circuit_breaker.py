@@ -0,0 +1,107 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import random
+import threading
+import time
+import typing
+from core.config import CIRCUIT_BREAKERS, BREAKER_JITTER
+from core.logger import logger
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around calls to one external dependency.
+
+    closed: calls go through; `failures` consecutive errors open the breaker.
+    open: calls fail immediately with CircuitOpenError until the jittered probe time.
+    half-open: a single probe call goes through; success closes the breaker, failure reopens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failures: int = 3, recovery_s: float = 30.0, jitter: float = BREAKER_JITTER,
+                 clock: typing.Callable[[], float] = time.monotonic, rng: typing.Callable[[], float] = random.random):
+        self.name = name
+        self.failure_threshold = max(1, failures)
+        self.recovery_s = recovery_s
+        self.jitter = jitter
+        self._clock = clock
+        self._rng = rng
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = 0.0
+        self.stats = {"calls": 0, "failures": 0, "short_circuited": 0, "trips": 0}
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        # Jitter spreads the probes of several workers/breakers instead of hitting a recovering service together
+        self.probe_at = now + self.recovery_s * (1 + self.jitter * (2 * self._rng() - 1))
+        self.stats["trips"] += 1
+        logger.warning(f"Circuit breaker '{self.name}' opened after {self.failures} failures; "
+                       f"probing again in {self.probe_at - now:.1f}s")
+
+    def available(self) -> bool:
+        """False while open and before the probe time; lets callers skip preparatory work too."""
+        return self.state != self.OPEN or self._clock() >= self.probe_at
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() >= self.probe_at:
+                self.state = self.HALF_OPEN
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed, dependency recovered")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._open(self._clock())
+
+    def call(self, fn: typing.Callable, *args, **kwargs):
+        if not self._acquire():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        self.stats["calls"] += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        now = self._clock()
+        return {
+            "state": self.state, "consecutive_failures": self.failures,
+            "open_for_s": round(now - self.opened_at, 1) if self.opened_at is not None else None,
+            "probe_in_s": round(max(0.0, self.probe_at - now), 1) if self.state == self.OPEN else None,
+            **self.stats,
+        }
+
+_breakers: typing.Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker of a dependency, configured from CIRCUIT_BREAKERS."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **CIRCUIT_BREAKERS.get(name, {}))
+        return _breakers[name]
+
+def breaker_states() -> typing.Dict[str, dict]:
+    with _breakers_lock:
+        return {name: breaker.snapshot() for name, breaker in _breakers.items()}
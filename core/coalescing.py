@@ -0,0 +1,124 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import hashlib
+import json
+import typing
+from core.cancellation import CancellationToken
+from core.logger import logger
+
+def normalize_input(text: str) -> str:
+    """Identical pastes differ in line endings and trailing whitespace; nothing else is folded."""
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+def coalesce_key(user_input: str, models: str, target_lang: str, chat_history: list) -> str:
+    history_fp = hashlib.sha256(json.dumps(chat_history, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    raw = "\x1f".join([normalize_input(user_input), models, target_lang or "", history_fp])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class _Flight:
+    """One in-flight generation: an append-only chunk buffer that any number of subscribers replay."""
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: typing.List[dict] = []
+        self.done = False
+        self.error: typing.Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancel_token = CancellationToken()
+        self.task: typing.Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: typing.Optional[dict] = None):
+        if chunk is not None:
+            self.chunks.append(chunk)
+        # Wake every waiter, then arm a fresh event for the next chunk
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+class RequestCoalescer:
+    """Runs identical concurrent requests once and fans the stream out to every requester.
+
+    The first request for a key starts the generation (leader); requests for the same key
+    that arrive while it is running (followers) replay the buffered chunks from the start
+    and then follow the live stream. Only in-flight work is shared: once a generation has
+    finished, the next identical request runs fresh.
+    """
+    def __init__(self):
+        self._flights: typing.Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    @property
+    def active(self) -> int:
+        return len(self._flights)
+
+    async def _pump(self, flight: _Flight, factory: typing.Callable[[CancellationToken], typing.AsyncGenerator[dict, None]]):
+        source = factory(flight.cancel_token)
+        try:
+            async for chunk in source:
+                flight.publish(chunk)
+        except Exception as e:
+            flight.error = e
+        finally:
+            await source.aclose()
+            flight.done = True
+            self._flights.pop(flight.key, None)
+            flight.publish()
+
+    async def subscribe(self, key: str, factory: typing.Callable[[CancellationToken], typing.AsyncGenerator[dict, None]],
+                        cancel_token: CancellationToken = None) -> typing.AsyncGenerator[dict, None]:
+        """Yields the chunks of the (possibly shared) generation for key.
+
+        factory receives the flight's own CancellationToken; it is cancelled only when the
+        last subscriber leaves, so one analyst stopping does not cut off the others.
+        """
+        flight = self._flights.get(key)
+        follower = flight is not None
+        if flight is None:
+            flight = _Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._pump(flight, factory))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["followers"] += 1
+            logger.info(f"Coalesced request onto in-flight generation ({flight.subscribers} already listening, "
+                        f"{len(flight.chunks)} chunks buffered)")
+        flight.subscribers += 1
+        detached = False
+        index = 0
+        # Waiting on the cancel token too means a cancel detaches at once, even while the flight is stalled
+        cancelled = asyncio.ensure_future(cancel_token.wait()) if cancel_token is not None else None
+        try:
+            while True:
+                changed = flight._changed
+                while index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    if follower and chunk.get("type") == "meta":
+                        chunk = {**chunk, "coalesced": True}
+                    yield chunk
+                if flight.done:
+                    break
+                if cancel_token is not None and cancel_token.cancelled and not detached:
+                    detached = True
+                    flight.subscribers -= 1
+                    if flight.subscribers > 0:
+                        # Others still need the answer; this subscriber just stops listening
+                        return
+                    # Last listener: stop the generation and drain to its "cancelled" final chunk
+                    flight.cancel_token.cancel(cancel_token.reason)
+                if cancelled is None or detached:
+                    await changed.wait()
+                    continue
+                waiter = asyncio.ensure_future(changed.wait())
+                try:
+                    await asyncio.wait({waiter, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiter.cancel()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            if cancelled is not None:
+                cancelled.cancel()
+            if not detached:
+                flight.subscribers -= 1
+                if flight.subscribers <= 0 and not flight.done:
+                    flight.cancel_token.cancel("abandoned")
@@ -1,14 +1,36 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
 import os
+import json
+import logging
 from dotenv import load_dotenv
 
 # Load .env file if it exists
 load_dotenv()
 
+def _json_env(name: str, default: dict) -> dict:
+    """JSON object from an env var; a malformed value is logged and ignored instead of failing every import."""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        logging.getLogger(__name__).warning(f"Ignoring malformed {name}: {e}")
+        return default
+    if not isinstance(value, dict):
+        logging.getLogger(__name__).warning(f"Ignoring {name}: expected a JSON object, got {type(value).__name__}")
+        return default
+    return value
+
 # System Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 PLAYBOOKS_PATH = os.path.join(BASE_DIR, "playbooks.json")
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+HW_PROBE_CACHE_PATH = os.path.join(CACHE_DIR, "hw_probe.json")
+# Per-machine llama runtime profile written by `python calibrate.py`; picked up by LLMManager._load_model
+LLM_TUNING_PROFILE_PATH = os.getenv("LLM_TUNING_PROFILE_PATH", os.path.join(CACHE_DIR, "llm_tuning.json"))
+LLM_TUNING_ENABLED = os.getenv("LLM_TUNING_ENABLED", "true").lower() == "true"
 
 # LLM Configuration
 MODEL_SEC_PATH = os.getenv("MODEL_SEC_PATH", os.path.join(MODELS_DIR, "foundation-sec-8b-q4_k_m.gguf"))
@@ -19,10 +41,182 @@ MODEL_LLAMA3_PATH = os.getenv("MODEL_LLAMA3_PATH", os.path.join(MODELS_DIR, "lla
 N_GPU_LAYERS_LLAMA3 = int(os.getenv("N_GPU_LAYERS_LLAMA3", "-1"))
 N_GPU_LAYERS_SEC = int(os.getenv("N_GPU_LAYERS_SEC", "-1"))
 
+# Memory profile (see core/memory_profiles.py): "compact" (2048 ctx, f16 KV cache), "balanced"
+# (4096 ctx, q8_0 KV cache + flash attention), "long-context" (8192 ctx for the security model),
+# or "auto" to pick one from the machine's total RAM.
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "auto").lower()
+
 # Context Size (KV Cache) - Higher values use more RAM
-# 2048 is recommended to keep RAM usage under 12GB for two 8B models
-N_CTX_LLAMA3 = int(os.getenv("N_CTX_LLAMA3", "2048"))
-N_CTX_SEC = int(os.getenv("N_CTX_SEC", "2048"))
+# 0 = the memory profile's context size; any other value overrides it for that model
+N_CTX_LLAMA3 = int(os.getenv("N_CTX_LLAMA3", "0"))
+N_CTX_SEC = int(os.getenv("N_CTX_SEC", "0"))
+N_CTX_ROUTER = int(os.getenv("N_CTX_ROUTER", "512"))
+
+# Weight loading: with mmap the GGUF pages live in the OS page cache, so several worker processes
+# (python workers.py) share one copy of the weights and each only adds its own KV cache.
+# mlock pins those shared pages in RAM (still one copy) so they are never paged out; only
+# LLM_USE_MMAP=false gives each worker a private copy.
+LLM_USE_MMAP = os.getenv("LLM_USE_MMAP", "true").lower() == "true"
+# Unset = the memory profile decides (none enables it); "true" pins the weights, "false" overrides a custom profile
+LLM_USE_MLOCK = None if os.getenv("LLM_USE_MLOCK") is None else os.getenv("LLM_USE_MLOCK").lower() == "true"
+LLM_THREADS = int(os.getenv("LLM_THREADS", "0"))  # 0 = calibrated value, else half the cores
+
+# Intent router model (optional). When neither a path nor a remote endpoint is set,
+# intent classification falls back to the general model.
+MODEL_ROUTER_PATH = os.getenv("MODEL_ROUTER_PATH", "")
+
+# Inference Backends per role: "llama_cpp" (in-process) or "openai" (OpenAI-compatible server, e.g. llama-server)
+LLM_BACKEND_GENERAL = os.getenv("LLM_BACKEND_GENERAL", "llama_cpp")
+LLM_BACKEND_SEC = os.getenv("LLM_BACKEND_SEC", "llama_cpp")
+LLM_BACKEND_ROUTER = os.getenv("LLM_BACKEND_ROUTER", "llama_cpp")
+LLM_ENDPOINT_GENERAL = os.getenv("LLM_ENDPOINT_GENERAL", "http://localhost:8080/v1")
+LLM_ENDPOINT_SEC = os.getenv("LLM_ENDPOINT_SEC", "http://localhost:8081/v1")
+LLM_ENDPOINT_ROUTER = os.getenv("LLM_ENDPOINT_ROUTER", "")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+
+# Remote backend HTTP client (pooled connections, timeouts in seconds)
+REMOTE_LLM_TIMEOUT = float(os.getenv("REMOTE_LLM_TIMEOUT", "120"))
+REMOTE_LLM_CONNECT_TIMEOUT = float(os.getenv("REMOTE_LLM_CONNECT_TIMEOUT", "5"))
+REMOTE_LLM_MAX_RETRIES = int(os.getenv("REMOTE_LLM_MAX_RETRIES", "2"))
+REMOTE_LLM_MAX_CONNECTIONS = int(os.getenv("REMOTE_LLM_MAX_CONNECTIONS", "16"))
+
+# Prompt-lookup speculative decoding (n-gram drafts copied from the prompt, no draft model needed).
+# Pays off when answers quote the prompt, e.g. Foundation-Sec citing playbook context and pasted logs.
+SPEC_DECODING_SEC = os.getenv("SPEC_DECODING_SEC", "false").lower() == "true"
+SPEC_DRAFT_TOKENS_SEC = int(os.getenv("SPEC_DRAFT_TOKENS_SEC", "10"))
+SPEC_NGRAM_SIZE_SEC = int(os.getenv("SPEC_NGRAM_SIZE_SEC", "2"))
+SPEC_DECODING_LLAMA3 = os.getenv("SPEC_DECODING_LLAMA3", "false").lower() == "true"
+SPEC_DRAFT_TOKENS_LLAMA3 = int(os.getenv("SPEC_DRAFT_TOKENS_LLAMA3", "10"))
+SPEC_NGRAM_SIZE_LLAMA3 = int(os.getenv("SPEC_NGRAM_SIZE_LLAMA3", "2"))
+
+MODEL_ROLES = {
+    "general": {
+        "path": MODEL_LLAMA3_PATH, "backend": LLM_BACKEND_GENERAL, "endpoint": LLM_ENDPOINT_GENERAL,
+        "n_gpu_layers": N_GPU_LAYERS_LLAMA3, "n_ctx": N_CTX_LLAMA3,
+        "speculative": {"enabled": SPEC_DECODING_LLAMA3, "draft_tokens": SPEC_DRAFT_TOKENS_LLAMA3, "ngram_size": SPEC_NGRAM_SIZE_LLAMA3},
+    },
+    "security": {
+        "path": MODEL_SEC_PATH, "backend": LLM_BACKEND_SEC, "endpoint": LLM_ENDPOINT_SEC,
+        "n_gpu_layers": N_GPU_LAYERS_SEC, "n_ctx": N_CTX_SEC,
+        "speculative": {"enabled": SPEC_DECODING_SEC, "draft_tokens": SPEC_DRAFT_TOKENS_SEC, "ngram_size": SPEC_NGRAM_SIZE_SEC},
+    },
+    "router": {
+        "path": MODEL_ROUTER_PATH, "backend": LLM_BACKEND_ROUTER, "endpoint": LLM_ENDPOINT_ROUTER,
+        "n_gpu_layers": N_GPU_LAYERS_LLAMA3, "n_ctx": N_CTX_ROUTER,
+        "speculative": {"enabled": False, "draft_tokens": 0, "ngram_size": 0},
+    },
+}
+
+# Log Compaction (Drain-style templating of pasted logs before retrieval and prompting)
+LOG_COMPACTION_ENABLED = os.getenv("LOG_COMPACTION_ENABLED", "true").lower() == "true"
+LOG_COMPACTION_MIN_LINES = int(os.getenv("LOG_COMPACTION_MIN_LINES", "8"))
+LOG_COMPACTION_SIM_THRESHOLD = float(os.getenv("LOG_COMPACTION_SIM_THRESHOLD", "0.5"))
+
+# Long Input (map-reduce) Mode: inputs exceeding the security model context are analyzed chunk by chunk
+MAP_REDUCE_ENABLED = os.getenv("MAP_REDUCE_ENABLED", "true").lower() == "true"
+MAP_REDUCE_MAP_MAX_TOKENS = int(os.getenv("MAP_REDUCE_MAP_MAX_TOKENS", "192"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_REDUCE_PROMPT_OVERHEAD = int(os.getenv("MAP_REDUCE_PROMPT_OVERHEAD", "256"))
+
+# Logging: "console" (dev, colored) or "json" (production). Async mode writes from a background thread.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "console").lower()
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Extra sampling rules as JSON, e.g. {"Intent classified": {"limit": 1, "per": 5.0, "sample": 0.5}}
+LOG_SAMPLE_RULES = _json_env("LOG_SAMPLE_RULES", {})
+
+# Telemetry (Langfuse + Arize Phoenix). Exported from background threads in bounded batches.
+LANGFUSE_HOST = os.getenv("LANGFUSE_HOST", "http://localhost:3001")
+LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY", "pk-lf-1234567890")
+LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY", "sk-lf-1234567890")
+PHOENIX_OTLP_ENDPOINT = os.getenv("PHOENIX_OTLP_ENDPOINT", "http://localhost:6006/v1/traces")
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+# Head sampling: global ratio, optionally scaled per model, e.g. {"Llama3-Taiwan": 0.2}
+TELEMETRY_SAMPLE_RATIO = float(os.getenv("TELEMETRY_SAMPLE_RATIO", "1.0"))
+TELEMETRY_MODEL_SAMPLE_RATIOS = _json_env("TELEMETRY_MODEL_SAMPLE_RATIOS", {})
+# Export tuning: the Langfuse SDK flushes every TELEMETRY_BATCH_SIZE observations or TELEMETRY_FLUSH_INTERVAL
+# seconds; Phoenix's span processor also bounds its queue at TELEMETRY_QUEUE_SIZE
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "2048"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "64"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "2.0"))
+TELEMETRY_EXPORT_TIMEOUT = float(os.getenv("TELEMETRY_EXPORT_TIMEOUT", "3.0"))
+
+# Headless analysis API (/api/analyze): in-memory session history limits
+API_MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "1000"))
+API_SESSION_TTL = float(os.getenv("API_SESSION_TTL", "3600"))
+API_SESSION_MAX_TURNS = int(os.getenv("API_SESSION_MAX_TURNS", "10"))
+
+# Deep health check: dependency probes run concurrently with a short per-probe timeout
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "0.5"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "1.0"))
+
+# Circuit breakers (core/circuit_breaker.py): after `failures` consecutive errors a dependency is
+# short-circuited for about `recovery_s` seconds (+/- BREAKER_JITTER), then one probe call decides
+# whether it closes again. Open breakers cost a lock check instead of a network timeout.
+BREAKER_JITTER = float(os.getenv("BREAKER_JITTER", "0.2"))
+CIRCUIT_BREAKERS = {
+    "qdrant": {"failures": int(os.getenv("BREAKER_QDRANT_FAILURES", "3")),
+               "recovery_s": float(os.getenv("BREAKER_QDRANT_RECOVERY_S", "10"))},
+    "influxdb": {"failures": int(os.getenv("BREAKER_INFLUXDB_FAILURES", "3")),
+                 "recovery_s": float(os.getenv("BREAKER_INFLUXDB_RECOVERY_S", "30"))},
+}
+PHOENIX_URL = os.getenv("PHOENIX_URL", PHOENIX_OTLP_ENDPOINT.split("/v1/")[0])
+
+# Inference governor: rolling hardware stats scale admission concurrency, max_tokens caps and
+# optional work (translation) under memory, power or thermal pressure
+GOVERNOR_ENABLED = os.getenv("GOVERNOR_ENABLED", "true").lower() == "true"
+GOVERNOR_WINDOW = int(os.getenv("GOVERNOR_WINDOW", "15"))  # hardware samples (2s apart)
+GOVERNOR_MAX_CONCURRENCY = int(os.getenv("GOVERNOR_MAX_CONCURRENCY", "4"))
+GOVERNOR_RAM_PCT_HIGH = float(os.getenv("GOVERNOR_RAM_PCT_HIGH", "88"))
+GOVERNOR_RAM_PCT_CRITICAL = float(os.getenv("GOVERNOR_RAM_PCT_CRITICAL", "95"))
+# Sustained package power that counts as pressure; 0 disables (the right value depends on the chip)
+GOVERNOR_POWER_W_HIGH = float(os.getenv("GOVERNOR_POWER_W_HIGH", "0"))
+GOVERNOR_HYSTERESIS = float(os.getenv("GOVERNOR_HYSTERESIS", "0.05"))
+
+# Multi-node router: ROUTER_NODES is a comma-separated list of "name=http://host:port" (or bare URLs)
+ROUTER_NODES = os.getenv("ROUTER_NODES", "")
+ROUTER_PORT = int(os.getenv("ROUTER_PORT", "9000"))
+ROUTER_STALE_AFTER = float(os.getenv("ROUTER_STALE_AFTER", "5.0"))  # seconds without a status update
+ROUTER_MAX_SESSIONS = int(os.getenv("ROUTER_MAX_SESSIONS", "10000"))
+ROUTER_REQUEST_TIMEOUT = float(os.getenv("ROUTER_REQUEST_TIMEOUT", "300"))
+NODE_STATUS_INTERVAL = float(os.getenv("NODE_STATUS_INTERVAL", "1.0"))
+
+# Overlapped pre-generation: retrieval starts alongside intent classification and the security
+# model's system prompt is prefilled as soon as the keyword path decides "security"
+PIPELINE_OVERLAP_ENABLED = os.getenv("PIPELINE_OVERLAP_ENABLED", "true").lower() == "true"
+
+# Online loop detection: stop a generation once its tail clearly repeats, and trim the copies
+LOOP_DETECTION_ENABLED = os.getenv("LOOP_DETECTION_ENABLED", "true").lower() == "true"
+LOOP_MIN_SPAN_TOKENS = int(os.getenv("LOOP_MIN_SPAN_TOKENS", "48"))  # repeated tail length before stopping
+LOOP_MAX_PERIOD = int(os.getenv("LOOP_MAX_PERIOD", "80"))
+LOOP_NGRAM_SIZE = int(os.getenv("LOOP_NGRAM_SIZE", "4"))
+LOOP_NGRAM_WINDOW = int(os.getenv("LOOP_NGRAM_WINDOW", "128"))
+LOOP_NGRAM_THRESHOLD = float(os.getenv("LOOP_NGRAM_THRESHOLD", "0.6"))
+
+# Multi-worker mode: workers.py starts WORKERS app processes on WORKER_BASE_PORT.. and a front router
+WORKERS = int(os.getenv("WORKERS", "2"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+WORKER_ID = os.getenv("WORKER_ID", "")
+
+# Precomputed playbook answers (python precompute_answers.py): short security questions that match a
+# playbook with at least this retrieval score are answered from the stored answer and translations
+PLAYBOOK_FAST_PATH_ENABLED = os.getenv("PLAYBOOK_FAST_PATH_ENABLED", "true").lower() == "true"
+PLAYBOOK_FAST_PATH_MIN_SCORE = float(os.getenv("PLAYBOOK_FAST_PATH_MIN_SCORE", "0.85"))
+PLAYBOOK_FAST_PATH_MAX_CHARS = int(os.getenv("PLAYBOOK_FAST_PATH_MAX_CHARS", "200"))
+
+# Structured security analyses: Foundation-Sec output is constrained by a JSON-schema grammar
+# (summary, root_causes[], mitigations[], severity). The chat UI renders it as markdown and
+# /api/analyze also returns the object as "analysis".
+STRUCTURED_OUTPUT_ENABLED = os.getenv("STRUCTURED_OUTPUT_ENABLED", "false").lower() == "true"
+STRUCTURED_OUTPUT_MAX_TOKENS = int(os.getenv("STRUCTURED_OUTPUT_MAX_TOKENS", "400"))
+STRUCTURED_OUTPUT_MAX_ITEMS = int(os.getenv("STRUCTURED_OUTPUT_MAX_ITEMS", "3"))
+
+# Request coalescing: identical concurrent queries share one in-flight generation
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+
+# Translation: when a security answer is mostly in the user's language already, only this many
+# foreign-language runs are translated in place; beyond that the whole answer is translated
+MAX_PARTIAL_TRANSLATION_RUNS = int(os.getenv("MAX_PARTIAL_TRANSLATION_RUNS", "3"))
 
 # Database Configuration
 INFLUXDB_URL = os.getenv("INFLUXDB_URL", "http://localhost:8181")
@@ -32,6 +226,15 @@ INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "metrics")
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_COLLECTION = "security_playbooks"
+# Query embedding: concurrent requests within the window (or up to the batch size) share one ONNX call
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "4"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+# Playbook ingestion: streamed in fixed-size batches; INGEST_WORKERS > 0 embeds across a process pool
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+INGEST_UPSERT_CONCURRENCY = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "2"))
+INGEST_MAX_PENDING_BATCHES = int(os.getenv("INGEST_MAX_PENDING_BATCHES", "2"))
 
 # System Messages
 SEC_SYSTEM_MESSAGE = (
@@ -46,6 +249,16 @@ SEC_SYSTEM_MESSAGE = (
     "   - **Mitigation**: Top 2-3 critical action items (bullets)."
 )
 
+# Structured mode (STRUCTURED_OUTPUT_ENABLED): the layout is enforced by a JSON grammar instead of prose rules
+SEC_STRUCTURED_SYSTEM_MESSAGE = (
+    "You are Foundation-Sec, a world-class cybersecurity expert. "
+    "Provide CONCISE technical analysis and advice in English, as a JSON object:\n"
+    "- summary: 1-2 sentence overview.\n"
+    "- root_causes: top 2-3 technical root causes, one short sentence each.\n"
+    "- mitigations: top 2-3 critical action items, one short sentence each.\n"
+    "- severity: critical, high, medium, low or info."
+)
+
 GENERAL_SYSTEM_MESSAGE = (
     "You are a helpful AI assistant. Answer the user's questions politely and naturally in the requested language."
 )
@@ -55,6 +268,18 @@ TRANSLATION_SYSTEM_MESSAGE = (
     "Output ONLY the translation without any preamble."
 )
 
+MAP_CHUNK_SYSTEM_MESSAGE = (
+    "You are Foundation-Sec, a cybersecurity log analyst. You see ONE segment of a larger input. "
+    "List only concrete security-relevant findings as short bullets (indicators, affected hosts/paths, "
+    "attack patterns, counts, time ranges). If nothing is relevant, reply 'No findings.'"
+)
+
+REDUCE_INSTRUCTION = (
+    "The input was too large to analyze at once. Below are partial findings from {segments} segments, in order.\n\n"
+    "{findings}\n\n"
+    "Merge these partial findings into one analysis of the complete input."
+)
+
 INTENT_ROUTER_MESSAGE = (
     "You are a specialized technical router. Your task is to determine if the user's input is a technical request "
     "related to security, IT infrastructure, programming, or system administration.\\n\\n"
@@ -1,21 +1,153 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
 import os
-import json
-import asyncio
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+import typing
 from qdrant_client import QdrantClient
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
-import pandas as pd
 import requests
-from core.config import QDRANT_COLLECTION
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from core.config import QDRANT_COLLECTION, EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH, EMBED_CACHE_SIZE
 from core.logger import logger
 
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+def fastembed_query_fn(model_name: str) -> typing.Callable[[typing.List[str]], typing.List[typing.List[float]]]:
+    """Batch query-embedding function backed by one lazily created fastembed (ONNX) model."""
+    model = None
+    def embed(texts: typing.List[str]) -> typing.List[typing.List[float]]:
+        nonlocal model
+        if model is None:
+            from fastembed import TextEmbedding
+            model = TextEmbedding(model_name=model_name)
+        return [v.tolist() for v in model.query_embed(texts)]
+    return embed
+
+class QueryEmbeddingService:
+    """Shared query embedder that micro-batches concurrent requests into single ONNX calls.
+
+    Requests arriving within window_ms of the first one (or until max_batch are queued) are
+    embedded together and each waiter gets its own vector. Recent queries are served from an
+    LRU cache. Returned vectors are shared with the cache and must not be modified.
+    """
+    def __init__(self, embed_fn: typing.Callable[[typing.List[str]], typing.List[typing.List[float]]],
+                 window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_MAX_BATCH,
+                 cache_size: int = EMBED_CACHE_SIZE):
+        self.embed_fn = embed_fn
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.cache_size = max(0, cache_size)
+        self.stats = {"requests": 0, "cache_hits": 0, "batches": 0, "embedded": 0}
+        self._queue: queue.Queue = queue.Queue()
+        self._cache: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _cache_get(self, text: str):
+        with self._lock:
+            self.stats["requests"] += 1
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.stats["cache_hits"] += 1
+            return vector
+
+    def _cache_put(self, text: str, vector: list):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, text: str) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        vector = self._cache_get(text)
+        if vector is not None:
+            future.set_result(vector)
+            return future
+        with self._lock:
+            # Also restarts a worker that died, instead of leaving every later request to time out
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._thread.start()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str, timeout: float = 30.0) -> typing.List[float]:
+        return self.submit(text).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                # One bad batch must not end the worker; its waiters get the error
+                logger.error(f"Query embedding batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch: list):
+        # Waiters that gave up (cancelled futures) are dropped; setting their result would raise
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Identical concurrent queries are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = self.embed_fn(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["embedded"] += len(texts)
+        by_text = dict(zip(texts, vectors))
+        for text, vector in by_text.items():
+            self._cache_put(text, vector)
+        for text, future in batch:
+            future.set_result(by_text[text])
+
 class VectorDBManager:
     """Manages Qdrant vector database connection and ingestion."""
-    def __init__(self, url: str = "http://localhost:6333"):
+    def __init__(self, url: str = "http://localhost:6333", embedder: QueryEmbeddingService = None,
+                 breaker: CircuitBreaker = None):
         self.url = url
         self.client = QdrantClient(url=self.url)
         self.collection_name = QDRANT_COLLECTION
+        # Every Qdrant call goes through the breaker: while Qdrant is down, queries fall back to no context at once
+        self.breaker = breaker or get_breaker("qdrant")
+        self._embedder = embedder
+        self._embedder_lock = threading.Lock()
+
+    @property
+    def embedder(self) -> QueryEmbeddingService:
+        """Query embedding service; retrieval is its only caller today, other embedding lookups should share it."""
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    self._embedder = QueryEmbeddingService(fastembed_query_fn(self.client.embedding_model_name))
+        return self._embedder
 
     def setup_model(self, model_name: str = "BAAI/bge-small-en-v1.5"):
         logger.info(f"Setting up embedding model: {model_name}")
@@ -23,65 +155,85 @@ class VectorDBManager:
 
     def is_collection_exists(self) -> bool:
         try:
-            collections = self.client.get_collections()
+            collections = self.breaker.call(self.client.get_collections)
             return any(c.name == self.collection_name for c in collections.collections)
         except Exception as e:
             logger.error(f"Error checking Qdrant collection: {e}")
             return False
 
-    def ingest_playbooks(self, playbooks_path: str):
-        """Loads and ingests playbooks from JSON file."""
+    def ingest_playbooks(self, playbooks_path: str, **options):
+        """Streams playbooks (JSON array or JSONL) into Qdrant in batches; see core.ingest.PlaybookIngestor."""
         if not os.path.exists(playbooks_path):
             logger.warning(f"Playbooks file not found: {playbooks_path}")
             return False
             
         try:
-            with open(playbooks_path, "r", encoding="utf-8") as f:
-                docs_data = json.load(f)
-                docs = [d["content"] for d in docs_data]
-                metadatas = [{"title": d["title"]} for d in docs_data]
-                ids = [d["id"] for d in docs_data]
-                
-                self.client.add(
-                    collection_name=self.collection_name,
-                    documents=docs,
-                    metadata=metadatas,
-                    ids=ids
-                )
-            logger.info(f"Successfully ingested {len(docs)} playbooks into {self.collection_name}")
+            from core.ingest import PlaybookIngestor
+            ingestor = PlaybookIngestor(self.client, self.collection_name, breaker=self.breaker, **options)
+            stats = ingestor.run(playbooks_path)
+            logger.info(f"Successfully ingested {stats.docs} playbooks into {self.collection_name}")
             return True
         except Exception as e:
             logger.error(f"Ingestion error: {e}")
             return False
 
-    def query_context(self, query_text: str, limit: int = 1) -> str:
-        """Queries the vector database for relevant context based on user input."""
+    def query_playbook(self, query_text: str) -> typing.Optional[dict]:
+        """Best matching playbook as {"id", "score", "title", "document", "answers", "analysis"}, or None."""
+        if not self.breaker.available():
+            # Qdrant is known to be down: skip the embedding and the timeout, answer without context
+            return None
         try:
-            search_result = self.client.query(
+            # Same query embedding and vector as client.query, but batched with concurrent sessions
+            query_vector = self.embedder.embed(query_text)
+            search_result = self.breaker.call(
+                self.client.query_points,
                 collection_name=self.collection_name,
-                query_text=query_text,
-                limit=limit
-            )
+                query=query_vector,
+                using=self.client.get_vector_field_name(),
+                limit=1,
+                with_payload=True
+            ).points
             if search_result:
                 best_match = search_result[0]
-                logger.info("Found relevant context in VectorDB.")
-                return f"[Internal System Context]\n{best_match.document}\n\n"
+                payload = best_match.payload or {}
+                return {"id": best_match.id, "score": best_match.score, "title": payload.get("title", ""),
+                        "document": payload.get("document", ""), "answers": payload.get("answers") or {},
+                        "analysis": payload.get("analysis")}
+        except CircuitOpenError:
+            pass
         except Exception as e:
             logger.error(f"[RAG Error] {e}")
-        return ""
+        return None
+
+    @staticmethod
+    def format_context(hit: typing.Optional[dict]) -> str:
+        if not hit:
+            return ""
+        logger.info("Found relevant context in VectorDB.")
+        return f"[Internal System Context]\n{hit['document']}\n\n"
+
+    def query_context(self, query_text: str) -> str:
+        """Queries the vector database for relevant context based on user input."""
+        return self.format_context(self.query_playbook(query_text))
 
 class MetricsDBManager:
     """Manages InfluxDB metrics connection and ingestion."""
-    def __init__(self, url: str, token: str, org: str, bucket: str):
+    def __init__(self, url: str, token: str, org: str, bucket: str, breaker: CircuitBreaker = None):
         self.url = url
         self.token = token
         self.org = org
         self.bucket = bucket
+        # Writes and history queries skip a dead InfluxDB instead of each waiting for its timeout
+        self.breaker = breaker or get_breaker("influxdb")
+        # influxdb-client and pandas are only needed once monitoring starts; keep them off the import path
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
         self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
         self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
 
     def write_hardware_stats(self, stats: dict):
         """Writes hardware statistics point to InfluxDB."""
+        from influxdb_client import Point
         try:
             p = Point("hardware_monitor") \
                 .tag("host", "mac_server") \
@@ -94,20 +246,22 @@ class MetricsDBManager:
                 .field("cpu_power_w", float(stats.get("cpu_power_w", 0))) \
                 .field("gpu_power_w", float(stats.get("gpu_power_w", 0))) \
                 .field("total_power_w", float(stats.get("total_power_w", 0)))
-            self.write_api.write(bucket=self.bucket, org=self.org, record=p)
+            self.breaker.call(self.write_api.write, bucket=self.bucket, org=self.org, record=p)
+        except CircuitOpenError:
+            pass
         except Exception as e:
             logger.error(f"InfluxDB Write Error: {e}")
 
-    def query_hardware_history_df(self) -> pd.DataFrame:
+    def query_hardware_history_df(self) -> "pd.DataFrame":
         """Queries the last 15 minutes of hardware data."""
+        import pandas as pd
         headers = {"Authorization": f"Token {self.token}"}
         params = {
             "db": self.bucket,
             "q": "SELECT * FROM hardware_monitor WHERE time >= now() - 15m"
         }
         try:
-            res = requests.get(f"{self.url}/query", headers=headers, params=params, timeout=5)
-            res.raise_for_status()
+            res = self.breaker.call(self._get_query, headers, params)
             
             res_json = res.json()
             results = res_json.get("results", [])
@@ -123,6 +277,14 @@ class MetricsDBManager:
                 df['_time'] = pd.to_datetime(df['time'])
                 
             return df
+        except CircuitOpenError:
+            return pd.DataFrame()
         except Exception as e:
             logger.error(f"InfluxDB Query Error: {e}")
             return pd.DataFrame()
+
+    def _get_query(self, headers: dict, params: dict) -> "requests.Response":
+        # HTTP error statuses count as failures for the breaker, not just connection errors
+        res = requests.get(f"{self.url}/query", headers=headers, params=params, timeout=5)
+        res.raise_for_status()
+        return res
@@ -0,0 +1,179 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import collections
+import contextlib
+import statistics
+import time
+import typing
+from core.config import (
+    GOVERNOR_ENABLED,
+    GOVERNOR_WINDOW,
+    GOVERNOR_MAX_CONCURRENCY,
+    GOVERNOR_RAM_PCT_HIGH,
+    GOVERNOR_RAM_PCT_CRITICAL,
+    GOVERNOR_POWER_W_HIGH,
+    GOVERNOR_HYSTERESIS
+)
+from core.logger import logger
+
+NORMAL, CONSTRAINED, CRITICAL = "normal", "constrained", "critical"
+_LEVEL_ORDER = {NORMAL: 0, CONSTRAINED: 1, CRITICAL: 2}
+_THERMAL_SEVERITY = {"nominal": 0, "fair": 1, "serious": 2, "critical": 3}
+
+class AdmissionGate:
+    """Async counting gate whose limit can change at runtime (shrinking never interrupts running work)."""
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: typing.List[asyncio.Future] = []
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def set_limit(self, limit: int):
+        self.limit = max(1, limit)
+        self._wake()
+
+    def _wake(self):
+        # Waiters re-check the limit themselves, so waking all of them is always safe
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+class InferenceGovernor:
+    """Turns rolling hardware statistics into admission, max_tokens and optional-work decisions.
+
+    Levels: normal (full concurrency), constrained (half concurrency, 75% max_tokens, translation
+    on the small router model when one is loaded) and critical (one request at a time, 50%
+    max_tokens, translation skipped). Leaving a level requires the metrics to drop
+    GOVERNOR_HYSTERESIS below its thresholds, so the governor does not flap.
+    """
+    SETTINGS = {
+        NORMAL: {"concurrency_factor": 1.0, "max_tokens_factor": 1.0, "translation": "general"},
+        CONSTRAINED: {"concurrency_factor": 0.5, "max_tokens_factor": 0.75, "translation": "router"},
+        CRITICAL: {"concurrency_factor": 0.0, "max_tokens_factor": 0.5, "translation": "skip"},
+    }
+
+    def __init__(self, enabled: bool = GOVERNOR_ENABLED, window: int = GOVERNOR_WINDOW,
+                 max_concurrency: int = GOVERNOR_MAX_CONCURRENCY, ram_high: float = GOVERNOR_RAM_PCT_HIGH,
+                 ram_critical: float = GOVERNOR_RAM_PCT_CRITICAL, power_high: float = GOVERNOR_POWER_W_HIGH,
+                 hysteresis: float = GOVERNOR_HYSTERESIS):
+        self.enabled = enabled
+        self.max_concurrency = max(1, max_concurrency)
+        self.ram_high = ram_high
+        self.ram_critical = ram_critical
+        self.power_high = power_high
+        self.hysteresis = hysteresis
+        self.level = NORMAL
+        self.gate = AdmissionGate(self.max_concurrency)
+        self.decisions: collections.deque = collections.deque(maxlen=20)
+        self._ram: collections.deque = collections.deque(maxlen=max(1, window))
+        self._power: collections.deque = collections.deque(maxlen=max(1, window))
+        self._thermal: collections.deque = collections.deque(maxlen=max(1, window))
+
+    # --- Observation -------------------------------------------------------
+    def observe(self, stats: dict) -> typing.Optional[dict]:
+        """Feeds one hardware sample; returns the decision dict when the level changed."""
+        if not self.enabled:
+            return None
+        self._ram.append(float(stats.get("ram_pct", 0.0)))
+        power = float(stats.get("total_power_w", -1.0))
+        if power >= 0:
+            self._power.append(power)
+        self._thermal.append(_THERMAL_SEVERITY.get(str(stats.get("thermal_pressure", "")).lower(), 0))
+        level, reasons = self._evaluate()
+        if level == self.level:
+            return None
+        return self._apply(level, reasons)
+
+    def rolling(self) -> dict:
+        return {
+            "ram_pct": round(statistics.fmean(self._ram), 1) if self._ram else None,
+            "power_w": round(statistics.fmean(self._power), 1) if self._power else None,
+            # Thermal pressure is reported as the worst state seen in the window
+            "thermal": max(self._thermal) if self._thermal else 0,
+        }
+
+    def _evaluate(self) -> typing.Tuple[str, typing.List[str]]:
+        roll = self.rolling()
+        current = _LEVEL_ORDER[self.level]
+
+        def over(value, threshold, level):
+            # Thresholds of the current level (and below) are relaxed by the hysteresis margin before exiting
+            if value is None or threshold <= 0:
+                return False
+            relaxed = threshold * (1 - self.hysteresis) if current >= _LEVEL_ORDER[level] else threshold
+            return value >= relaxed
+
+        critical, constrained = [], []
+        if over(roll["ram_pct"], self.ram_critical, CRITICAL):
+            critical.append(f"ram {roll['ram_pct']}% >= {self.ram_critical}%")
+        if roll["thermal"] >= _THERMAL_SEVERITY["critical"]:
+            critical.append("thermal critical")
+        if critical:
+            return CRITICAL, critical
+        if over(roll["ram_pct"], self.ram_high, CONSTRAINED):
+            constrained.append(f"ram {roll['ram_pct']}% >= {self.ram_high}%")
+        if over(roll["power_w"], self.power_high, CONSTRAINED):
+            constrained.append(f"power {roll['power_w']}W >= {self.power_high}W")
+        if roll["thermal"] >= _THERMAL_SEVERITY["serious"]:
+            constrained.append("thermal serious")
+        if constrained:
+            return CONSTRAINED, constrained
+        return NORMAL, []
+
+    def _apply(self, level: str, reasons: typing.List[str]) -> dict:
+        previous, self.level = self.level, level
+        self.gate.set_limit(self.concurrency)
+        decision = {"at": time.time(), "from": previous, "to": level, "reasons": reasons,
+                    "concurrency": self.concurrency, **self.SETTINGS[level], "rolling": self.rolling()}
+        self.decisions.append(decision)
+        logger.info(f"Governor {previous} -> {level} ({', '.join(reasons) or 'pressure cleared'}): "
+                    f"concurrency {self.concurrency}, max_tokens x{self.SETTINGS[level]['max_tokens_factor']}, "
+                    f"translation {self.SETTINGS[level]['translation']}")
+        return decision
+
+    # --- Decisions ---------------------------------------------------------
+    @property
+    def concurrency(self) -> int:
+        return max(1, int(self.max_concurrency * self.SETTINGS[self.level]["concurrency_factor"]))
+
+    def cap_max_tokens(self, max_tokens: int) -> int:
+        return max(64, int(max_tokens * self.SETTINGS[self.level]["max_tokens_factor"]))
+
+    def translation_backend(self, llm_manager):
+        """Model for optional translation work at the current level, or None to skip it."""
+        route = self.SETTINGS[self.level]["translation"]
+        if route == "skip":
+            return None
+        if route == "router" and llm_manager.llm_router is not None:
+            return llm_manager.llm_router
+        return llm_manager.llm_general
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        await self.gate.acquire()
+        try:
+            yield
+        finally:
+            self.gate.release()
+
+    def state(self) -> dict:
+        return {"level": self.level, "concurrency": self.concurrency, "active": self.gate.active,
+                "waiting": self.gate.waiting, "rolling": self.rolling(), **self.SETTINGS[self.level],
+                "last_decision": self.decisions[-1] if self.decisions else None}
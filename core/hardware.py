@@ -2,24 +2,49 @@
 import psutil
 import subprocess
 import re
+import os
+import json
 import platform
 import plistlib
+from core.config import HW_PROBE_CACHE_PATH
 from core.logger import logger
 
 class HardwareMonitor:
-    def __init__(self):
+    def __init__(self, probe_cache_path: str = HW_PROBE_CACHE_PATH):
         self.cpu_count = psutil.cpu_count()
         # Heuristic for Apple Silicon core distribution
         self.e_cores = 4 if self.cpu_count >= 8 else 0
         self.p_cores = self.cpu_count - self.e_cores
         self.ram_total = round(psutil.virtual_memory().total / (1024**3), 2)
-        self.gpu_cores = self._get_macos_gpu_info()
-        self.chip_label = self._get_chip_label()
+        self.gpu_cores, self.chip_label = self._probe_static_info(probe_cache_path)
         
         # Initialize psutil counters
         psutil.cpu_percent(percpu=True)
         logger.info(f"Monitor Initialized: {self.chip_label} ({self.e_cores}E+{self.p_cores}P cores)")
 
+    def _probe_static_info(self, cache_path: str) -> tuple:
+        """GPU core count and chip label never change on a machine, so system_profiler results are cached on disk."""
+        cache_key = f"{platform.node()}|{platform.machine()}|{self.cpu_count}"
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == cache_key:
+                return cached["gpu_cores"], cached["chip_label"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        gpu_cores = self._get_macos_gpu_info()
+        chip_label = self._get_chip_label()
+        # Only persist real probe results; fallbacks should be retried on the next start
+        if gpu_cores != "N/A" or chip_label != "Apple M-Series":
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with open(cache_path, "w", encoding="utf-8") as f:
+                    json.dump({"key": cache_key, "gpu_cores": gpu_cores, "chip_label": chip_label}, f)
+            except OSError as e:
+                logger.debug(f"Hardware probe cache write failed: {e}")
+        return gpu_cores, chip_label
+
     @staticmethod
     def _get_macos_gpu_info() -> str:
         """Get GPU core count (used at startup only)."""
@@ -71,11 +96,14 @@ class HardwareMonitor:
         """Collect power metrics via powermetrics command."""
         try:
             pm_res = subprocess.check_output(
-                ['sudo', '-n', 'powermetrics', '-n', '1', '-i', '50', '--samplers', 'cpu_power,gpu_power', '-f', 'plist'],
+                ['sudo', '-n', 'powermetrics', '-n', '1', '-i', '50', '--samplers', 'cpu_power,gpu_power,thermal', '-f', 'plist'],
                 stderr=subprocess.DEVNULL, timeout=2
             )
             plist_data = plistlib.loads(pm_res)
             proc_data = plist_data.get('processor', {})
+            # Nominal / Fair / Serious / Critical (the OS throttles from "Serious" on)
+            if 'thermal_pressure' in plist_data:
+                stats["thermal_pressure"] = str(plist_data['thermal_pressure'])
             
             if 'cpu_energy' in proc_data:
                 stats["cpu_power_w"] = round(proc_data['cpu_energy'] / 1000.0, 2)
@@ -140,7 +168,7 @@ class HardwareMonitor:
             "ram_pct": 0.0, "ram_used_gb": 0.0, "ram_total_gb": self.ram_total,
             "e_cores": self.e_cores, "p_cores": self.p_cores,
             "cpu_power_w": -1.0, "gpu_power_w": -1.0, "total_power_w": -1.0,
-            "chip_label": self.chip_label
+            "thermal_pressure": "Unknown", "chip_label": self.chip_label
         }
         
         self._get_basic_stats(stats)
@@ -0,0 +1,98 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import json
+import time
+import typing
+from core.cancellation import CancellationToken
+from core.i18n import get_lang_name
+from core.langid import translation_plan
+
+async def analyze_events(service, user_input: str, chat_history: list, lang: str = "en", translate: bool = False,
+                         cancel_token: CancellationToken = None, fresh: bool = False) -> typing.AsyncGenerator[dict, None]:
+    """Runs one analysis turn for API clients: the generate_response chunks, then optional
+    translation chunks ("translation_token"/"translation_final"), then a closing "done" chunk.
+    fresh=True skips the precomputed playbook answer and always runs the model."""
+    target_lang_name = get_lang_name(lang)
+    start = time.time()
+    meta, text, precomputed = None, "", None
+
+    responses = service.generate_response(user_input, chat_history, target_lang=target_lang_name, cancel_token=cancel_token,
+                                          fresh=fresh)
+    try:
+        async for chunk in responses:
+            if chunk["type"] == "meta":
+                meta = chunk
+            elif chunk["type"] == "token":
+                text += chunk["content"]
+            elif chunk["type"] == "final" and (chunk.get("loop") or "structured" in chunk):
+                # The streamed tokens include the repeated tail (trimmed in the final text), or are a
+                # progressive rendering of structured output (final text renders the parsed object)
+                text = chunk["full_content"]
+            elif chunk["type"] == "final" and chunk.get("precomputed"):
+                precomputed = chunk["precomputed"]
+            yield chunk
+    finally:
+        await responses.aclose()
+
+    cancelled = cancel_token is not None and cancel_token.cancelled
+    # Same rule as the chat UI: security answers are written in English, general answers already follow `lang`
+    stored_translation = (precomputed or {}).get("translation")
+    if translate and stored_translation and not cancelled:
+        # Translated offline together with the playbook answer
+        yield {"type": "translation_token", "content": stored_translation["content"]}
+        yield {"type": "translation_final", "full_content": stored_translation["content"], "lang": lang,
+               "skipped": False, "tokens": {"total": 0}, "elapsed": 0.0, "precomputed": True}
+    elif translate and meta and meta["is_security"] and target_lang_name != "English" and not cancelled:
+        plan = translation_plan(text, lang)
+        translated, tokens, elapsed, skipped = "", 0, 0.0, not plan
+        for part, needs_translation in plan:
+            if not needs_translation:
+                translated += part
+                yield {"type": "translation_token", "content": part}
+                continue
+            translation = service.translate_response(part, target_lang_name, cancel_token=cancel_token)
+            try:
+                async for chunk in translation:
+                    if chunk["type"] == "token":
+                        translated += chunk["content"]
+                        yield {"type": "translation_token", "content": chunk["content"]}
+                    elif chunk["type"] == "final":
+                        tokens += chunk["tokens"]["total"]
+                        elapsed += chunk["elapsed"]
+                        # The governor may pass text through untranslated under hardware pressure
+                        skipped = chunk.get("skipped") or skipped
+            finally:
+                await translation.aclose()
+        yield {"type": "translation_final", "full_content": translated if plan else text, "lang": lang,
+               "skipped": skipped, "tokens": {"total": tokens}, "elapsed": elapsed}
+
+    yield {"type": "done", "history_input": (meta or {}).get("history_input", user_input), "content": text,
+           "elapsed_total": time.time() - start}
+
+async def analyze_result(events: typing.AsyncIterator[dict]) -> dict:
+    """Collapses analyze_events() into the single JSON object returned to non-streaming clients."""
+    result = {"author": None, "is_security": None, "content": "", "usage": None, "timing": {},
+              "speculative": None, "cancelled": None, "loop": None, "precomputed": None, "compaction": None, "map_reduce": False, "translation": None,
+              # Structured mode only: {"summary", "root_causes", "mitigations", "severity"}; content is its markdown
+              "analysis": None}
+    async for chunk in events:
+        kind = chunk["type"]
+        if kind == "meta":
+            result.update(author=chunk["author"], is_security=chunk["is_security"], compaction=chunk.get("compaction"),
+                          map_reduce=chunk.get("map_reduce", False), coalesced=chunk.get("coalesced", False))
+            if chunk.get("stages"):
+                result["timing"]["stages"] = chunk["stages"]
+        elif kind == "final":
+            result.update(content=chunk["full_content"], usage=chunk["tokens"], speculative=chunk.get("speculative"),
+                          cancelled=chunk.get("cancelled"), loop=chunk.get("loop"), precomputed=chunk.get("precomputed"),
+                          analysis=chunk.get("structured"))
+            result["timing"]["generation_s"] = round(chunk["elapsed"], 3)
+        elif kind == "translation_final":
+            result["translation"] = {k: chunk[k] for k in ("full_content", "lang", "skipped", "tokens")}
+            result["timing"]["translation_s"] = round(chunk["elapsed"], 3)
+        elif kind == "done":
+            result["timing"]["total_s"] = round(chunk["elapsed_total"], 3)
+            result["history_input"] = chunk["history_input"]
+    return result
+
+def sse_event(chunk: dict) -> str:
+    return f"event: {chunk['type']}\ndata: {json.dumps(chunk, ensure_ascii=False)}\n\n"
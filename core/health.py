@@ -0,0 +1,114 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import time
+import typing
+import httpx
+from core.config import (
+    QDRANT_URL,
+    INFLUXDB_URL,
+    LANGFUSE_HOST,
+    PHOENIX_URL,
+    HEALTH_PROBE_TIMEOUT,
+    HEALTH_CACHE_TTL
+)
+
+# (name, url, required): a required dependency being down makes the app not ready;
+# optional ones (metrics, telemetry) only degrade it
+DEPENDENCIES = [
+    ("qdrant", f"{QDRANT_URL.rstrip('/')}/readyz", True),
+    ("influxdb", f"{INFLUXDB_URL.rstrip('/')}/ping", False),
+    ("langfuse", f"{LANGFUSE_HOST.rstrip('/')}/api/public/health", False),
+    ("phoenix", f"{PHOENIX_URL.rstrip('/')}/healthz", False),
+]
+
+async def probe(client: httpx.AsyncClient, name: str, url: str) -> dict:
+    start = time.perf_counter()
+    result = {"name": name, "url": url, "ok": False, "status": None, "latency_ms": None, "error": None}
+    try:
+        resp = await client.get(url)
+        result["status"] = resp.status_code
+        result["ok"] = resp.status_code < 400
+    except Exception as e:
+        result["error"] = type(e).__name__
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+async def probe_dependencies(dependencies: typing.List[tuple] = None, timeout: float = HEALTH_PROBE_TIMEOUT) -> typing.Dict[str, dict]:
+    """Probes every dependency concurrently; total time is bounded by the slowest single probe."""
+    dependencies = DEPENDENCIES if dependencies is None else dependencies
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        results = await asyncio.gather(*(probe(client, name, url) for name, url, _ in dependencies))
+    for (_, _, required), result in zip(dependencies, results):
+        result["required"] = required
+    return {r["name"]: r for r in results}
+
+def _model_status(llm_manager) -> dict:
+    status = {}
+    for role, attr in (("general", "llm_general"), ("security", "llm_sec"), ("router", "llm_router")):
+        backend = getattr(llm_manager, attr, None) if llm_manager else None
+        entry = {"loaded": backend is not None}
+        if backend is not None:
+            entry["backend"] = backend.kind
+            if hasattr(backend, "waiting"):
+                entry["busy"] = backend.busy
+                entry["waiting"] = backend.waiting
+        status[role] = entry
+    return status
+
+def _queue_depths(services) -> dict:
+    from core.logger import log_queue_stats
+    queues = {"log": log_queue_stats()}
+    telemetry = services.peek("telemetry")
+    if telemetry is not None:
+        queues["telemetry"] = telemetry.stats()
+    vector_db = services.peek("vector_db")
+    if vector_db is not None and vector_db._embedder is not None:
+        queues["embedding"] = {"pending": vector_db._embedder.pending, **vector_db._embedder.stats}
+    assistant = services.peek("assistant_service")
+    if assistant is not None:
+        queues["coalescing"] = {"active": assistant.coalescer.active, **assistant.coalescer.stats}
+        queues["cancelled"] = dict(assistant.cancel_stats)
+        queues["loops"] = dict(assistant.loop_stats)
+        queues["precomputed"] = dict(assistant.precomputed_stats)
+    return queues
+
+async def deep_health(timeout: float = HEALTH_PROBE_TIMEOUT) -> dict:
+    """Readiness report: dependency probes with latency, model status, queue depths and hardware sample age.
+
+    Only reads state that already exists, so it never loads a model or opens a client as a side effect.
+    """
+    import core.services as services
+    from core.circuit_breaker import breaker_states
+    start = time.perf_counter()
+    dependencies = await probe_dependencies(timeout=timeout)
+    models = _model_status(services.peek("llm_manager"))
+    sample_at = services.last_hw_sample_at
+    governor = services.peek("governor")
+
+    models_ready = models["general"]["loaded"] and models["security"]["loaded"]
+    required_ok = all(d["ok"] for d in dependencies.values() if d["required"])
+    optional_ok = all(d["ok"] for d in dependencies.values() if not d["required"])
+    ready = models_ready and required_ok
+    return {
+        "status": "ok" if ready and optional_ok else ("degraded" if ready else "unavailable"),
+        "ready": ready,
+        "dependencies": dependencies,
+        "models": models,
+        "queues": _queue_depths(services),
+        "hardware": {"last_sample_age_s": round(time.time() - sample_at, 1) if sample_at else None},
+        "governor": governor.state() if governor is not None else None,
+        # In-process view of each dependency: an open breaker means calls are currently short-circuited
+        "breakers": breaker_states(),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+_cache = {"at": 0.0, "report": None}
+_cache_lock = asyncio.Lock()
+
+async def cached_deep_health() -> dict:
+    """deep_health() shared across callers for HEALTH_CACHE_TTL seconds, so frequent load balancer polls stay cheap."""
+    async with _cache_lock:
+        if _cache["report"] is None or time.monotonic() - _cache["at"] > HEALTH_CACHE_TTL:
+            _cache["report"] = await deep_health()
+            _cache["at"] = time.monotonic()
+        return _cache["report"]
@@ -0,0 +1,254 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import time
+import typing
+import uuid
+from core.config import (
+    INGEST_BATCH_SIZE,
+    INGEST_WORKERS,
+    INGEST_UPSERT_CONCURRENCY,
+    INGEST_MAX_PENDING_BATCHES
+)
+from core.logger import logger
+
+_READ_CHUNK = 1 << 16
+
+def _iter_json_array(f: typing.TextIO, read_size: int = _READ_CHUNK) -> typing.Iterator[dict]:
+    """Incrementally decodes the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace and separators between elements
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if not started and pos < len(buf):
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if started and pos < len(buf) and buf[pos] == "]":
+            return
+        if pos < len(buf):
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # A scalar cut at the buffer end (e.g. "12" of "123") decodes fine, so wait for more text
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if complete:
+                yield obj
+                pos = end
+                continue
+        if eof:
+            return
+        chunk = f.read(read_size)
+        eof = not chunk
+        # Drop consumed text so the buffer only ever holds roughly one element plus one read
+        buf = buf[pos:] + chunk
+        pos = 0
+
+def iter_records(path: str) -> typing.Iterator[dict]:
+    """Streams records from a JSONL file or a JSON array file (detected from the first non-blank character)."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            yield from _iter_json_array(_Prefixed(head, f))
+            return
+        for lineno, line in enumerate(itertools.chain([head + f.readline()], f), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed JSONL line {lineno} in {path}: {e}")
+
+class _Prefixed:
+    """File wrapper that returns a pushed-back prefix before the rest of the file."""
+    def __init__(self, prefix: str, f: typing.TextIO):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size: int) -> str:
+        if self.prefix:
+            out, self.prefix = self.prefix, ""
+            return out + self.f.read(max(0, size - len(out)))
+        return self.f.read(size)
+
+def to_point_id(raw) -> typing.Union[int, str]:
+    """Qdrant ids must be unsigned ints or UUIDs; other ids map to a stable UUID."""
+    if isinstance(raw, int) and raw >= 0:
+        return raw
+    text = str(raw)
+    if text.isdigit():
+        return int(text)
+    try:
+        return str(uuid.UUID(text))
+    except ValueError:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, text))
+
+def batched(items: typing.Iterable, size: int) -> typing.Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# --- Embedding workers (module-level so they can run in a process pool) ---
+_embedder = None
+
+def _init_embedder(model_name: str, threads: typing.Optional[int] = None):
+    global _embedder
+    from fastembed import TextEmbedding
+    _embedder = TextEmbedding(model_name=model_name, threads=threads)
+
+def _embed_batch(model_name: str, documents: typing.List[str]) -> typing.List[typing.List[float]]:
+    if _embedder is None:
+        _init_embedder(model_name)
+    # Same passage embedding as QdrantClient.add, so query() results are unchanged
+    return [v.tolist() for v in _embedder.passage_embed(documents, batch_size=len(documents))]
+
+class IngestStats:
+    def __init__(self):
+        self.docs = 0
+        self.skipped = 0
+        self.batches = 0
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @property
+    def docs_per_s(self) -> float:
+        return self.docs / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.docs} docs in {self.batches} batches, {self.skipped} skipped, "
+                f"{self.elapsed:.1f}s ({self.docs_per_s:.1f} docs/s)")
+
+class PlaybookIngestor:
+    """Streams a playbook corpus into Qdrant with bounded memory.
+
+    Records are read incrementally, embedded in fixed-size batches (in-process or across a
+    process pool) and upserted by a small thread pool while the next batches are embedding.
+    At most max_pending batches are embedding and max_pending are upserting at any time.
+    With a breaker, only the Qdrant calls go through it: unreadable files or embedding errors
+    are not Qdrant failures.
+    """
+    def __init__(self, client, collection_name: str, batch_size: int = INGEST_BATCH_SIZE,
+                 workers: int = INGEST_WORKERS, upsert_concurrency: int = INGEST_UPSERT_CONCURRENCY,
+                 max_pending: int = INGEST_MAX_PENDING_BATCHES, report_every: float = 5.0,
+                 embed_fn: typing.Callable[[typing.List[str]], typing.List[typing.List[float]]] = None,
+                 breaker=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = max(1, batch_size)
+        self.workers = max(0, workers)
+        self.upsert_concurrency = max(1, upsert_concurrency)
+        self.max_pending = max(1, max_pending)
+        self.report_every = report_every
+        self.embed_fn = embed_fn
+        self.model_name = client.embedding_model_name
+        self.breaker = breaker
+
+    def _qdrant(self, fn: typing.Callable, *args, **kwargs):
+        return self.breaker.call(fn, *args, **kwargs) if self.breaker else fn(*args, **kwargs)
+
+    def ensure_collection(self):
+        if not self._qdrant(self.client.collection_exists, self.collection_name):
+            self._qdrant(self.client.create_collection, self.collection_name,
+                         vectors_config=self.client.get_fastembed_vector_params())
+
+    def _records(self, path: str, stats: IngestStats) -> typing.Iterator[tuple]:
+        for record in iter_records(path):
+            try:
+                meta = {"title": record.get("title", "")}
+                if record.get("answers"):
+                    # Precomputed answer and translations (precompute_answers.py) travel with the playbook
+                    meta["answers"] = record["answers"]
+                if record.get("analysis"):
+                    meta["analysis"] = record["analysis"]
+                yield to_point_id(record["id"]), record["content"], meta
+            except (KeyError, TypeError):
+                stats.skipped += 1
+
+    def _upsert(self, ids: list, vectors: list, payloads: list):
+        from qdrant_client import models
+        vector_name = self.client.get_vector_field_name()
+        points = [models.PointStruct(id=i, vector={vector_name: v}, payload=p) for i, v, p in zip(ids, vectors, payloads)]
+        self._qdrant(self.client.upsert, collection_name=self.collection_name, points=points, wait=True)
+        return len(points)
+
+    def _embed_executor(self) -> concurrent.futures.Executor:
+        if self.workers == 0:
+            # In-process: a single thread keeps the loop below simple and overlaps embedding with upserts
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-embed")
+        # Split the CPUs between workers so ONNX runtimes do not oversubscribe the machine
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_embedder,
+                                                      initargs=(self.model_name, threads))
+
+    def run(self, path: str) -> IngestStats:
+        stats = IngestStats()
+        self.ensure_collection()
+        last_report = time.perf_counter()
+        embed = self.embed_fn or (lambda docs: _embed_batch(self.model_name, docs))
+        pending_embeds: collections.deque = collections.deque()
+        pending_upserts: collections.deque = collections.deque()
+        max_embeds = self.max_pending * max(1, self.workers)
+
+        with self._embed_executor() as embed_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.upsert_concurrency, thread_name_prefix="ingest-upsert") as upsert_pool:
+
+            def submit_embed(batch):
+                ids, docs, metas = zip(*batch)
+                payloads = [{"document": d, **m} for d, m in zip(docs, metas)]
+                if self.workers == 0:
+                    future = embed_pool.submit(embed, list(docs))
+                else:
+                    future = embed_pool.submit(_embed_batch, self.model_name, list(docs))
+                pending_embeds.append((future, list(ids), payloads))
+
+            def finish_embed():
+                future, ids, payloads = pending_embeds.popleft()
+                vectors = future.result()
+                if len(pending_upserts) >= self.max_pending:
+                    finish_upsert()
+                pending_upserts.append(upsert_pool.submit(self._upsert, ids, vectors, payloads))
+
+            def finish_upsert():
+                nonlocal last_report
+                stats.docs += pending_upserts.popleft().result()
+                stats.batches += 1
+                now = time.perf_counter()
+                if now - last_report >= self.report_every:
+                    last_report = now
+                    logger.info(f"Ingest progress: {stats.docs} docs, {stats.docs_per_s:.1f} docs/s")
+
+            for batch in batched(self._records(path, stats), self.batch_size):
+                if len(pending_embeds) >= max_embeds:
+                    finish_embed()
+                submit_embed(batch)
+            while pending_embeds:
+                finish_embed()
+            while pending_upserts:
+                finish_upsert()
+
+        logger.info(f"Ingested {path} into {self.collection_name}: {stats.summary()}")
+        return stats
@@ -0,0 +1,162 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import re
+import typing
+from core.config import MAX_PARTIAL_TRANSLATION_RUNS
+
+# Unicode script ranges for every language in core.i18n.LANG_NAMES
+_SCRIPT_RANGES = [
+    ("hangul", 0xAC00, 0xD7AF), ("hangul", 0x1100, 0x11FF), ("hangul", 0x3130, 0x318F),
+    ("hiragana", 0x3040, 0x309F), ("katakana", 0x30A0, 0x30FF), ("katakana", 0x31F0, 0x31FF),
+    ("han", 0x4E00, 0x9FFF), ("han", 0x3400, 0x4DBF), ("han", 0xF900, 0xFAFF),
+    ("thai", 0x0E00, 0x0E7F),
+    ("devanagari", 0x0900, 0x097F),
+    ("latin", 0x0041, 0x005A), ("latin", 0x0061, 0x007A), ("latin", 0x00C0, 0x024F), ("latin", 0x1E00, 0x1EFF),
+]
+
+# Characters that only (or overwhelmingly) occur in one Latin-script language
+_VI_CHARS = set("ăâđêôơưạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹĂÂĐÊÔƠƯ")
+_ES_CHARS = set("ñ¿¡Ñ")
+
+# Short character n-gram profiles (space-padded words and frequent trigrams) for Latin-script languages
+_LATIN_NGRAMS = {
+    "en": [" the ", " and ", " is ", " to ", " of ", "ing ", " for ", " that ", " with ", "tion", " this ", " are ", " be "],
+    "es": [" de ", " la ", " que ", " el ", " en ", " los ", " las ", " por ", " para ", "ción", " una ", " del ", " es "],
+    "vi": [" của ", " và ", " là ", " các ", " có ", " cho ", " không ", " được ", " này ", " một ", " những ", " để "],
+}
+
+# A Latin letter carries roughly a third of the information of a CJK/Hangul character,
+# so embedded English terms (SQL, SSH, CVE ids) do not outvote the surrounding text
+_SCRIPT_WEIGHTS = {"latin": 1 / 3}
+
+def _script(ch: str) -> typing.Optional[str]:
+    cp = ord(ch)
+    for name, lo, hi in _SCRIPT_RANGES:
+        if lo <= cp <= hi:
+            return name
+    return None
+
+def script_counts(text: str) -> typing.Dict[str, int]:
+    counts: typing.Dict[str, int] = {}
+    for ch in text:
+        name = _script(ch)
+        if name:
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+def score_languages(text: str) -> typing.Dict[str, float]:
+    """Scores each UI language code by script share, refined by character n-grams for Latin text."""
+    counts = {k: v * _SCRIPT_WEIGHTS.get(k, 1.0) for k, v in script_counts(text).items()}
+    letters = sum(counts.values())
+    if not letters:
+        return {}
+    share = {k: v / letters for k, v in counts.items()}
+    kana = share.get("hiragana", 0) + share.get("katakana", 0)
+    cjk = kana + share.get("han", 0)
+    scores = {
+        "ko": share.get("hangul", 0),
+        "th": share.get("thai", 0),
+        "hi": share.get("devanagari", 0),
+        # Japanese mixes kana into Han text; Chinese has (almost) no kana at all
+        "ja": cjk if kana >= 0.05 * cjk and kana > 0 else 0.0,
+        "zh-TW": share.get("han", 0) if kana < 0.05 * cjk else 0.0,
+    }
+
+    latin = share.get("latin", 0)
+    if latin:
+        lowered = f" {text.lower()} "
+        vi_marks = sum(1 for ch in text if ch in _VI_CHARS)
+        es_marks = sum(1 for ch in text if ch in _ES_CHARS)
+        hits = {lang: sum(lowered.count(g) for g in grams) for lang, grams in _LATIN_NGRAMS.items()}
+        hits["vi"] += vi_marks
+        hits["es"] += es_marks * 2
+        total = sum(hits.values())
+        if total:
+            for lang, h in hits.items():
+                scores[lang] = latin * h / total
+        else:
+            # Latin text without any cue (identifiers, log lines): treat as English
+            scores["en"] = latin
+    return scores
+
+def detect_language(text: str) -> typing.Tuple[typing.Optional[str], float]:
+    """Returns (language code, confidence) or (None, 0.0) when the text has no letters."""
+    scores = score_languages(text)
+    if not scores:
+        return None, 0.0
+    lang = max(scores, key=scores.get)
+    total = sum(scores.values())
+    return lang, (scores[lang] / total if total else 0.0)
+
+class StreamingLanguageDetector:
+    """Incremental detector for token streams; decides as soon as enough letters agree."""
+    def __init__(self, min_letters: int = 24, threshold: float = 0.8):
+        self.min_letters = min_letters
+        self.threshold = threshold
+        self._text = []
+        self._letters = 0
+        self.decision: typing.Optional[str] = None
+
+    def feed(self, chunk: str) -> typing.Optional[str]:
+        self._text.append(chunk)
+        self._letters += sum(1 for ch in chunk if ch.isalpha())
+        if self.decision is None and self._letters >= self.min_letters:
+            lang, confidence = detect_language("".join(self._text))
+            if confidence >= self.threshold:
+                self.decision = lang
+        return self.decision
+
+    def result(self) -> typing.Tuple[typing.Optional[str], float]:
+        return detect_language("".join(self._text))
+
+_SEGMENT_SPLIT = re.compile(r"(\n\s*\n|\n)")
+
+def split_segments(text: str) -> typing.List[str]:
+    """Splits on line breaks, keeping separators as their own segments so joining restores the text."""
+    return [s for s in _SEGMENT_SPLIT.split(text) if s]
+
+def foreign_runs(text: str, target_lang: str, min_letters: int = 3) -> typing.List[typing.Tuple[int, int]]:
+    """Returns [start, end) segment index runs that are not in target_lang.
+
+    Separators and letter-less segments (code, IPs, bullets) are neutral: they neither
+    break nor start a run.
+    """
+    segments = split_segments(text)
+    runs, start, last_foreign = [], None, None
+    for i, seg in enumerate(segments):
+        if sum(1 for ch in seg if ch.isalpha()) < min_letters:
+            continue
+        lang, _ = detect_language(seg)
+        if lang != target_lang:
+            if start is None:
+                start = i
+            last_foreign = i
+        elif start is not None:
+            runs.append((start, last_foreign + 1))
+            start = None
+    if start is not None:
+        runs.append((start, last_foreign + 1))
+    return runs
+
+def translation_plan(text: str, lang: str, detected: typing.Optional[str] = None,
+                     max_runs: int = MAX_PARTIAL_TRANSLATION_RUNS) -> typing.List[typing.Tuple[str, bool]]:
+    """Splits an answer into (text, needs_translation) parts for target language `lang`.
+
+    [] when the answer is already entirely in `lang`; only the foreign runs when there are
+    at most max_runs of them; otherwise the whole text. `detected` can pass in a streaming decision.
+    """
+    detected = detected or detect_language(text)[0]
+    if detected != lang:
+        return [(text, True)]
+    runs = foreign_runs(text, lang)
+    if not runs:
+        return []
+    if len(runs) > max_runs:
+        return [(text, True)]
+    segments = split_segments(text)
+    plan, pos = [], 0
+    for start, end in runs:
+        plan.append(("".join(segments[pos:start]), False))
+        plan.append(("".join(segments[start:end]), True))
+        pos = end
+    plan.append(("".join(segments[pos:]), False))
+    return [(part, translate) for part, translate in plan if part]
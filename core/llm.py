@@ -1,72 +1,412 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import concurrent.futures
+import json
 import os
-from llama_cpp import Llama
+import threading
+import time
+import typing
+import httpx
 from core.config import (
-    SEC_SYSTEM_MESSAGE, 
-    GENERAL_SYSTEM_MESSAGE, 
-    INTENT_ROUTER_MESSAGE, 
+    SEC_SYSTEM_MESSAGE,
+    SEC_STRUCTURED_SYSTEM_MESSAGE,
+    STRUCTURED_OUTPUT_ENABLED,
+    GENERAL_SYSTEM_MESSAGE,
+    INTENT_ROUTER_MESSAGE,
     CRITICAL_IT_KEYWORDS,
-    N_GPU_LAYERS_LLAMA3,
-    N_GPU_LAYERS_SEC,
-    N_CTX_LLAMA3,
-    N_CTX_SEC
+    MODEL_ROLES,
+    LLM_API_KEY,
+    REMOTE_LLM_TIMEOUT,
+    REMOTE_LLM_CONNECT_TIMEOUT,
+    REMOTE_LLM_MAX_RETRIES,
+    REMOTE_LLM_MAX_CONNECTIONS,
+    LLM_TUNING_ENABLED,
+    LLM_USE_MMAP,
+    LLM_USE_MLOCK,
+    LLM_THREADS,
+    MEMORY_PROFILE
 )
 from core.logger import logger
+from core.memory_profiles import resolve_profile, runtime_settings, kv_cache_bytes
+from core.tuning import tuned_params
+
+# llama_cpp (and its native library) is imported when a model is loaded, not at import time,
+# so remote-only deployments and tooling that just reads config stay fast to start
+if typing.TYPE_CHECKING:
+    from llama_cpp import Llama
+
+_SSE_DONE = object()
+
+def _parse_sse_line(line: str):
+    """Parses one Server-Sent Events line into a chunk dict, _SSE_DONE, or None (keep-alive/comment)."""
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning(f"Skipping malformed SSE payload: {data[:80]}")
+        return None
+
+class TrackedPromptLookupDecoding:
+    """Prompt-lookup draft model that counts draft calls and proposed tokens for acceptance statistics."""
+    def __init__(self, max_ngram_size: int = 2, num_pred_tokens: int = 10):
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        self._draft = LlamaPromptLookupDecoding(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+        self.draft_calls = 0
+        self.drafted_tokens = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = self._draft(input_ids, **kwargs)
+        self.draft_calls += 1
+        self.drafted_tokens += len(draft)
+        return draft
+
+def speculative_stats(drafted: int, draft_calls: int, generated: int) -> dict:
+    # Every verification step emits the accepted draft prefix plus one sampled token,
+    # so tokens beyond one per step were accepted drafts
+    accepted = min(drafted, max(0, generated - draft_calls))
+    return {
+        "drafted": drafted,
+        "accepted": accepted,
+        "acceptance_rate": round(accepted / drafted, 3) if drafted else 0.0,
+    }
+
+class LlamaCppBackend:
+    """In-process llama.cpp backend. Access to the shared model is serialized."""
+    kind = "llama_cpp"
+
+    def __init__(self, model: "Llama", name: str = "", draft_model: TrackedPromptLookupDecoding = None):
+        self.model = model
+        self.name = name
+        self.draft_model = draft_model
+        self._lock = threading.Lock()
+        self.waiting = 0
+        # One worker is enough (the lock serializes generation) and keeps token steps on a single thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"llama-{name or 'model'}")
+
+    def create_chat_completion(self, **kwargs) -> dict:
+        with self._lock:
+            return self.model.create_chat_completion(**kwargs)
+
+    def tokenize(self, data: bytes) -> list:
+        return self.model.tokenize(data)
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def prefill(self, messages: list) -> int:
+        """Evaluates the chat-formatted prefix of messages (e.g. just the system prompt) into the KV cache.
+
+        llama.cpp reuses the longest cached token prefix on the next completion, so a request that
+        starts with these messages only evaluates what follows. Opportunistic: returns 0 without
+        waiting when the model is busy or the cache already starts with the prefix.
+        """
+        from llama_cpp.llama_chat_format import format_llama3
+        tokens = self.model.tokenize(format_llama3(messages=messages).prompt.encode("utf-8"), add_bos=True, special=True)
+        # The formatter ends with the assistant header; the real request continues with a user turn instead
+        header = self.model.tokenize(b"<|start_header_id|>assistant<|end_header_id|>\n\n", add_bos=False, special=True)
+        if header and tokens[-len(header):] == header:
+            tokens = tokens[:-len(header)]
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            cached = 0
+            for a, b in zip(self.model.input_ids[:self.model.n_tokens], tokens):
+                if a != b:
+                    break
+                cached += 1
+            if cached == len(tokens):
+                return 0
+            # eval() drops the KV cells past n_tokens before evaluating the rest of the prefix
+            self.model.n_tokens = cached
+            self.model.eval(tokens[cached:])
+            return len(tokens) - cached
+        finally:
+            self._lock.release()
+
+    async def stream_chat(self, messages: list, **params) -> typing.AsyncGenerator[dict, None]:
+        # Poll instead of blocking a worker thread so a cancelled waiter never leaks the lock
+        self.waiting += 1
+        try:
+            while not self._lock.acquire(blocking=False):
+                await asyncio.sleep(0.01)
+        finally:
+            self.waiting -= 1
+        stream = None
+        pending = None
+        try:
+            draft = self.draft_model
+            calls_before, drafted_before = (draft.draft_calls, draft.drafted_tokens) if draft else (0, 0)
+            generated = 0
+            stream = self.model.create_chat_completion(messages=messages, stream=True, **params)
+            while True:
+                pending = self._executor.submit(next, stream, None)
+                chunk = await asyncio.wrap_future(pending)
+                pending = None
+                if chunk is None:
+                    break
+                if chunk.get("choices") and chunk["choices"][0].get("delta", {}).get("content"):
+                    generated += 1
+                yield chunk
+            if draft:
+                # Counters are per model; the lock guarantees the delta belongs to this request
+                yield {"choices": [], "speculative": speculative_stats(
+                    draft.drafted_tokens - drafted_before, draft.draft_calls - calls_before, generated)}
+        finally:
+            if pending is not None and not pending.done():
+                # Cancelled while a token was being computed: the worker still owns the model,
+                # so the iterator is closed and the lock released as soon as that token is done
+                pending.add_done_callback(lambda _: self._release(stream))
+            else:
+                self._release(stream)
+
+    def _release(self, stream):
+        try:
+            if stream is not None:
+                # Closing the llama iterator stops generation; nothing more is evaluated for this request
+                stream.close()
+        finally:
+            self._lock.release()
+
+class OpenAICompatBackend:
+    """Remote backend for OpenAI-compatible servers (llama.cpp `llama-server`, vLLM, ...)."""
+    kind = "openai"
+
+    def __init__(self, endpoint: str, model: str = "", api_key: str = "",
+                 timeout: float = REMOTE_LLM_TIMEOUT, connect_timeout: float = REMOTE_LLM_CONNECT_TIMEOUT,
+                 max_retries: int = REMOTE_LLM_MAX_RETRIES, max_connections: int = REMOTE_LLM_MAX_CONNECTIONS):
+        self.endpoint = endpoint.rstrip("/")
+        self.name = model
+        self.max_retries = max_retries
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._async_client = None
+
+    def _get_client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(base_url=self.endpoint, headers=self._headers,
+                                        timeout=self._timeout, limits=self._limits)
+        return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(base_url=self.endpoint, headers=self._headers,
+                                                   timeout=self._timeout, limits=self._limits)
+        return self._async_client
+
+    def _payload(self, messages: list, params: dict, stream: bool) -> dict:
+        payload = {"model": self.name, "messages": messages, "stream": stream}
+        payload.update({k: v for k, v in params.items() if v is not None})
+        return payload
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        if isinstance(e, httpx.HTTPStatusError):
+            return e.response.status_code >= 500 or e.response.status_code == 429
+        return isinstance(e, httpx.TransportError)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(0.25 * (2 ** attempt), 4.0)
+
+    def create_chat_completion(self, messages: list, stream: bool = False, **params) -> dict:
+        """Blocking, non-streaming completion (used for intent routing from worker threads)."""
+        if stream:
+            raise ValueError("Use stream_chat() for streaming completions on remote backends.")
+        payload = self._payload(messages, params, stream=False)
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self._get_client().post("/chat/completions", json=payload)
+                resp.raise_for_status()
+                return resp.json()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                logger.warning(f"Remote LLM request failed ({e}), retrying ({attempt + 1}/{self.max_retries})...")
+                time.sleep(self._backoff(attempt))
+
+    def tokenize(self, data: bytes) -> list:
+        """Tokenizes via llama-server's /tokenize, falling back to a ~4 chars/token estimate."""
+        text = data.decode("utf-8", errors="ignore")
+        root = self.endpoint[:-3] if self.endpoint.endswith("/v1") else self.endpoint
+        try:
+            resp = self._get_client().post(f"{root}/tokenize", json={"content": text}, timeout=2)
+            resp.raise_for_status()
+            return resp.json()["tokens"]
+        except Exception:
+            return [0] * max(1, len(text) // 4)
+
+    async def stream_chat(self, messages: list, **params) -> typing.AsyncGenerator[dict, None]:
+        """Streams chat completion chunks over SSE. Retries only before the first token."""
+        payload = self._payload(messages, params, stream=True)
+        client = self._get_async_client()
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with client.stream("POST", "/chat/completions", json=payload) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        chunk = _parse_sse_line(line)
+                        if chunk is _SSE_DONE:
+                            return
+                        if chunk is not None:
+                            started = True
+                            # llama-server reports server-side speculative decoding in its final timings
+                            timings = chunk.get("timings") or {}
+                            if timings.get("draft_n"):
+                                chunk["speculative"] = {
+                                    "drafted": timings["draft_n"],
+                                    "accepted": timings.get("draft_n_accepted", 0),
+                                    "acceptance_rate": round(timings.get("draft_n_accepted", 0) / timings["draft_n"], 3),
+                                }
+                            yield chunk
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if started or attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                logger.warning(f"Remote LLM stream failed ({e}), retrying ({attempt + 1}/{self.max_retries})...")
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
 class LLMManager:
     """Manages the LLMs (Llama, Foundation-Sec) and intent classification."""
-    def __init__(self):
+    def __init__(self, memory_profile: str = MEMORY_PROFILE,
+                 ram_total_gb: typing.Union[float, typing.Callable[[], float], None] = None):
         self.llm_general = None
         self.llm_sec = None
+        self.llm_router = None
+        self._memory_profile_setting = memory_profile
+        self._memory_profile = None
+        self._ram_total_gb = ram_total_gb
+        # Context size each loaded role actually got (the memory profile decides it unless N_CTX_* is set)
+        self.context_sizes = {}
+
+    @property
+    def memory_profile(self) -> str:
+        """Resolved on first use, so constructing a manager never probes the hardware."""
+        if self._memory_profile is None:
+            self._memory_profile = resolve_profile(self._memory_profile_setting, self._ram_total_gb)
+        return self._memory_profile
 
-    def _load_model(self, path: str, n_gpu_layers: int = -1, context_size: int = 2048) -> Llama:
+    def context_size(self, role: str) -> int:
+        if role not in self.context_sizes:
+            self.context_sizes[role] = runtime_settings(role, self.memory_profile)["n_ctx"]
+        return self.context_sizes[role]
+
+    def _load_model(self, path: str, n_gpu_layers: int = -1, context_size: int = 2048,
+                    draft_model: TrackedPromptLookupDecoding = None, memory: dict = None, **overrides) -> "Llama":
+        from llama_cpp import Llama
         if not os.path.exists(path):
             logger.error(f"Model file not found at {path}")
             raise FileNotFoundError(f"Model file not found at {path}")
-        
-        # Use roughly half of the available CPU threads for balanced resource usage
-        n_threads = max(1, os.cpu_count() // 2) if os.cpu_count() else 4
-        
-        logger.info(f"Loading model from {path} (layers={n_gpu_layers}, ctx={context_size}, threads={n_threads})...")
-        return Llama(
+
+        # Use roughly half of the available CPU threads for balanced resource usage,
+        # unless `python calibrate.py` measured better settings for this model on this machine
+        params = {"n_gpu_layers": n_gpu_layers, "n_threads": max(1, os.cpu_count() // 2) if os.cpu_count() else 4,
+                  "use_mmap": LLM_USE_MMAP, "use_mlock": bool(LLM_USE_MLOCK)}
+        # Memory profile: KV cache types, flash attention and mlock
+        params.update(memory or {})
+        tuned = tuned_params(path) if LLM_TUNING_ENABLED else {}
+        params.update(tuned)
+        if LLM_THREADS > 0:
+            # Set per worker by workers.py so that several processes split the cores instead of oversubscribing
+            params["n_threads"] = LLM_THREADS
+        params.update(overrides)
+
+        logger.info(f"Loading model from {path} (ctx={context_size}, "
+                    f"{', '.join(f'{k}={v}' for k, v in params.items())}, "
+                    f"profile={'calibrated' if tuned else 'default'}, "
+                    f"speculative={'on' if draft_model else 'off'})...")
+        model = Llama(
             model_path=path,
-            n_gpu_layers=n_gpu_layers,
-            seed=1337,            
+            seed=1337,
             n_ctx=context_size,
-            n_threads=n_threads,
-            verbose=False,        
-            chat_format="llama-3" 
+            verbose=False,
+            chat_format="llama-3",
+            draft_model=draft_model,
+            **params
         )
+        kv_bytes = kv_cache_bytes(model.metadata, context_size, params.get("type_k", 1), params.get("type_v", 1))
+        if kv_bytes:
+            logger.info(f"Estimated KV cache for {os.path.basename(path)}: {kv_bytes / 1024 ** 2:.0f} MiB "
+                        f"({context_size} tokens)")
+        return model
+
+    def _load_backend(self, role: str, path: str):
+        """Builds the inference backend configured for a model role (general/security/router)."""
+        cfg = MODEL_ROLES[role]
+        if cfg["backend"] == "openai":
+            model_name = os.path.splitext(os.path.basename(path))[0] if path else role
+            logger.info(f"Using remote {role} model at {cfg['endpoint']} ({model_name})")
+            return OpenAICompatBackend(cfg["endpoint"], model=model_name, api_key=LLM_API_KEY)
+        if cfg["backend"] == "llama_cpp":
+            spec = cfg["speculative"]
+            draft_model = None
+            if spec["enabled"]:
+                draft_model = TrackedPromptLookupDecoding(max_ngram_size=spec["ngram_size"], num_pred_tokens=spec["draft_tokens"])
+            settings = runtime_settings(role, self.memory_profile)
+            self.context_sizes[role] = settings.pop("n_ctx")
+            model = self._load_model(path, cfg["n_gpu_layers"], self.context_sizes[role], draft_model=draft_model,
+                                     memory=settings)
+            return LlamaCppBackend(model, name=role, draft_model=draft_model)
+        raise ValueError(f"Unknown LLM backend '{cfg['backend']}' for role '{role}'")
 
     def load_general_model(self, path: str):
         if self.llm_general is not None:
             logger.info("General model already loaded, skipping.")
             return
-        self.llm_general = self._load_model(path, N_GPU_LAYERS_LLAMA3, N_CTX_LLAMA3)
+        self.llm_general = self._load_backend("general", path)
 
     def load_security_model(self, path: str):
         if self.llm_sec is not None:
             logger.info("Security model already loaded, skipping.")
             return
-        self.llm_sec = self._load_model(path, N_GPU_LAYERS_SEC, N_CTX_SEC)
+        self.llm_sec = self._load_backend("security", path)
+
+    def load_router_model(self, path: str = MODEL_ROLES["router"]["path"]):
+        if self.llm_router is not None:
+            return
+        cfg = MODEL_ROLES["router"]
+        if (cfg["backend"] == "openai" and not cfg["endpoint"]) or (cfg["backend"] == "llama_cpp" and not path):
+            logger.info("No dedicated router model configured, using general model for intent routing.")
+            return
+        self.llm_router = self._load_backend("router", path)
+
+    def keyword_intent(self, user_input: str) -> bool:
+        """The cheap first stage of classify_intent: True when a critical IT keyword is present."""
+        user_input_lower = user_input.lower()
+        return any(keyword in user_input_lower for keyword in CRITICAL_IT_KEYWORDS)
 
     def classify_intent(self, user_input: str) -> bool:
         """Returns True if intent is security/IT related, False otherwise."""
-        user_input_lower = user_input.lower()
-        if any(keyword in user_input_lower for keyword in CRITICAL_IT_KEYWORDS):
+        if self.keyword_intent(user_input):
             logger.info("Intent classified as 'Security' via keyword match.")
             return True
 
-        if not self.llm_general:
+        router_llm = self.llm_router or self.llm_general
+        if not router_llm:
             return False
-            
+
         classification_messages = [
             {"role": "system", "content": INTENT_ROUTER_MESSAGE},
             {"role": "user", "content": user_input}
         ]
-        
+
         try:
-            res = self.llm_general.create_chat_completion(
+            res = router_llm.create_chat_completion(
                 messages=classification_messages,
                 max_tokens=2,
                 temperature=0.0
@@ -83,4 +423,13 @@ class LLMManager:
         return self.llm_sec if is_security else self.llm_general
 
     def get_active_system_message(self, is_security: bool) -> str:
+        if is_security and STRUCTURED_OUTPUT_ENABLED:
+            return SEC_STRUCTURED_SYSTEM_MESSAGE
         return SEC_SYSTEM_MESSAGE if is_security else GENERAL_SYSTEM_MESSAGE
+
+    def prefill_system_prompt(self, is_security: bool) -> int:
+        """Warms the active model's KV cache with its system prompt; returns tokens evaluated (0 if unsupported)."""
+        prefill = getattr(self.get_active_model(is_security), "prefill", None)
+        if prefill is None:
+            return 0
+        return prefill([{"role": "system", "content": self.get_active_system_message(is_security)}])
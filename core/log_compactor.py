@@ -0,0 +1,182 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import re
+import typing
+from core.config import LOG_COMPACTION_MIN_LINES, LOG_COMPACTION_SIM_THRESHOLD
+
+# Timestamps are stripped before templating so they become the cluster's time range instead of variables
+_TIMESTAMP_PATTERNS = [
+    re.compile(r"\[\d{1,2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2}(?: [+-]\d{4})?\]"),                       # nginx/apache
+    re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"),         # ISO 8601
+    re.compile(r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2} \d{2}:\d{2}:\d{2}"),  # syslog
+]
+
+# Variable masking, most specific first
+_MASKS = [
+    ("<IP>", re.compile(r"^\(?\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?[),]?$")),
+    ("<UUID>", re.compile(r"^[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}$")),
+    ("<HEX>", re.compile(r"^(?:0x)?[0-9a-fA-F]{8,}$")),
+    ("<NUM>", re.compile(r"^[-+]?\d+(?:\.\d+)?[,;:]?$")),
+]
+_NUM_IN_TOKEN = re.compile(r"\d+")
+
+_LOG_LINE_HINTS = re.compile(
+    r"(\b(?:GET|POST|PUT|DELETE|HEAD|OPTIONS|PATCH) /|HTTP/\d|\b(?:\d{1,3}\.){3}\d{1,3}\b|"
+    r"\b(?:sshd|sudo|kernel|systemd|CRON)\b|\b(?:ERROR|WARN|WARNING|INFO|DEBUG|CRITICAL)\b|\[\w+\]|\w+\[\d+\]:)"
+)
+
+WILDCARD = "<*>"
+
+def _split_timestamp(line: str) -> typing.Tuple[typing.Optional[str], str]:
+    for pattern in _TIMESTAMP_PATTERNS:
+        m = pattern.search(line)
+        if m:
+            return m.group(0).strip("[]"), line[:m.start()] + "<TS>" + line[m.end():]
+    return None, line
+
+def _mask_token(token: str) -> str:
+    for placeholder, pattern in _MASKS:
+        if pattern.match(token):
+            return placeholder
+    # Keep the token shape for ids embedded in words (e.g. "sshd[1234]:" -> "sshd[<NUM>]:")
+    return _NUM_IN_TOKEN.sub("<NUM>", token) if any(c.isdigit() for c in token) else token
+
+def _is_log_line(line: str) -> bool:
+    return bool(_LOG_LINE_HINTS.search(line)) or any(p.search(line) for p in _TIMESTAMP_PATTERNS)
+
+class LogCluster:
+    """One Drain-style template and the values observed at its variable positions."""
+    MAX_SAMPLES = 3
+    MAX_DISTINCT = 1000  # Bound on distinct values tracked per position
+
+    def __init__(self, masked: typing.List[str], raw: typing.List[str], timestamp: typing.Optional[str]):
+        self.template = list(masked)
+        self.count = 1
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.samples: typing.Dict[int, typing.List[str]] = {}
+        self._distinct: typing.Dict[int, set] = {}
+        self._first_raw = list(raw)
+        self._record(raw)
+
+    def similarity(self, masked: typing.List[str]) -> float:
+        same = sum(1 for a, b in zip(self.template, masked) if a == b or a == WILDCARD)
+        return same / len(self.template)
+
+    def add(self, masked: typing.List[str], raw: typing.List[str], timestamp: typing.Optional[str]):
+        for i, token in enumerate(masked):
+            if self.template[i] != token and self.template[i] != WILDCARD:
+                # Position turned variable: keep the value the template had so far as a sample
+                if self.template[i] == self._first_raw[i]:
+                    self.samples.setdefault(i, []).insert(0, self._first_raw[i])
+                    self._distinct.setdefault(i, set()).add(self._first_raw[i])
+                self.template[i] = WILDCARD
+        self.count += 1
+        if timestamp:
+            self.first_seen = self.first_seen or timestamp
+            self.last_seen = timestamp
+        self._record(raw)
+
+    def _record(self, raw: typing.List[str]):
+        for i, token in enumerate(raw):
+            if self.template[i] == token:
+                continue
+            distinct = self._distinct.setdefault(i, set())
+            if token in distinct or len(distinct) >= self.MAX_DISTINCT:
+                continue
+            distinct.add(token)
+            values = self.samples.setdefault(i, [])
+            if len(values) < self.MAX_SAMPLES:
+                values.append(token)
+
+    def _extra(self, i: int) -> int:
+        return len(self._distinct.get(i, ())) - len(self.samples[i][:self.MAX_SAMPLES])
+
+    def render(self) -> str:
+        # Masked positions that only ever held one value are constants; print them verbatim
+        template = list(self.template)
+        varied = []
+        for i, values in self.samples.items():
+            if len(self._distinct.get(i, ())) == 1:
+                template[i] = values[0]
+            else:
+                varied.append(i)
+        varied.sort(key=lambda i: (-len(self._distinct[i]), i))
+
+        line = f"(x{self.count}) {' '.join(template)}"
+        if self.count > 1 and self.first_seen:
+            line += f" | {self.first_seen} .. {self.last_seen}"
+        if varied:
+            parts = []
+            for i in varied[:3]:
+                more = f" (+{self._extra(i)} more)" if self._extra(i) > 0 else ""
+                parts.append(f"{template[i]}={', '.join(self.samples[i][:self.MAX_SAMPLES])}{more}")
+            line += " | " + "; ".join(parts)
+        return line
+
+class CompactionResult(typing.NamedTuple):
+    text: str
+    lines: int
+    templates: int
+    original_chars: int
+    compacted_chars: int
+
+    @property
+    def ratio(self) -> float:
+        return round(self.original_chars / max(1, self.compacted_chars), 2)
+
+    def stats(self) -> dict:
+        return {"lines": self.lines, "templates": self.templates, "ratio": self.ratio}
+
+class LogCompactor:
+    """Drain-style log templating: groups near-identical lines into 'template x count' summaries."""
+    def __init__(self, min_lines: int = LOG_COMPACTION_MIN_LINES, sim_threshold: float = LOG_COMPACTION_SIM_THRESHOLD,
+                 min_log_ratio: float = 0.6):
+        self.min_lines = min_lines
+        self.sim_threshold = sim_threshold
+        self.min_log_ratio = min_log_ratio
+
+    def is_log_shaped(self, lines: typing.List[str]) -> bool:
+        if len(lines) < self.min_lines:
+            return False
+        return sum(1 for line in lines if _is_log_line(line)) / len(lines) >= self.min_log_ratio
+
+    def cluster(self, lines: typing.Iterable[str]) -> typing.List[LogCluster]:
+        # Drain's fixed-depth parse tree reduced to its first two levels: token count, then leading token
+        groups: typing.Dict[typing.Tuple[int, str], typing.List[LogCluster]] = {}
+        ordered: typing.List[LogCluster] = []
+        for line in lines:
+            timestamp, body = _split_timestamp(line)
+            raw = body.split()
+            if not raw:
+                continue
+            masked = [_mask_token(t) for t in raw]
+            key = (len(masked), masked[0] if masked[0] != "<TS>" or len(masked) == 1 else masked[1])
+            candidates = groups.setdefault(key, [])
+            best, best_sim = None, 0.0
+            for c in candidates:
+                sim = c.similarity(masked)
+                if sim > best_sim:
+                    best, best_sim = c, sim
+            if best is not None and best_sim >= self.sim_threshold:
+                best.add(masked, raw, timestamp)
+            else:
+                c = LogCluster(masked, raw, timestamp)
+                candidates.append(c)
+                ordered.append(c)
+        return ordered
+
+    def compact(self, text: str) -> typing.Optional[CompactionResult]:
+        """Returns a compacted rendering of log-shaped input, or None when the input should stay verbatim."""
+        lines = [line for line in text.splitlines() if line.strip()]
+        if not self.is_log_shaped(lines):
+            return None
+
+        log_lines = [line for line in lines if _is_log_line(line)]
+        prose = [line for line in lines if not _is_log_line(line)]
+        clusters = sorted(self.cluster(log_lines), key=lambda c: c.count, reverse=True)
+        if len(clusters) >= len(log_lines):
+            return None  # Nothing repeats, templating would only add noise
+
+        header = f"[Log summary: {len(log_lines)} lines -> {len(clusters)} templates]"
+        compacted = "\n".join(prose + [header] + [c.render() for c in clusters])
+        return CompactionResult(compacted, len(log_lines), len(clusters), len(text), len(compacted))
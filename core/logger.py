@@ -1,45 +1,160 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
+import atexit
 import logging
+import queue
 import sys
+import threading
+import time
 import structlog
 
 import os
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from core.config import LOG_FORMAT, LOG_ASYNC, LOG_QUEUE_SIZE, LOG_SAMPLE_RULES
 
 os.makedirs("logs", exist_ok=True)
 
+# 高頻訊息的預設抽樣規則：事件開頭字串 -> 每個時間窗最多幾筆 / 時間窗秒數 / 抽樣比例
+DEFAULT_SAMPLE_RULES = {
+    "Intent classified": {"limit": 5, "per": 1.0, "sample": 1.0},
+    "Found relevant context in VectorDB": {"limit": 5, "per": 1.0, "sample": 1.0},
+    "Generating response using": {"limit": 5, "per": 1.0, "sample": 1.0},
+    "Translating response to": {"limit": 5, "per": 1.0, "sample": 1.0},
+}
+
+class EventSampler:
+    """structlog processor: per-event rate limiting and ratio sampling for noisy messages.
+
+    Events are matched by prefix because most call sites log f-strings. The first event
+    let through after a suppressed window carries a `suppressed` count.
+    """
+    def __init__(self, rules: dict):
+        self.rules = rules
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, logger, method_name, event_dict):
+        event = str(event_dict.get("event", ""))
+        prefix = next((p for p in self.rules if event.startswith(p)), None)
+        if prefix is None or method_name in ("warning", "error", "critical", "exception"):
+            return event_dict
+
+        rule = self.rules[prefix]
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(prefix, {"start": now, "count": 0, "seen": 0, "suppressed": 0})
+            if now - window["start"] >= rule.get("per", 1.0):
+                window.update(start=now, count=0)
+            window["seen"] += 1
+            sample = rule.get("sample", 1.0)
+            # Deterministic 1-in-N sampling: keep the event whenever seen * sample crosses an integer
+            sampled_out = sample < 1.0 and int(window["seen"] * sample) == int((window["seen"] - 1) * sample)
+            if sampled_out or window["count"] >= rule.get("limit", float("inf")):
+                window["suppressed"] += 1
+                raise structlog.DropEvent
+            window["count"] += 1
+            if window["suppressed"]:
+                event_dict["suppressed"] = window["suppressed"]
+                window["suppressed"] = 0
+        return event_dict
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops (and counts) instead of blocking when the queue is full."""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Rendering happens on the listener thread, so keep structlog's event dict intact
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_queue_handler = None
+
+def log_queue_stats() -> dict:
+    # 給 health check 用：目前 queue 深度與因為滿載而丟棄的筆數
+    if _queue_handler is None:
+        return {}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
 def setup_logger(name: str = "cisco-foundation-sec-8b"):
+    global _listener, _queue_handler
     # 設定標準 library 的基礎 logging 等級
     # 這樣連第三方套件吐出來的 log 也能被攔截成 structlog 格式
-    
+    shared_processors = [
+        structlog.stdlib.add_logger_name,
+        structlog.stdlib.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+    ]
+
+    # 生產環境 (LOG_FORMAT=json) 輸出 JSON 給 Loki，開發時保留漂亮彩色輸出
+    if LOG_FORMAT == "json":
+        console_renderer = structlog.processors.JSONRenderer()
+        file_renderer = structlog.processors.JSONRenderer()
+    else:
+        console_renderer = structlog.dev.ConsoleRenderer()
+        file_renderer = structlog.dev.ConsoleRenderer(colors=False)
+
+    def formatter(renderer):
+        return structlog.stdlib.ProcessorFormatter(
+            foreign_pre_chain=shared_processors,
+            processors=[
+                structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                structlog.processors.StackInfoRenderer(),
+                structlog.processors.format_exc_info,
+                renderer,
+            ],
+        )
+
     # 準備寫入實體檔案的 handler，加上自動滾動機制 (10MB)
     file_handler = RotatingFileHandler("logs/app.log", maxBytes=10*1024*1024, backupCount=5)
+    file_handler.setFormatter(formatter(file_renderer))
     stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter(console_renderer))
+
+    # 非同步模式：呼叫端只把 record 丟進 queue，實際 I/O 交給背景 listener thread
+    if LOG_ASYNC:
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        handlers = [_queue_handler]
+        if _listener is None:
+            _listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+    else:
+        handlers = [stream_handler, file_handler]
 
     logging.basicConfig(
         format="%(message)s",
-        handlers=[stream_handler, file_handler],
+        handlers=handlers,
         level=logging.INFO,
+        force=True,
     )
 
+    # 自訂抽樣規則格式錯誤時只警告並略過，不讓每一次 log 呼叫都出錯
+    sample_rules = {k: v for k, v in LOG_SAMPLE_RULES.items() if isinstance(v, dict)}
+    if len(sample_rules) != len(LOG_SAMPLE_RULES):
+        logging.getLogger(name).warning("Ignoring LOG_SAMPLE_RULES entries that are not JSON objects")
+
     # 針對 structlog 配置處理管線
     structlog.configure(
         processors=[
-            structlog.stdlib.add_logger_name,
-            structlog.stdlib.add_log_level,
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.StackInfoRenderer(),
-            structlog.processors.format_exc_info,
-            
-            # 轉換為本地查看用的漂亮彩色輸出 (如果上生產環境要給 Loki，可改為 JSONRenderer)
-            structlog.dev.ConsoleRenderer()
+            structlog.stdlib.filter_by_level,
+            EventSampler({**DEFAULT_SAMPLE_RULES, **sample_rules}),
+            *shared_processors,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
         wrapper_class=structlog.stdlib.BoundLogger,
         cache_logger_on_first_use=True,
     )
-    
+
     return structlog.get_logger(name)
 
 logger = setup_logger()
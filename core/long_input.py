@@ -0,0 +1,157 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import typing
+from core.config import (
+    MAP_CHUNK_SYSTEM_MESSAGE,
+    MAP_REDUCE_MAP_MAX_TOKENS,
+    MAP_REDUCE_CONCURRENCY,
+    MAP_REDUCE_PROMPT_OVERHEAD
+)
+from core.logger import logger
+
+def split_text(text: str, max_chars: int) -> typing.List[str]:
+    """Splits text on line boundaries into chunks of at most max_chars (over-long lines are hard-split)."""
+    chunks, buf, size = [], [], 0
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            if buf:
+                chunks.append("\n".join(buf))
+                buf, size = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) + 1 > max_chars and buf:
+            chunks.append("\n".join(buf))
+            buf, size = [], 0
+        buf.append(line)
+        size += len(line) + 1
+    if buf:
+        chunks.append("\n".join(buf))
+    return [c for c in chunks if c.strip()]
+
+class LongInputAnalyzer:
+    """Map-reduce analysis for inputs that do not fit the model context window."""
+    MAX_MERGE_ROUNDS = 4
+
+    def __init__(self, llm, n_ctx: int, answer_max_tokens: int):
+        self.llm = llm
+        self.n_ctx = n_ctx
+        self.answer_max_tokens = answer_max_tokens
+        self.usage = {"prompt": 0, "completion": 0}
+        self._chars_per_token = None
+
+    async def count_tokens(self, text: str) -> int:
+        return len(await asyncio.to_thread(self.llm.tokenize, text.encode("utf-8")))
+
+    async def _estimate_chars_per_token(self, text: str) -> float:
+        # Tokenizing a multi-MB paste is wasteful (and an HTTP round trip on remote backends), so sample it
+        if self._chars_per_token is None:
+            sample = text[:4096]
+            self._chars_per_token = max(1.0, len(sample) / max(1, await self.count_tokens(sample)))
+        return self._chars_per_token
+
+    async def _split(self, text: str, max_chars: int, budget_tokens: int) -> typing.List[str]:
+        """split_text, then re-split any segment that is still over budget_tokens.
+
+        The chars-per-token estimate comes from the head of the input; denser text further on
+        (hex dumps, base64, CJK logs) would otherwise produce map prompts larger than n_ctx.
+        """
+        segments = []
+        for segment in split_text(text, max_chars):
+            tokens = await self.count_tokens(segment)
+            if tokens <= budget_tokens:
+                segments.append(segment)
+                continue
+            smaller = max(1, min(len(segment) - 1, int(len(segment) * budget_tokens / tokens * 0.9)))
+            segments.extend(await self._split(segment, smaller, budget_tokens))
+        return segments
+
+    async def _fit_findings(self, findings: typing.List[str], budget_tokens: int) -> typing.List[str]:
+        """Truncates every finding by the same ratio until all of them fit one reduce prompt."""
+        tokens = await self.count_tokens("\n\n".join(findings))
+        while tokens > budget_tokens:
+            logger.warning(f"Long input findings still {tokens} tokens after {self.MAX_MERGE_ROUNDS} merge rounds, "
+                           f"truncating to {budget_tokens}")
+            ratio = budget_tokens / tokens * 0.9
+            findings = [f[:int(len(f) * ratio)] for f in findings]
+            findings = [f for f in findings if f]
+            tokens = await self.count_tokens("\n\n".join(findings))
+        return findings
+
+    async def fits(self, messages: list) -> bool:
+        prompt = str(messages)
+        budget = self.n_ctx - self.answer_max_tokens
+        # Cheap bounds first: a token is rarely shorter than one char or longer than eight
+        if len(prompt) <= budget:
+            return True
+        if len(prompt) > budget * 8:
+            return False
+        return await self.count_tokens(prompt) <= budget
+
+    async def _complete(self, messages: list, max_tokens: int) -> str:
+        parts = []
+        async for chunk in self.llm.stream_chat(messages, temperature=0.2, top_p=0.9, repeat_penalty=1.1,
+                                                max_tokens=max_tokens, stop=["<|eot_id|>", "<|end_of_text|>"]):
+            if chunk.get("choices"):
+                parts.append(chunk["choices"][0].get("delta", {}).get("content") or "")
+        text = "".join(parts).strip()
+        self.usage["prompt"] += await self.count_tokens(str(messages))
+        self.usage["completion"] += await self.count_tokens(text)
+        return text
+
+    async def _map(self, segments: typing.List[str], instruction: str, stage: str) -> typing.AsyncGenerator[dict, None]:
+        """Runs one map round, yielding progress chunks and finally {"type": "findings", ...} in segment order."""
+        semaphore = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+        total = len(segments)
+        results: typing.List[str] = [""] * total
+
+        async def run(i: int, segment: str):
+            async with semaphore:
+                messages = [
+                    {"role": "system", "content": MAP_CHUNK_SYSTEM_MESSAGE},
+                    {"role": "user", "content": f"{instruction} (part {i + 1}/{total}):\n{segment}\n\nFINDINGS:"},
+                ]
+                return i, await self._complete(messages, MAP_REDUCE_MAP_MAX_TOKENS)
+
+        tasks = [asyncio.create_task(run(i, s)) for i, s in enumerate(segments)]
+        try:
+            for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+                i, text = await fut
+                results[i] = text
+                yield {"type": "progress", "stage": stage, "done": done, "total": total}
+        finally:
+            for t in tasks:
+                t.cancel()
+        yield {"type": "findings", "findings": results}
+
+    async def analyze(self, text: str) -> typing.AsyncGenerator[dict, None]:
+        """Map: per-chunk findings. Merge rounds repeat until all findings fit one reduce prompt.
+
+        Findings that still do not fit after MAX_MERGE_ROUNDS are truncated to the reduce budget.
+        """
+        budget_tokens = max(256, self.n_ctx - MAP_REDUCE_MAP_MAX_TOKENS - MAP_REDUCE_PROMPT_OVERHEAD)
+        max_chars = int(budget_tokens * await self._estimate_chars_per_token(text))
+        segments = await self._split(text, max_chars, budget_tokens)
+        logger.info(f"Long input mode: {len(text)} chars split into {len(segments)} segments of <= {max_chars} chars")
+
+        findings: typing.List[str] = []
+        async for chunk in self._map(segments, "Extract the security-relevant findings from this input segment", "map"):
+            if chunk["type"] == "findings":
+                findings = chunk["findings"]
+            else:
+                yield chunk
+
+        reduce_budget = max(256, self.n_ctx - self.answer_max_tokens - MAP_REDUCE_PROMPT_OVERHEAD)
+        round_no = 0
+        while (len(findings) > 1 and round_no < self.MAX_MERGE_ROUNDS
+               and await self.count_tokens("\n\n".join(findings)) > reduce_budget):
+            round_no += 1
+            groups = await self._split("\n\n".join(f for f in findings if f), max_chars, budget_tokens)
+            logger.info(f"Long input merge round {round_no}: {len(findings)} findings -> {len(groups)} groups")
+            async for chunk in self._map(groups, "Merge and deduplicate these partial security findings", f"merge-{round_no}"):
+                if chunk["type"] == "findings":
+                    findings = chunk["findings"]
+                else:
+                    yield chunk
+
+        findings = await self._fit_findings(findings, reduce_budget)
+        yield {"type": "findings", "findings": findings, "segments": len(segments)}
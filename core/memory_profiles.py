@@ -0,0 +1,86 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import typing
+from core.config import MEMORY_PROFILE, MODEL_ROLES, LLM_USE_MLOCK
+from core.logger import logger
+
+# KV cache element types llama.cpp accepts for type_k / type_v: name -> (ggml type id, bits per value)
+KV_CACHE_TYPES = {
+    "f32": (0, 32.0), "f16": (1, 16.0), "q4_0": (2, 4.5), "q4_1": (3, 5.0),
+    "q5_0": (6, 5.5), "q5_1": (7, 6.0), "q8_0": (8, 8.5),
+}
+
+# Context size per model role, KV cache types, flash attention and mlock. "auto" picks the largest
+# profile whose min_ram_gb fits the machine, so no profile turns mlock on: pinning the weights is an
+# explicit LLM_USE_MLOCK=true opt-in. A q8_0 cache holds twice the context of f16 in the same
+# RAM, so "balanced" runs 4096 tokens in about the KV memory "compact" needs for 2048.
+MEMORY_PROFILES = {
+    "compact": {
+        "min_ram_gb": 0, "n_ctx": {"general": 2048, "security": 2048},
+        "type_k": "f16", "type_v": "f16", "flash_attn": False, "use_mlock": False,
+    },
+    "balanced": {
+        "min_ram_gb": 15, "n_ctx": {"general": 4096, "security": 4096},
+        "type_k": "q8_0", "type_v": "q8_0", "flash_attn": True, "use_mlock": False,
+    },
+    "long-context": {
+        # Incident logs go to the security model; the general model keeps the balanced context
+        "min_ram_gb": 30, "n_ctx": {"general": 4096, "security": 8192},
+        "type_k": "q8_0", "type_v": "q8_0", "flash_attn": True, "use_mlock": False,
+    },
+}
+
+def select_profile(ram_total_gb: float) -> str:
+    fitting = [(p["min_ram_gb"], name) for name, p in MEMORY_PROFILES.items() if ram_total_gb >= p["min_ram_gb"]]
+    return max(fitting)[1] if fitting else "compact"
+
+def resolve_profile(name: str = MEMORY_PROFILE,
+                    ram_total_gb: typing.Union[float, typing.Callable[[], float], None] = None) -> str:
+    """The configured profile, or for "auto" the one chosen from the machine's RAM total.
+
+    ram_total_gb may be a callable so the hardware probe only runs when "auto" actually needs it;
+    None falls back to the shared HardwareMonitor.
+    """
+    if name in MEMORY_PROFILES:
+        return name
+    if name != "auto":
+        logger.warning(f"Unknown MEMORY_PROFILE '{name}', using auto")
+    if ram_total_gb is None:
+        from core.services import get_hw_monitor
+        ram_total_gb = get_hw_monitor().ram_total
+    elif callable(ram_total_gb):
+        ram_total_gb = ram_total_gb()
+    selected = select_profile(ram_total_gb)
+    logger.info(f"Memory profile '{selected}' selected for {ram_total_gb:.1f} GB RAM")
+    return selected
+
+def runtime_settings(role: str, profile: str) -> dict:
+    """llama.cpp load options for a model role: n_ctx, type_k, type_v (ggml ids), flash_attn, use_mlock.
+
+    A non-zero N_CTX_* and an explicit LLM_USE_MLOCK take precedence over the profile.
+    """
+    p = MEMORY_PROFILES[profile]
+    n_ctx = MODEL_ROLES[role]["n_ctx"] or p["n_ctx"].get(role, 2048)
+    type_k, type_v = p["type_k"], p["type_v"]
+    if type_v not in ("f16", "f32") and not p["flash_attn"]:
+        # llama.cpp can only quantize the V cache when flash attention is on
+        type_v = "f16"
+    return {
+        "n_ctx": n_ctx, "type_k": KV_CACHE_TYPES[type_k][0], "type_v": KV_CACHE_TYPES[type_v][0],
+        "flash_attn": p["flash_attn"], "use_mlock": p["use_mlock"] if LLM_USE_MLOCK is None else LLM_USE_MLOCK,
+    }
+
+def kv_cache_bytes(metadata: dict, n_ctx: int, type_k: int, type_v: int) -> int:
+    """KV cache size from GGUF metadata (llama.metadata); 0 when the architecture keys are missing."""
+    arch = metadata.get("general.architecture", "llama")
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+        head_dim = int(metadata[f"{arch}.embedding_length"]) // n_head
+        key_len = int(metadata.get(f"{arch}.attention.key_length", head_dim))
+        value_len = int(metadata.get(f"{arch}.attention.value_length", head_dim))
+    except (KeyError, ValueError, ZeroDivisionError):
+        return 0
+    bits = {type_id: b for type_id, b in KV_CACHE_TYPES.values()}
+    per_token = n_layer * n_head_kv * (key_len * bits.get(type_k, 16.0) + value_len * bits.get(type_v, 16.0)) / 8
+    return int(per_token * n_ctx)
@@ -0,0 +1,224 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import collections
+import time
+import typing
+import httpx
+from core.config import ROUTER_STALE_AFTER, ROUTER_MAX_SESSIONS
+from core.logger import logger
+
+REQUIRED_MODELS = ("general", "security")
+# Extra load units for nodes whose governor is already shedding work
+_LEVEL_PENALTY = {"normal": 0.0, "constrained": 2.0, "critical": 6.0}
+
+WATCH_NODE_QUERY = """
+subscription {
+  watchNode {
+    stats { ramPct gpuPct totalPowerW thermalPressure chipLabel }
+    load { active waiting models governorLevel }
+  }
+}
+"""
+
+def parse_nodes(spec: str) -> typing.List[typing.Tuple[str, str]]:
+    """Parses "a=http://h1:8000,b=http://h2:8000" (names optional) into (name, url) pairs."""
+    nodes = []
+    for i, item in enumerate(filter(None, (part.strip() for part in spec.split(","))), 1):
+        name, sep, url = item.partition("=")
+        if not sep:
+            name, url = f"node{i}", item
+        nodes.append((name.strip(), url.strip().rstrip("/")))
+    return nodes
+
+def graphql_ws_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{'wss' if scheme == 'https' else 'ws'}://{rest}/graphql"
+
+class NodeState:
+    """Latest published status of one inference node, plus this router's own in-flight count."""
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.stats: dict = {}
+        self.load: dict = {}
+        self.last_seen: typing.Optional[float] = None
+        self.inflight = 0
+        # Requests sent since the last status update: the published queue depth does not include them yet
+        self.recent = 0
+        self.error: typing.Optional[str] = None
+
+    def update(self, status: dict, now: float):
+        self.stats = status.get("stats") or {}
+        self.load = status.get("load") or {}
+        self.last_seen = now
+        self.recent = 0
+        self.error = None
+
+    def mark_down(self, error: str):
+        self.last_seen = None
+        self.error = error
+
+    def healthy(self, now: float, stale_after: float) -> bool:
+        return self.last_seen is not None and now - self.last_seen <= stale_after
+
+    def has_models(self, required: typing.Iterable[str]) -> bool:
+        return set(required) <= set(self.load.get("models") or [])
+
+    def score(self) -> float:
+        queue = self.load.get("active", 0) + self.load.get("waiting", 0) + self.recent
+        # RAM pressure only breaks ties between equally queued nodes
+        return queue + self.stats.get("ramPct", 0.0) / 100.0 + _LEVEL_PENALTY.get(self.load.get("governorLevel"), 0.0)
+
+    def snapshot(self, now: float, stale_after: float) -> dict:
+        return {"name": self.name, "url": self.url, "healthy": self.healthy(now, stale_after),
+                "last_seen_s": round(now - self.last_seen, 1) if self.last_seen is not None else None,
+                "score": round(self.score(), 2), "inflight": self.inflight, "load": self.load,
+                "stats": self.stats, "error": self.error}
+
+class NodeRouter:
+    """Places analysis requests on the least-loaded healthy node that has the required models.
+
+    Each node's watchNode GraphQL subscription feeds its status; a node that stops publishing
+    for stale_after seconds, refuses connections or answers 503 is skipped until it reports
+    again. Sessions stick to the node that served their first turn (its API keeps the history
+    and a warm KV cache) and move only when that node becomes unhealthy.
+    """
+    def __init__(self, nodes: typing.List[typing.Tuple[str, str]], stale_after: float = ROUTER_STALE_AFTER,
+                 max_sessions: int = ROUTER_MAX_SESSIONS, required_models: typing.Iterable[str] = REQUIRED_MODELS,
+                 clock: typing.Callable[[], float] = time.monotonic):
+        self.nodes: typing.Dict[str, NodeState] = {name: NodeState(name, url) for name, url in nodes}
+        self.stale_after = stale_after
+        self.max_sessions = max(1, max_sessions)
+        self.required_models = tuple(required_models)
+        self.clock = clock
+        self.stats = {"routed": 0, "sticky": 0, "failovers": 0, "rejected": 0}
+        self._sessions: collections.OrderedDict = collections.OrderedDict()
+        self._tasks: typing.List[asyncio.Task] = []
+
+    # --- Status ------------------------------------------------------------
+    def update(self, name: str, status: dict):
+        node = self.nodes[name]
+        if not node.healthy(self.clock(), self.stale_after):
+            logger.info(f"Router: node {name} is reporting ({node.url})")
+        node.update(status, self.clock())
+
+    def _eligible(self, node: NodeState) -> bool:
+        return node.healthy(self.clock(), self.stale_after) and node.has_models(self.required_models)
+
+    # --- Placement ---------------------------------------------------------
+    def pick(self, session_id: typing.Optional[str] = None, exclude: typing.Iterable[str] = ()) -> typing.Optional[NodeState]:
+        exclude = set(exclude)
+        pinned = self._sessions.get(session_id) if session_id else None
+        if pinned in self.nodes and pinned not in exclude and self._eligible(self.nodes[pinned]):
+            self._sessions.move_to_end(session_id)
+            self.stats["sticky"] += 1
+            return self._dispatch(self.nodes[pinned])
+
+        candidates = [n for n in self.nodes.values() if n.name not in exclude and self._eligible(n)]
+        if not candidates:
+            self.stats["rejected"] += 1
+            return None
+        node = min(candidates, key=lambda n: (n.score(), n.inflight, n.name))
+        if session_id:
+            if pinned is not None:
+                self.stats["failovers"] += 1
+                logger.warning(f"Router: session {session_id} moved {pinned} -> {node.name}; "
+                               f"its earlier turns stay on {pinned}")
+            self._sessions[session_id] = node.name
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return self._dispatch(node)
+
+    def _dispatch(self, node: NodeState) -> NodeState:
+        node.inflight += 1
+        node.recent += 1
+        self.stats["routed"] += 1
+        return node
+
+    def finish(self, node: NodeState):
+        node.inflight = max(0, node.inflight - 1)
+
+    def release(self, node: NodeState, response: httpx.Response) -> typing.Callable[[], typing.Awaitable[None]]:
+        """Cleanup for a send() result: closes the response and calls finish(node) once, however
+        many times it is awaited, so every path that can end a relay may call it."""
+        released = False
+
+        async def cleanup():
+            nonlocal released
+            if released:
+                return
+            released = True
+            try:
+                await response.aclose()
+            finally:
+                self.finish(node)
+        return cleanup
+
+    async def send(self, client: httpx.AsyncClient, payload: dict, headers: dict = None
+                   ) -> typing.Tuple[typing.Optional[NodeState], typing.Optional[httpx.Response]]:
+        """Opens POST /api/analyze on the chosen node as a streaming response.
+
+        Connection failures and 503s fail over to the next candidate (nothing has been
+        generated yet, so retrying is safe). Returns (None, None) when no node can take it;
+        otherwise the caller must close the response and call finish(node), see release().
+        """
+        tried = set()
+        while True:
+            node = self.pick(payload.get("session_id"), exclude=tried)
+            if node is None:
+                return None, None
+            tried.add(node.name)
+            try:
+                request = client.build_request("POST", f"{node.url}/api/analyze", json=payload, headers=headers)
+                response = await client.send(request, stream=True)
+            except httpx.TransportError as e:
+                self.finish(node)
+                node.mark_down(type(e).__name__)
+                logger.warning(f"Router: node {node.name} unreachable ({type(e).__name__}), failing over")
+                continue
+            if response.status_code == 503:
+                await response.aclose()
+                self.finish(node)
+                node.mark_down("HTTP 503")
+                logger.warning(f"Router: node {node.name} not ready (503), failing over")
+                continue
+            return node, response
+
+    # --- Subscriptions -----------------------------------------------------
+    async def _watch(self, node: NodeState):
+        from gql import Client, gql
+        from gql.transport.websockets import WebsocketsTransport
+        query = gql(WATCH_NODE_QUERY)
+        backoff = 1.0
+        while True:
+            try:
+                transport = WebsocketsTransport(url=graphql_ws_url(node.url))
+                async with Client(transport=transport, fetch_schema_from_transport=False) as session:
+                    async for result in session.subscribe(query):
+                        self.update(node.name, result["watchNode"])
+                        backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if node.error is None:
+                    logger.warning(f"Router: lost status stream of node {node.name}: {e}")
+                node.error = f"{type(e).__name__}: {e}"
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._watch(node)) for node in self.nodes.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def state(self) -> dict:
+        now = self.clock()
+        nodes = [n.snapshot(now, self.stale_after) for n in self.nodes.values()]
+        return {"healthy": sum(1 for n in self.nodes.values() if self._eligible(n)), "nodes": nodes,
+                "sessions": len(self._sessions), **self.stats}
@@ -0,0 +1,118 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import hashlib
+import json
+import os
+import time
+import typing
+from core.assistant_service import GENERATION_STOP, STRUCTURED_STOP, security_user_prompt
+from core.config import TRANSLATION_SYSTEM_MESSAGE, STRUCTURED_OUTPUT_ENABLED, STRUCTURED_OUTPUT_MAX_TOKENS
+from core.database import VectorDBManager
+from core.i18n import LANG_NAMES
+from core.ingest import iter_records
+from core.logger import logger
+from core.structured_output import parse_analysis, render_markdown, response_format
+
+def content_hash(record: dict, system_prompt: str, structured: bool) -> str:
+    """Fingerprint of what an answer was generated from: the playbook text, the security system prompt
+    and the output mode. Changing any of them gets the playbook a new answer."""
+    mode = "structured" if structured else "prose"
+    raw = f"{record.get('title', '')}\x1f{record['content']}\x1f{mode}\x1f{system_prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+def canonical_question(record: dict) -> str:
+    return f"{record.get('title') or record['content'][:120]}. What does this indicate and how should we respond?"
+
+def load_playbooks(path: str) -> typing.Tuple[typing.List[dict], str]:
+    """Returns (records, "json" | "jsonl") so the file can be written back in its own format."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(64).lstrip()
+    return list(iter_records(path)), "json" if head.startswith("[") else "jsonl"
+
+def save_playbooks(path: str, records: typing.List[dict], fmt: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            json.dump(records, f, ensure_ascii=False, indent=4)
+            f.write("\n")
+        else:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+class PlaybookAnswerGenerator:
+    """Writes a canonical security answer per playbook, plus its translations, into the playbook records.
+
+    Answers use the same system prompt, user prompt and stop strings as a live security answer
+    with the playbook as its retrieved context, so the fast path reads like a normal response.
+    """
+    def __init__(self, llm_manager, langs: typing.Iterable[str] = None, max_tokens: int = 350,
+                 translate_max_tokens: int = 600):
+        self.llm = llm_manager
+        self.langs = [lang for lang in (langs or LANG_NAMES) if lang != "en"]
+        self.max_tokens = max_tokens
+        self.translate_max_tokens = translate_max_tokens
+
+    def fingerprint(self, record: dict) -> str:
+        return content_hash(record, self.llm.get_active_system_message(True), STRUCTURED_OUTPUT_ENABLED)
+
+    def answer(self, record: dict) -> typing.Tuple[str, typing.Optional[dict]]:
+        """(answer text, parsed analysis); the analysis is only set in structured mode, where the text is its markdown."""
+        hit = {"document": record["content"]}
+        messages = [
+            {"role": "system", "content": self.llm.get_active_system_message(True)},
+            {"role": "user", "content": security_user_prompt(VectorDBManager.format_context(hit), canonical_question(record))},
+        ]
+        if STRUCTURED_OUTPUT_ENABLED:
+            # Stored answers use the same grammar and markdown rendering as live structured answers
+            res = self.llm.llm_sec.create_chat_completion(messages=messages, temperature=0.0, top_p=0.9, repeat_penalty=1.1,
+                                                          max_tokens=STRUCTURED_OUTPUT_MAX_TOKENS, stop=STRUCTURED_STOP,
+                                                          response_format=response_format())
+            analysis = parse_analysis(res["choices"][0]["message"]["content"])
+            if analysis is None:
+                raise ValueError(f"Structured answer for '{record.get('title', record.get('id'))}' did not parse")
+            return render_markdown(analysis), analysis
+        res = self.llm.llm_sec.create_chat_completion(messages=messages, temperature=0.0, top_p=0.9, repeat_penalty=1.1,
+                                                      max_tokens=self.max_tokens, stop=GENERATION_STOP)
+        return res["choices"][0]["message"]["content"].strip(), None
+
+    def translate(self, text: str, lang: str) -> str:
+        messages = [
+            {"role": "system", "content": TRANSLATION_SYSTEM_MESSAGE.format(target_lang=LANG_NAMES[lang])},
+            {"role": "user", "content": f"Text to translate:\n{text}"},
+        ]
+        res = self.llm.llm_general.create_chat_completion(messages=messages, temperature=0.1,
+                                                          max_tokens=self.translate_max_tokens,
+                                                          stop=["<|eot_id|>", "<|end_of_text|>"])
+        return res["choices"][0]["message"]["content"].strip()
+
+    def run(self, records: typing.List[dict], force: bool = False) -> dict:
+        """Fills record["answers"] ({lang code: text}) in place, plus record["analysis"] (the structured object
+        of the English answer) in structured mode; up-to-date records are skipped unless force."""
+        stats = {"generated": 0, "translations": 0, "skipped": 0}
+        for record in records:
+            if "content" not in record:
+                continue
+            fingerprint = self.fingerprint(record)
+            answers = dict(record.get("answers") or {})
+            if force or record.get("answers_hash") != fingerprint:
+                answers = {}
+            missing = [lang for lang in self.langs if lang not in answers]
+            if "en" in answers and not missing:
+                stats["skipped"] += 1
+                continue
+            start = time.perf_counter()
+            if "en" not in answers:
+                answers["en"], analysis = self.answer(record)
+                if analysis is not None:
+                    record["analysis"] = analysis
+                else:
+                    record.pop("analysis", None)
+                stats["generated"] += 1
+            for lang in missing:
+                answers[lang] = self.translate(answers["en"], lang)
+                stats["translations"] += 1
+            record["answers"] = answers
+            record["answers_hash"] = fingerprint
+            logger.info(f"Precomputed answer for '{record.get('title', record.get('id'))}' "
+                        f"({len(answers)} languages, {time.perf_counter() - start:.1f}s)")
+        return stats
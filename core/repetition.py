@@ -0,0 +1,92 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import collections
+import typing
+from core.config import (
+    LOOP_MIN_SPAN_TOKENS,
+    LOOP_MAX_PERIOD,
+    LOOP_NGRAM_SIZE,
+    LOOP_NGRAM_WINDOW,
+    LOOP_NGRAM_THRESHOLD
+)
+
+class RepetitionDetector:
+    """Streaming loop detector over generated tokens.
+
+    Two scores are updated per token:
+      * suffix repetition: the tail is one block of `period` tokens repeated back to back,
+        covering at least min_span tokens (short periods need more repeats than long ones);
+      * rolling n-gram repetition: the share of n-grams in the last `window` tokens that
+        already occurred earlier in that window (catches loops with small variations).
+    Once either fires, detected describes the loop and kept_text() drops the repeated tail.
+    """
+    def __init__(self, min_span: int = LOOP_MIN_SPAN_TOKENS, max_period: int = LOOP_MAX_PERIOD,
+                 ngram: int = LOOP_NGRAM_SIZE, window: int = LOOP_NGRAM_WINDOW, ngram_threshold: float = LOOP_NGRAM_THRESHOLD):
+        self.min_span = max(2, min_span)
+        self.max_period = max(1, max_period)
+        self.ngram = max(2, ngram)
+        self.window = max(self.ngram, window)
+        self.ngram_threshold = ngram_threshold
+        self.tokens: typing.List[str] = []
+        self.detected: typing.Optional[dict] = None
+        self._ngrams: collections.deque = collections.deque()
+        self._ngram_counts: collections.Counter = collections.Counter()
+
+    def feed(self, token: str) -> typing.Optional[dict]:
+        """Adds one token; returns the loop description once the generation is clearly looping."""
+        if self.detected is not None:
+            return self.detected
+        self.tokens.append(token)
+        self._update_ngrams()
+        self.detected = self._suffix_loop() or self._ngram_loop()
+        return self.detected
+
+    def kept_text(self) -> str:
+        keep = self.detected["keep_tokens"] if self.detected else len(self.tokens)
+        return "".join(self.tokens[:keep])
+
+    def ngram_score(self) -> float:
+        if not self._ngrams:
+            return 0.0
+        return 1.0 - len(self._ngram_counts) / len(self._ngrams)
+
+    def _update_ngrams(self):
+        if len(self.tokens) < self.ngram:
+            return
+        gram = tuple(self.tokens[-self.ngram:])
+        self._ngrams.append(gram)
+        self._ngram_counts[gram] += 1
+        if len(self._ngrams) > self.window:
+            old = self._ngrams.popleft()
+            self._ngram_counts[old] -= 1
+            if not self._ngram_counts[old]:
+                del self._ngram_counts[old]
+
+    def _suffix_loop(self) -> typing.Optional[dict]:
+        tokens, n = self.tokens, len(self.tokens)
+        for period in range(1, min(self.max_period, n // 2) + 1):
+            needed = max(2, -(-self.min_span // period))
+            if needed * period > n:
+                continue
+            block = tokens[n - period:]
+            if not all(tokens[n - (k + 1) * period:n - k * period] == block for k in range(1, needed)):
+                continue
+            repeats = needed
+            while (repeats + 1) * period <= n and tokens[n - (repeats + 1) * period:n - repeats * period] == block:
+                repeats += 1
+            # Keep the first occurrence of the block, drop the copies
+            keep = n - (repeats - 1) * period
+            return {"method": "suffix", "period": period, "repeats": repeats, "keep_tokens": keep, "trimmed_tokens": n - keep}
+        return None
+
+    def _ngram_loop(self) -> typing.Optional[dict]:
+        if len(self._ngrams) < self.window:
+            return None
+        score = self.ngram_score()
+        if score < self.ngram_threshold:
+            return None
+        # Cut back to the end of the first occurrence (within the window) of the latest n-gram
+        last = self._ngrams[-1]
+        first_start = len(self.tokens) - self.ngram - len(self._ngrams) + 1
+        index = next(i for i, gram in enumerate(self._ngrams) if gram == last)
+        keep = first_start + index + self.ngram
+        return {"method": "ngram", "score": round(score, 3), "keep_tokens": keep, "trimmed_tokens": len(self.tokens) - keep}
@@ -2,6 +2,7 @@
 import strawberry
 import typing
 import asyncio
+from core.config import NODE_STATUS_INTERVAL
 
 # Global storage for the latest stats to avoid circular imports with main.py
 # This will be updated by the monitor loop in main.py
@@ -9,7 +10,7 @@ _latest_hw_stats_ref = {
     "e_cpu_pct": 0.0, "p_cpu_pct": 0.0, "gpu_pct": 0, "ram_pct": 0.0,
     "ram_used_gb": 0.0, "ram_total_gb": 0.0, "e_cores": 0, "p_cores": 0,
     "gpu_cores": "N/A", "cpu_power_w": 0.0, "gpu_power_w": 0.0,
-    "total_power_w": 0.0, "chip_label": "Unknown"
+    "total_power_w": 0.0, "thermal_pressure": "Unknown", "chip_label": "Unknown"
 }
 
 @strawberry.type
@@ -26,14 +27,47 @@ class HWStats:
     cpu_power_w: float
     gpu_power_w: float
     total_power_w: float
+    thermal_pressure: str
     chip_label: str
 
+@strawberry.type
+class NodeLoad:
+    active: int
+    waiting: int
+    models: typing.List[str]
+    governor_level: str
+
+def _node_load() -> NodeLoad:
+    """Queue depth and loaded models of this node, read without building any singleton."""
+    import core.services as services
+    active, waiting, models, level = 0, 0, [], "unknown"
+    governor = services.peek("governor")
+    if governor is not None:
+        active, waiting, level = governor.gate.active, governor.gate.waiting, governor.level
+    manager = services.peek("llm_manager")
+    if manager is not None:
+        for role, attr in (("general", "llm_general"), ("security", "llm_sec"), ("router", "llm_router")):
+            backend = getattr(manager, attr, None)
+            if backend is not None:
+                models.append(role)
+                waiting += getattr(backend, "waiting", 0)
+    return NodeLoad(active=active, waiting=waiting, models=models, governor_level=level)
+
+@strawberry.type
+class NodeStatus:
+    stats: HWStats
+    load: NodeLoad
+
 @strawberry.type
 class Query:
     @strawberry.field
     def current_stats(self) -> HWStats:
         return HWStats(**_latest_hw_stats_ref)
 
+    @strawberry.field
+    def current_node(self) -> NodeStatus:
+        return NodeStatus(stats=HWStats(**_latest_hw_stats_ref), load=_node_load())
+
 @strawberry.type
 class Subscription:
     @strawberry.subscription
@@ -42,4 +76,11 @@ class Subscription:
             yield HWStats(**_latest_hw_stats_ref)
             await asyncio.sleep(2)
 
+    @strawberry.subscription
+    async def watch_node(self) -> typing.AsyncGenerator[NodeStatus, None]:
+        # Faster than watchStats: the multi-node router places work on these figures
+        while True:
+            yield NodeStatus(stats=HWStats(**_latest_hw_stats_ref), load=_node_load())
+            await asyncio.sleep(NODE_STATUS_INTERVAL)
+
 schema = strawberry.Schema(query=Query, subscription=Subscription)
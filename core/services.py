@@ -1,67 +1,143 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
 import asyncio
-import os
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-import langfuse
-
+import threading
+import time
 
 from core.config import (
     INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET,
-    QDRANT_URL
+    QDRANT_URL, WORKER_ID
 )
 from core.logger import logger
-from core.hardware import HardwareMonitor
-from core.database import VectorDBManager, MetricsDBManager
-from core.llm import LLMManager
-from core.assistant_service import AssistantService
 from core.schema import _latest_hw_stats_ref
 
-# Initialize Arize Phoenix OpenTelemetry tracing
-trace_provider = TracerProvider()
-# Phoenix OTLP HTTP endpoint is often on the same port as the UI (6006) in recent versions
-trace_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint="http://localhost:6006/v1/traces")))
-trace.set_tracer_provider(trace_provider)
+# Singletons are built on first access (see __getattr__ below) so that importing this module,
+# and every `chainlit run -w` reload, does not pay for system_profiler probes, telemetry
+# setup or client construction before a request actually needs them.
+_instances = {}
+_instances_lock = threading.RLock()
+
+def _singleton(name: str, factory):
+    if name not in _instances:
+        with _instances_lock:
+            if name not in _instances:
+                _instances[name] = factory()
+    return _instances[name]
+
+def _create_telemetry():
+    from core.telemetry import Telemetry
+    return Telemetry()
+
+def _create_hw_monitor():
+    from core.hardware import HardwareMonitor
+    return HardwareMonitor()
+
+def _create_llm_manager():
+    from core.llm import LLMManager
+    # The memory profile is picked from the monitor's RAM total when MEMORY_PROFILE=auto; the
+    # callable defers building the monitor (and its probes) until the profile is first resolved
+    return LLMManager(ram_total_gb=lambda: get_hw_monitor().ram_total)
+
+def _create_vector_db():
+    from core.database import VectorDBManager
+    return VectorDBManager(url=QDRANT_URL)
+
+def _create_assistant_service():
+    from core.assistant_service import AssistantService
+    return AssistantService(get_llm_manager(), get_vector_db(), telemetry=get_telemetry(), governor=get_governor())
+
+def _create_governor():
+    from core.governor import InferenceGovernor
+    return InferenceGovernor()
+
+def provide(name: str, instance):
+    """Installs a prebuilt singleton (e.g. the stand-in node of node_router.py)."""
+    with _instances_lock:
+        _instances[name] = instance
+
+def peek(name: str):
+    """Returns a singleton only if it has already been built (health checks must not trigger construction)."""
+    return _instances.get(name)
+
+def get_telemetry():
+    return _singleton("telemetry", _create_telemetry)
+
+def get_tracer():
+    return get_telemetry().tracer
+
+def get_hw_monitor():
+    return _singleton("hw_monitor", _create_hw_monitor)
+
+def get_llm_manager():
+    return _singleton("llm_manager", _create_llm_manager)
+
+def get_vector_db():
+    return _singleton("vector_db", _create_vector_db)
 
-tracer = trace.get_tracer("cisco.foundation.sec")
+def get_assistant_service():
+    return _singleton("assistant_service", _create_assistant_service)
 
-# Initialize Langfuse - Hardcoded Keys to bypass environment loading issues
-os.environ["LANGFUSE_PUBLIC_KEY"] = "pk-lf-1234567890"
-os.environ["LANGFUSE_SECRET_KEY"] = "sk-lf-1234567890"
-os.environ["LANGFUSE_HOST"] = "http://localhost:3001"
+def get_governor():
+    return _singleton("governor", _create_governor)
 
-langfuse_client = langfuse.Langfuse()
+_LAZY_ATTRS = {
+    "telemetry": get_telemetry,
+    "tracer": get_tracer,
+    "hw_monitor": get_hw_monitor,
+    "llm_manager": get_llm_manager,
+    "vector_db": get_vector_db,
+    "assistant_service": get_assistant_service,
+    "governor": get_governor,
+}
 
+def __getattr__(name: str):
+    # Keeps the `services.llm_manager` style access working for callers
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
+_models_lock = None
 
-# Global dependencies
-hw_monitor = HardwareMonitor()
-llm_manager = LLMManager()
-vector_db = VectorDBManager(url=QDRANT_URL)
-assistant_service = AssistantService(llm_manager, vector_db)
+async def ensure_models_loaded():
+    """Loads the models and embedding setup once for callers that bypass the Chainlit start-up flow (the API)."""
+    global _models_lock
+    from core.config import MODEL_LLAMA3_PATH, MODEL_SEC_PATH
+    if _models_lock is None:
+        _models_lock = asyncio.Lock()
+    async with _models_lock:
+        manager = get_llm_manager()
+        if manager.llm_general is None or manager.llm_sec is None:
+            await asyncio.to_thread(manager.load_general_model, MODEL_LLAMA3_PATH)
+            await asyncio.to_thread(manager.load_security_model, MODEL_SEC_PATH)
+            await asyncio.to_thread(manager.load_router_model)
+            await asyncio.to_thread(get_vector_db().setup_model)
 
 # Shared state
 metrics_db = None
 _monitor_task = None
+last_hw_sample_at = None
 
 async def hardware_monitor_task():
-    global metrics_db
-    if metrics_db is None:
+    global metrics_db, last_hw_sample_at
+    # Every worker samples for its own governor, but only the first one writes the (machine-wide) series
+    if metrics_db is None and WORKER_ID in ("", "0"):
         try:
+            from core.database import MetricsDBManager
             metrics_db = MetricsDBManager(
-                url=INFLUXDB_URL, token=INFLUXDB_TOKEN, 
+                url=INFLUXDB_URL, token=INFLUXDB_TOKEN,
                 org=INFLUXDB_ORG, bucket=INFLUXDB_BUCKET
             )
             logger.info("✅ Connected to InfluxDB v3 for hardware monitoring.")
         except Exception as e:
             logger.error(f"❌ InfluxDB Connection error: {e}")
 
+    hw_monitor = await asyncio.to_thread(get_hw_monitor)
+    governor = get_governor()
     while True:
         try:
             stats = await asyncio.to_thread(hw_monitor.get_stats)
             _latest_hw_stats_ref.update(stats)
+            last_hw_sample_at = time.time()
+            governor.observe(stats)
             if metrics_db:
                 await asyncio.to_thread(metrics_db.write_hardware_stats, stats)
         except Exception as e:
@@ -0,0 +1,48 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import collections
+import time
+import typing
+from core.config import API_MAX_SESSIONS, API_SESSION_TTL, API_SESSION_MAX_TURNS
+
+class SessionStore:
+    """In-memory multi-turn history for headless API clients, bounded by session count, idle time and turns."""
+    def __init__(self, max_sessions: int = API_MAX_SESSIONS, ttl: float = API_SESSION_TTL,
+                 max_turns: int = API_SESSION_MAX_TURNS):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.max_turns = max(1, max_turns)
+        self._sessions: collections.OrderedDict = collections.OrderedDict()
+        self._locks: typing.Dict[str, asyncio.Lock] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (touched, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - touched <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            lock = self._locks.get(session_id)
+            if lock is not None and not lock.locked():
+                del self._locks[session_id]
+
+    def history(self, session_id: str) -> list:
+        self._expire()
+        entry = self._sessions.get(session_id)
+        return list(entry[1]) if entry else []
+
+    def append(self, session_id: str, user_content: str, assistant_content: str):
+        history = self.history(session_id)
+        history.extend([{"role": "user", "content": user_content}, {"role": "assistant", "content": assistant_content}])
+        self._sessions[session_id] = (time.monotonic(), history[-2 * self.max_turns:])
+        self._sessions.move_to_end(session_id)
+        self._expire()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Turns of one session run one at a time so each sees the previous answer in its history."""
+        if session_id not in self._locks:
+            self._locks[session_id] = asyncio.Lock()
+        return self._locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
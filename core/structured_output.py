@@ -0,0 +1,98 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import json
+import typing
+from core.config import STRUCTURED_OUTPUT_MAX_ITEMS
+
+SEVERITIES = ["critical", "high", "medium", "low", "info"]
+
+# Grammar for structured security analyses (STRUCTURED_OUTPUT_ENABLED). llama.cpp compiles the schema
+# to a GBNF grammar, so the model can only emit this object: properties in this order, bounded
+# lists and strings, and a fixed severity vocabulary.
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "maxLength": 400},
+        "root_causes": {"type": "array", "items": {"type": "string", "maxLength": 200},
+                        "minItems": 1, "maxItems": STRUCTURED_OUTPUT_MAX_ITEMS},
+        "mitigations": {"type": "array", "items": {"type": "string", "maxLength": 200},
+                        "minItems": 1, "maxItems": STRUCTURED_OUTPUT_MAX_ITEMS},
+        "severity": {"type": "string", "enum": SEVERITIES},
+    },
+    "required": ["summary", "root_causes", "mitigations", "severity"],
+}
+
+def response_format() -> dict:
+    """The response_format both llama-cpp-python and llama-server turn into a grammar."""
+    return {"type": "json_object", "schema": ANALYSIS_SCHEMA}
+
+def close_partial_json(text: str) -> str:
+    """Closes the open string, arrays and objects of a JSON prefix (it may still be invalid, e.g. after a key)."""
+    closers, in_string, escape = [], False, False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text = (text[:-1] if escape else text) + '"'
+    return text + "".join(reversed(closers))
+
+def parse_analysis(text: str) -> typing.Optional[dict]:
+    """The analysis object, or None when the output is not a complete analysis (e.g. cut off or cancelled)."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("summary"), str):
+        return None
+    analysis = {"summary": data["summary"].strip()}
+    for key in ("root_causes", "mitigations"):
+        items = data.get(key)
+        if not isinstance(items, list):
+            return None
+        analysis[key] = [str(item).strip() for item in items if str(item).strip()]
+    severity = str(data.get("severity", "")).lower()
+    analysis["severity"] = severity if severity in SEVERITIES else None
+    return analysis
+
+def render_markdown(data: dict) -> str:
+    """Markdown in the Summary/RCA/Mitigation layout of the prose prompt; also renders partial objects."""
+    parts = []
+    if "summary" in data:
+        parts.append(f"**Summary**: {data['summary']}")
+    for key, label in (("root_causes", "RCA"), ("mitigations", "Mitigation")):
+        if key in data:
+            parts.append(f"**{label}**:" + "".join(f"\n- {item}" for item in data[key]))
+    if data.get("severity"):
+        parts.append(f"**Severity**: {str(data['severity']).upper()}")
+    return "\n\n".join(parts)
+
+class MarkdownStream:
+    """Turns streamed JSON into streamed markdown: feed() returns the markdown added by each raw chunk."""
+    def __init__(self):
+        self.raw = ""
+        self.text = ""
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        try:
+            data = json.loads(close_partial_json(self.raw))
+        except ValueError:
+            return ""
+        if not isinstance(data, dict):
+            return ""
+        rendered = render_markdown(data)
+        # Fields arrive in schema order, so the rendering only grows; anything else waits for the final text
+        if not rendered.startswith(self.text):
+            return ""
+        delta, self.text = rendered[len(self.text):], rendered
+        return delta
@@ -0,0 +1,187 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import contextlib
+import contextvars
+import typing
+import uuid
+from core.config import (
+    LANGFUSE_HOST,
+    LANGFUSE_PUBLIC_KEY,
+    LANGFUSE_SECRET_KEY,
+    PHOENIX_OTLP_ENDPOINT,
+    TELEMETRY_ENABLED,
+    TELEMETRY_SAMPLE_RATIO,
+    TELEMETRY_MODEL_SAMPLE_RATIOS,
+    TELEMETRY_QUEUE_SIZE,
+    TELEMETRY_BATCH_SIZE,
+    TELEMETRY_FLUSH_INTERVAL,
+    TELEMETRY_EXPORT_TIMEOUT
+)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("telemetry_trace", default=None)
+
+def _sampled(trace_id: str, ratio: float) -> bool:
+    """Deterministic head sampling on the trace id, so every record of a trace gets the same decision."""
+    if ratio >= 1.0:
+        return True
+    if ratio <= 0.0:
+        return False
+    return (uuid.UUID(trace_id).int % 10_000) < ratio * 10_000
+
+def _create_langfuse_client():
+    from langfuse import Langfuse
+    from opentelemetry.sdk.trace import TracerProvider
+    # The SDK batches and exports from its own thread: flush every TELEMETRY_BATCH_SIZE observations or
+    # TELEMETRY_FLUSH_INTERVAL seconds. Its own TracerProvider keeps Langfuse observations and Phoenix
+    # spans apart, and sampling stays with Telemetry so the SDK sample_rate is left at 1.0.
+    return Langfuse(
+        public_key=LANGFUSE_PUBLIC_KEY,
+        secret_key=LANGFUSE_SECRET_KEY,
+        host=LANGFUSE_HOST,
+        flush_at=TELEMETRY_BATCH_SIZE,
+        flush_interval=TELEMETRY_FLUSH_INTERVAL,
+        timeout=max(1, int(TELEMETRY_EXPORT_TIMEOUT)),
+        tracer_provider=TracerProvider(),
+    )
+
+class Telemetry:
+    """Single telemetry layer for Langfuse (trace/generation observations) and Phoenix (OpenTelemetry spans).
+
+    Both paths export from background threads (the Langfuse SDK's batch processor and Phoenix's
+    BatchSpanProcessor), and both sample on the Langfuse trace id: Phoenix spans opened inside trace()
+    keep the global ratio, Langfuse observations apply the optional per-model ratio on top. _sampled
+    thresholds the same id, so every trace exported to Langfuse also has its Phoenix spans.
+    """
+    def __init__(self, enabled: bool = TELEMETRY_ENABLED, sample_ratio: float = TELEMETRY_SAMPLE_RATIO,
+                 model_sample_ratios: dict = None, client=None):
+        self.enabled = enabled
+        self.sample_ratio = sample_ratio
+        self.model_sample_ratios = TELEMETRY_MODEL_SAMPLE_RATIOS if model_sample_ratios is None else model_sample_ratios
+        self._client = client
+        if enabled and client is None:
+            self._client = _create_langfuse_client()
+        self._tracer = None
+        self.traces = 0
+        self.generations = 0
+        self.unsampled = 0
+
+    @property
+    def tracer(self):
+        if self._tracer is None:
+            self._tracer = self._create_tracer()
+        return self._tracer
+
+    def _create_tracer(self):
+        # Initialize Arize Phoenix OpenTelemetry tracing
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        telemetry = self
+
+        class TraceSampler(Sampler):
+            """Root spans inside trace() follow the Langfuse trace id's decision; others use the plain ratio."""
+            def __init__(self):
+                self._fallback = TraceIdRatioBased(telemetry.sample_ratio if telemetry.enabled else 0.0)
+
+            def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None,
+                              trace_state=None):
+                state = _current_trace.get()
+                if state is None:
+                    return self._fallback.should_sample(parent_context, trace_id, name, kind, attributes, links,
+                                                        trace_state)
+                if not telemetry._should_record(state["id"]):
+                    return SamplingResult(Decision.DROP, None, trace_state)
+                return SamplingResult(Decision.RECORD_AND_SAMPLE, {"langfuse.trace_id": state["id"]}, trace_state)
+
+            def get_description(self) -> str:
+                return "LangfuseTraceSampler"
+
+        trace_provider = TracerProvider(sampler=ParentBased(TraceSampler()))
+        # Phoenix OTLP HTTP endpoint is often on the same port as the UI (6006) in recent versions
+        exporter = OTLPSpanExporter(endpoint=PHOENIX_OTLP_ENDPOINT, timeout=TELEMETRY_EXPORT_TIMEOUT)
+        trace_provider.add_span_processor(BatchSpanProcessor(
+            exporter,
+            max_queue_size=TELEMETRY_QUEUE_SIZE,
+            max_export_batch_size=TELEMETRY_BATCH_SIZE,
+            schedule_delay_millis=int(TELEMETRY_FLUSH_INTERVAL * 1000),
+            export_timeout_millis=int(TELEMETRY_EXPORT_TIMEOUT * 1000),
+        ))
+        trace.set_tracer_provider(trace_provider)
+        return trace.get_tracer("cisco.foundation.sec")
+
+    def _should_record(self, trace_id: str, model: str = None) -> bool:
+        if not self.enabled:
+            return False
+        ratio = self.sample_ratio * self.model_sample_ratios.get(model, 1.0) if model else self.sample_ratio
+        return _sampled(trace_id, ratio)
+
+    @contextlib.contextmanager
+    def trace(self, name: str, input: typing.Any = None, metadata: dict = None):
+        """Opens a trace for the current request; generations inside it attach to the trace id.
+
+        The root observation starts here so Langfuse shows real timings, but it is only ended (and
+        exported) if the trace is still sampled on exit; an unended observation is simply dropped.
+        """
+        state = {"id": uuid.uuid4().hex, "name": name, "input": input, "metadata": dict(metadata or {}),
+                 "output": None, "sampled": None, "span": None}
+        if self._client is not None and self._should_record(state["id"]):
+            state["span"] = self._client.start_span(trace_context={"trace_id": state["id"]}, name=name,
+                                                    input=input, metadata=state["metadata"])
+        token = _current_trace.set(state)
+        try:
+            yield state
+        finally:
+            _current_trace.reset(token)
+            sampled = state.get("sampled")
+            if sampled is None:
+                sampled = self._should_record(state["id"])
+            span = state["span"]
+            if span is not None and sampled:
+                span.update_trace(name=name, input=input, output=state["output"], metadata=state["metadata"])
+                span.update(output=state["output"]).end()
+                self.traces += 1
+            elif span is not None:
+                self.unsampled += 1
+
+    def set_trace_output(self, output: typing.Any):
+        state = _current_trace.get()
+        if state is not None:
+            state["output"] = output
+
+    def start_generation(self, name: str, model: str, input: typing.Any, metadata: dict = None):
+        """Opens a Langfuse generation at the real start of decoding; None when it is not recorded.
+
+        Pass the result to finish_generation with the final text (never per-token chunks).
+        """
+        state = _current_trace.get()
+        trace_id = state["id"] if state else uuid.uuid4().hex
+        # The first generation's model decides for the whole trace so traces are never exported half-sampled
+        sampled = state["sampled"] if state and state["sampled"] is not None else self._should_record(trace_id, model)
+        if state is not None:
+            state["sampled"] = sampled
+        if self._client is None or not sampled:
+            return None
+        trace_context = {"trace_id": trace_id}
+        if state is not None and state["span"] is not None:
+            trace_context["parent_span_id"] = state["span"].id
+        return self._client.start_observation(trace_context=trace_context, name=name, as_type="generation",
+                                              model=model, input=input, metadata=metadata)
+
+    def finish_generation(self, generation, output: str, usage: dict = None, metadata: dict = None):
+        if generation is None:
+            return
+        usage = usage or {}
+        generation.update(output=output, metadata=metadata,
+                          usage_details={"input": usage.get("prompt", 0), "output": usage.get("completion", 0),
+                                         "total": usage.get("total", 0)})
+        generation.end()
+        self.generations += 1
+
+    def stats(self) -> dict:
+        return {"traces": self.traces, "generations": self.generations, "unsampled": self.unsampled}
+
+    def shutdown(self):
+        if self._client is not None:
+            self._client.shutdown()
@@ -0,0 +1,102 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import datetime
+import json
+import os
+import platform
+import typing
+from core.config import LLM_TUNING_PROFILE_PATH
+from core.logger import logger
+
+# llama.cpp runtime parameters a calibration profile may set
+TUNED_PARAMS = ("n_gpu_layers", "n_threads", "n_threads_batch", "n_batch", "n_ubatch")
+
+# Reference request the candidates are ranked on: a typical security prompt (system + RAG + logs)
+# and a typical answer length. Lower estimated seconds wins.
+REFERENCE_PROMPT_TOKENS = 768
+REFERENCE_COMPLETION_TOKENS = 256
+
+# Standard prompt set used to measure prefill and decode rates
+CALIBRATION_PROMPTS = [
+    "Explain in two sentences what a SYN flood is.",
+    "Summarize the risk of this log line and suggest one mitigation:\n"
+    "Failed password for invalid user admin from 203.0.113.7 port 52211 ssh2",
+    "You are a SOC analyst. Review the following authentication events and list the suspicious ones:\n"
+    + "\n".join(
+        f"Jan 12 10:{i:02d}:0{i % 10} bastion sshd[{4100 + i}]: Failed password for root from 198.51.100.{i % 7 + 1} port {40000 + i * 13} ssh2"
+        for i in range(24)
+    ),
+]
+
+def machine_key() -> str:
+    """Same identity as the hardware probe cache: a profile is only valid on the machine that measured it."""
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}"
+
+def model_key(path: str) -> str:
+    """Identifies a GGUF by file name and size, so a re-downloaded quantization is re-calibrated."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    return f"{os.path.basename(path)}|{size}"
+
+def estimate_seconds(prefill_tps: float, decode_tps: float,
+                     prompt_tokens: int = REFERENCE_PROMPT_TOKENS,
+                     completion_tokens: int = REFERENCE_COMPLETION_TOKENS) -> float:
+    if prefill_tps <= 0 or decode_tps <= 0:
+        return float("inf")
+    return prompt_tokens / prefill_tps + completion_tokens / decode_tps
+
+def thread_candidates(cpu_count: int, p_cores: int) -> typing.List[int]:
+    """Thread counts worth trying: performance cores only, half the CPUs, and all CPUs."""
+    cpu_count = max(1, cpu_count or 1)
+    p_cores = p_cores if 0 < (p_cores or 0) <= cpu_count else cpu_count
+    candidates = {p_cores, max(1, p_cores // 2), max(1, cpu_count // 2), cpu_count, max(1, p_cores - 1)}
+    return sorted(candidates)
+
+def gpu_layer_candidates(block_count: int) -> typing.List[int]:
+    """-1 offloads everything; partial offloads help when unified memory is contended."""
+    if block_count <= 0:
+        return [-1, 0]
+    return [-1, block_count * 3 // 4, block_count // 2, 0]
+
+def batch_candidates(context_size: int) -> typing.List[typing.Tuple[int, int]]:
+    """(n_batch, n_ubatch) pairs; n_ubatch never exceeds n_batch and n_batch never exceeds the context."""
+    pairs = []
+    for n_batch in (256, 512, 1024, 2048):
+        if n_batch > max(256, context_size):
+            continue
+        for n_ubatch in (128, 256, 512):
+            if n_ubatch <= n_batch:
+                pairs.append((n_batch, n_ubatch))
+    return pairs
+
+def load_profile(path: str = LLM_TUNING_PROFILE_PATH) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if profile.get("machine") != machine_key():
+        logger.info(f"Ignoring llama tuning profile from another machine ({profile.get('machine')})")
+        return {}
+    return profile
+
+def tuned_params(model_path: str, path: str = LLM_TUNING_PROFILE_PATH) -> dict:
+    """Returns the calibrated llama.cpp parameters for a model on this machine, or {} when not calibrated."""
+    entry = load_profile(path).get("models", {}).get(model_key(model_path))
+    if not entry:
+        return {}
+    return {k: entry[k] for k in TUNED_PARAMS if entry.get(k) is not None}
+
+def save_model_result(model_path: str, params: dict, metrics: dict, path: str = LLM_TUNING_PROFILE_PATH):
+    """Merges one model's calibrated parameters into the machine profile."""
+    profile = load_profile(path) or {"machine": machine_key(), "models": {}}
+    entry = {k: params[k] for k in TUNED_PARAMS if k in params}
+    entry.update(metrics)
+    entry["calibrated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    profile.setdefault("models", {})[model_key(model_path)] = entry
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,112 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import os
+import sys
+import time
+import typing
+import httpx
+from core.config import MODEL_ROLES, LLM_USE_MMAP, LLM_THREADS
+from core.logger import logger
+from core.memory_profiles import resolve_profile, runtime_settings
+
+def worker_plan(workers: int, base_port: int, cpu_count: typing.Optional[int] = None) -> typing.List[dict]:
+    """Ports and environment of each worker. Cores are split between workers unless LLM_THREADS is set."""
+    workers = max(1, workers)
+    cpu_count = cpu_count or os.cpu_count() or 4
+    threads = LLM_THREADS if LLM_THREADS > 0 else max(1, cpu_count // workers)
+    return [{"id": i, "name": f"worker{i}", "port": base_port + i,
+             "env": {"WORKER_ID": str(i), "LLM_THREADS": str(threads)}} for i in range(workers)]
+
+def shared_weight_bytes() -> int:
+    """Size of the local GGUF files every worker maps (counted once: the page cache holds one copy)."""
+    total = 0
+    for cfg in MODEL_ROLES.values():
+        if cfg["backend"] == "llama_cpp" and cfg["path"] and os.path.exists(cfg["path"]):
+            total += os.path.getsize(cfg["path"])
+    return total
+
+def memory_note(workers: int, profile: typing.Optional[str] = None) -> str:
+    gb = shared_weight_bytes() / 1024 ** 3
+    profile = profile or resolve_profile()
+    use_mlock = runtime_settings("general", profile)["use_mlock"]
+    if not LLM_USE_MMAP:
+        # Without mmap each process reads the weights into its own memory
+        return (f"LLM_USE_MMAP=false (memory profile '{profile}'): every worker keeps a private copy of the "
+                f"weights (~{gb * workers:.1f} GB for {workers} workers)")
+    note = f"{gb:.1f} GB of weights mmap'd and shared by {workers} workers; each adds only its own KV cache"
+    if use_mlock:
+        # mlock pins the shared page-cache pages: still one copy, it just can never be paged out
+        note += f"; mlock pins that one copy (~{gb:.1f} GB) in RAM"
+    return f"{note} (memory profile '{profile}')"
+
+def worker_command(port: int) -> typing.List[str]:
+    return [sys.executable, "-m", "chainlit", "run", "main.py", "--headless", "--host", "127.0.0.1", "--port", str(port)]
+
+class WorkerSupervisor:
+    """Starts the worker processes, warms them up, and restarts any that exit."""
+    def __init__(self, plan: typing.List[dict], command: typing.Callable[[int], typing.List[str]] = worker_command,
+                 warmup_timeout: float = 900.0, max_backoff: float = 30.0):
+        self.plan = plan
+        self.command = command
+        self.warmup_timeout = warmup_timeout
+        self.max_backoff = max_backoff
+        self.procs: typing.Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts = {w["id"]: 0 for w in plan}
+        self._stopping = False
+        self._tasks: typing.List[asyncio.Task] = []
+
+    async def _spawn(self, worker: dict):
+        env = {**os.environ, **worker["env"]}
+        self.procs[worker["id"]] = await asyncio.create_subprocess_exec(*self.command(worker["port"]), env=env)
+        logger.info(f"Started {worker['name']} (pid {self.procs[worker['id']].pid}) on port {worker['port']}")
+
+    async def _warm_up(self, worker: dict):
+        """Waits for the worker's server, then has it load its models (the router only sends work to loaded nodes)."""
+        url = f"http://127.0.0.1:{worker['port']}/api/warmup"
+        deadline = time.monotonic() + self.warmup_timeout
+        async with httpx.AsyncClient(timeout=self.warmup_timeout) as client:
+            while time.monotonic() < deadline and not self._stopping:
+                try:
+                    resp = await client.post(url)
+                    if resp.status_code == 200:
+                        logger.info(f"{worker['name']} is warm")
+                        return True
+                    logger.warning(f"{worker['name']} warm-up answered {resp.status_code}, retrying")
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(1.0)
+        logger.error(f"{worker['name']} did not warm up within {self.warmup_timeout:.0f}s")
+        return False
+
+    async def _supervise(self, worker: dict):
+        backoff = 1.0
+        while not self._stopping:
+            await self._spawn(worker)
+            started = time.monotonic()
+            warm = asyncio.create_task(self._warm_up(worker))
+            code = await self.procs[worker["id"]].wait()
+            warm.cancel()
+            if self._stopping:
+                return
+            # A worker that stayed up for a while gets a fast restart; a crash loop backs off
+            backoff = 1.0 if time.monotonic() - started > 60 else min(backoff * 2, self.max_backoff)
+            self.restarts[worker["id"]] += 1
+            logger.warning(f"{worker['name']} exited with code {code}; restarting in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._supervise(w)) for w in self.plan]
+
+    async def stop(self, grace: float = 10.0):
+        self._stopping = True
+        for proc in self.procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+        for proc in self.procs.values():
+            try:
+                await asyncio.wait_for(proc.wait(), grace)
+            except asyncio.TimeoutError:
+                proc.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,53 +1,73 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
-import os
-import requests
+# Health check CLI: asks the running app for /health/deep (models, queues, dependency latency).
+# When the app is not reachable, probes the dependencies directly and concurrently instead.
+# Usage: python health_check.py [--url http://localhost:8000] [--json] [--timeout 0.5]
+# Exit code: 0 ready, 1 degraded/unavailable.
+import argparse
 import asyncio
-from langfuse import Langfuse
-from dotenv import load_dotenv
+import json
+import sys
+import httpx
 
-load_dotenv()
+from core.config import HEALTH_PROBE_TIMEOUT
+from core.health import DEPENDENCIES, probe_dependencies
 
-def check_service(name, url):
+# Grafana is not an app dependency, but on-call wants to see it next to the rest of the stack
+EXTRA_DEPENDENCIES = [("grafana", "http://localhost:3000/api/health", False)]
+
+def fetch_app_report(url: str, timeout: float):
     try:
-        resp = requests.get(url, timeout=3)
-        if resp.status_code < 400:
-            print(f"✅ {name:15} | Running | {url}")
-            return True
-        else:
-            print(f"⚠️  {name:15} | Warning | {url} (Status: {resp.status_code})")
-            return False
-    except Exception:
-        print(f"❌ {name:15} | Offline | {url}")
-        return False
-
-print("=== Cisco Ecosystem Health Check ===")
-services = [
-    ("Qdrant", "http://localhost:6333/readyz"),
-    ("InfluxDB", "http://localhost:8181/ping"),
-    ("Grafana", "http://localhost:3000/api/health"),
-    ("Langfuse UI", "http://localhost:3001/api/public/health"),
-    ("Phoenix UI", "http://localhost:6006"),
-]
-
-all_up = True
-for name, url in services:
-    if not check_service(name, url):
-        all_up = False
-
-print("\n--- Langfuse Auth Check ---")
-try:
-    lf = Langfuse(
-        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-        host=os.getenv("LANGFUSE_HOST")
-    )
-    # Using a simple check that doesn't trigger the Pydantic error if possible
-    print(f"✅ Langfuse Host: {os.getenv('LANGFUSE_HOST')}")
-    print("✅ Langfuse Keys configured.")
-except Exception as e:
-    print(f"❌ Langfuse Config error: {e}")
-
-if all_up:
-    print("\n🚀 All servers are contributing to the ecosystem!")
-else:
-    print("\n⚠️  Some services are down. Check Docker logs.")
+        # The app runs its probes with their own timeout; allow for that plus the round trip
+        resp = httpx.get(f"{url.rstrip('/')}/health/deep", timeout=timeout + 1.0)
+    except httpx.HTTPError:
+        return None
+    if resp.status_code not in (200, 503):
+        return None
+    return resp.json()
+
+def print_report(report: dict, source: str):
+    print(f"=== Cisco Ecosystem Health Check ({source}) ===")
+    if "status" in report:
+        print(f"Status: {report['status']} (ready={report['ready']}, {report['elapsed_ms']} ms)")
+    for dep in report["dependencies"].values():
+        icon = "✅" if dep["ok"] else ("❌" if dep["required"] else "⚠️ ")
+        detail = f"HTTP {dep['status']}" if dep["status"] is not None else dep["error"]
+        print(f"{icon} {dep['name']:10} | {dep['latency_ms']:7.1f} ms | {detail} | {dep['url']}")
+    for role, model in report.get("models", {}).items():
+        state = "loaded" if model["loaded"] else "not loaded"
+        extra = f" ({model.get('backend')}, busy={model.get('busy')}, waiting={model.get('waiting')})" if model["loaded"] else ""
+        print(f"{'🧠' if model['loaded'] else '⏳'} model {role:8} | {state}{extra}")
+    for name, depth in report.get("queues", {}).items():
+        print(f"📥 queue {name:11} | {depth}")
+    for name, breaker in report.get("breakers", {}).items():
+        icon = {"closed": "🟢", "half_open": "🟡"}.get(breaker["state"], "🔴")
+        retry = f", probe in {breaker['probe_in_s']}s" if breaker["probe_in_s"] is not None else ""
+        print(f"{icon} breaker {name:9} | {breaker['state']}{retry} "
+              f"(short-circuited {breaker['short_circuited']}, trips {breaker['trips']})")
+    if "hardware" in report:
+        age = report["hardware"]["last_sample_age_s"]
+        print(f"🌡️  hardware sample | {'never' if age is None else f'{age}s ago'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Deep health check for the assistant and its dependencies.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the running app")
+    parser.add_argument("--timeout", type=float, default=HEALTH_PROBE_TIMEOUT, help="Per-probe timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON report")
+    args = parser.parse_args()
+
+    report = fetch_app_report(args.url, args.timeout)
+    source = args.url
+    if report is None:
+        # App down: still tell on-call which dependencies are up
+        dependencies = asyncio.run(probe_dependencies(DEPENDENCIES + EXTRA_DEPENDENCIES, timeout=args.timeout))
+        report = {"ready": False, "app_reachable": False, "dependencies": dependencies}
+        source = "direct probes, app unreachable"
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, source)
+    sys.exit(0 if report.get("ready") else 1)
+
+if __name__ == "__main__":
+    main()
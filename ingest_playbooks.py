@@ -0,0 +1,38 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Bulk playbook ingestion: streams a JSONL (or JSON array) corpus into Qdrant with parallel embedding.
+# Usage: python ingest_playbooks.py vendor_kb.jsonl --workers 4 --batch-size 256
+# Records need "id" and "content"; "title" is optional. Re-running upserts the same ids in place.
+import argparse
+import sys
+
+from core.config import (
+    QDRANT_URL, PLAYBOOKS_PATH, INGEST_BATCH_SIZE, INGEST_WORKERS,
+    INGEST_UPSERT_CONCURRENCY, INGEST_MAX_PENDING_BATCHES
+)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a playbook corpus into the Qdrant collection.")
+    parser.add_argument("paths", nargs="*", default=[PLAYBOOKS_PATH], help="JSONL or JSON array files (default: playbooks.json)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Documents per embedding/upsert batch")
+    parser.add_argument("-w", "--workers", type=int, default=INGEST_WORKERS, help="Embedding processes (0 = in-process)")
+    parser.add_argument("--upsert-concurrency", type=int, default=INGEST_UPSERT_CONCURRENCY, help="Concurrent Qdrant upserts")
+    parser.add_argument("--max-pending", type=int, default=INGEST_MAX_PENDING_BATCHES,
+                        help="Batches in flight per stage (bounds memory)")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5", help="fastembed model (must match the app)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    from core.database import VectorDBManager
+    from core.ingest import PlaybookIngestor
+
+    vector_db = VectorDBManager(url=QDRANT_URL)
+    vector_db.setup_model(args.model)
+    ingestor = PlaybookIngestor(
+        vector_db.client, vector_db.collection_name, batch_size=args.batch_size, workers=args.workers,
+        upsert_concurrency=args.upsert_concurrency, max_pending=args.max_pending, report_every=args.report_every
+    )
+    for path in args.paths:
+        stats = ingestor.run(path)
+        print(f"[ingest] {path}: {stats.summary()}", file=sys.stderr)
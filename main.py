@@ -3,25 +3,17 @@ import asyncio
 import os
 import engineio
 import chainlit as cl
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from langfuse import observe
 
 # Import our separated modules
 from core.i18n import _t, get_lang_name
+from core.langid import StreamingLanguageDetector, translation_plan as plan_translation
+from core.cancellation import CancellationToken
 from core.config import (
     MODEL_SEC_PATH, MODEL_LLAMA3_PATH, PLAYBOOKS_PATH
 )
 from core.logger import logger
-from langfuse import Langfuse
 import core.services as services
 
-# Explicitly initialize Langfuse to ensure host matches
-langfuse_client = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_HOST")
-)
 # Ensure API routes are loaded
 import api
 
@@ -67,6 +59,8 @@ async def on_chat_start():
             loading_msg.content = msg
             await loading_msg.update()
             await asyncio.to_thread(loader, path)
+        # Optional dedicated intent router (falls back to the general model when not configured)
+        await asyncio.to_thread(services.llm_manager.load_router_model)
 
         msg = _t("### ⚙️ Loading (3/4): Initializing Vector Database...", lang=lang_param)
         loading_msg.content = msg
@@ -90,18 +84,44 @@ async def on_chat_start():
 
     cl.user_session.set("chat_history", [])
 
+def _cancel_running(reason: str):
+    token = cl.user_session.get("cancel_token")
+    if token is not None:
+        token.cancel(reason)
+
+@cl.on_stop
+async def on_stop():
+    # Chainlit cancels the message task too; the token also covers work running outside that task
+    _cancel_running("stopped")
+
+@cl.on_chat_end
+async def on_chat_end():
+    # Tab closed / socket disconnected: nobody is left to read the answer
+    _cancel_running("disconnected")
+
 @cl.on_message
-@observe()
 async def main(message: cl.Message):
+    # Telemetry is recorded with final texts and exported in the background; nothing here waits on Langfuse/Phoenix
+    with services.telemetry.trace("Chat Message", input=message.content.strip(), metadata={"lang": cl.user_session.get("lang", "en")}):
+        await handle_message(message.content.strip())
+
+async def handle_message(user_input: str, fresh: bool = False):
     chat_history = cl.user_session.get("chat_history", [])
-    user_input = message.content.strip()
     lang = cl.user_session.get("lang", "en")
     target_lang_name = get_lang_name(lang)
 
     # Main Response Generation
     response_msg = cl.Message(content="", author="System")
     assistant_full_text = ""
+    history_input = user_input
+    header = ""
     is_sec = False
+    precomputed = None
+    lang_detector = StreamingLanguageDetector()
+    # A new message supersedes whatever this session was still generating
+    _cancel_running("superseded")
+    cancel_token = CancellationToken()
+    cl.user_session.set("cancel_token", cancel_token)
 
     # Start Phoenix Trace with Hardware context
     with services.tracer.start_as_current_span(f"Chat Generation: {user_input[:20]}...") as span:
@@ -112,68 +132,125 @@ async def main(message: cl.Message):
             span.set_attribute("hw.ram_pct", hw_stats.get("ram_pct", 0))
             span.set_attribute("hw.total_power_w", hw_stats.get("total_power_w", 0))
 
-        async for chunk in services.assistant_service.generate_response(user_input, chat_history, target_lang=target_lang_name):
-            if chunk["type"] == "meta":
-                response_msg.author = chunk["author"]
-                msg = _t("### 🧠 Generated by `{author}`\n---\n", lang=lang, author=chunk["author"])
-                response_msg.content = msg
-                is_sec = chunk["is_security"]
-                span.set_attribute("llm.author", chunk["author"])
-                await response_msg.send()
-            elif chunk["type"] == "token":
-                assistant_full_text += chunk["content"]
-                await response_msg.stream_token(chunk["content"])
-            elif chunk["type"] == "final":
-                in_label = _t("In", lang=lang)
-                out_label = _t("Out", lang=lang)
-                token_info = (
-                    f"\n\n---\n*⚡ Tokens: {chunk['tokens']['total']} "
-                    f"({in_label}: {chunk['tokens']['prompt']} | {out_label}: {chunk['tokens']['completion']}) "
-                    f"· 🕐 {chunk['elapsed']:.1f}s*"
-                )
-                await response_msg.stream_token(token_info)
-                await response_msg.update()
-
-    # Language Detection Utility
-    def contains_chinese(text):
-        return any('\u4e00' <= char <= '\u9fff' for char in text)
-
-    # Decision logic: Only translate if security response is NOT in the user's target language
-    needs_translation = False
-    if is_sec and target_lang_name != "English":
-        needs_translation = True
-
-    if needs_translation:
+        responses = services.assistant_service.generate_response(user_input, chat_history, target_lang=target_lang_name,
+                                                                 cancel_token=cancel_token, fresh=fresh)
+        try:
+            async for chunk in responses:
+                if chunk["type"] == "meta":
+                    response_msg.author = chunk["author"]
+                    header = _t("### 🧠 Generated by `{author}`\n---\n", lang=lang, author=chunk["author"])
+                    response_msg.content = header
+                    is_sec = chunk["is_security"]
+                    # Keep the compacted/stubbed input in history so follow-up turns stay within the context window
+                    history_input = chunk.get("history_input", user_input)
+                    span.set_attribute("llm.author", chunk["author"])
+                    await response_msg.send()
+                elif chunk["type"] == "progress":
+                    # Long input mode: show map/merge progress until the merged answer starts streaming
+                    progress = _t("⏳ Analyzing long input: segment {done}/{total}...", lang=lang, done=chunk["done"], total=chunk["total"])
+                    response_msg.content = header + progress
+                    await response_msg.update()
+                elif chunk["type"] == "token":
+                    if not assistant_full_text and response_msg.content != header:
+                        response_msg.content = header
+                        await response_msg.update()
+                    assistant_full_text += chunk["content"]
+                    lang_detector.feed(chunk["content"])
+                    await response_msg.stream_token(chunk["content"])
+                elif chunk["type"] == "final":
+                    in_label = _t("In", lang=lang)
+                    out_label = _t("Out", lang=lang)
+                    token_info = (
+                        f"\n\n---\n*⚡ Tokens: {chunk['tokens']['total']} "
+                        f"({in_label}: {chunk['tokens']['prompt']} | {out_label}: {chunk['tokens']['completion']}) "
+                        f"· 🕐 {chunk['elapsed']:.1f}s*"
+                    )
+                    if chunk.get("speculative"):
+                        spec = chunk["speculative"]
+                        token_info += f" *· 🎯 Draft: {spec['accepted']}/{spec['drafted']} ({spec['acceptance_rate']:.0%})*"
+                    if chunk.get("cancelled"):
+                        token_info += " *· ⏹️ " + _t("Stopped", lang=lang) + "*"
+                    if "structured" in chunk:
+                        # Structured mode: show the final rendering of the parsed analysis
+                        assistant_full_text = chunk["full_content"]
+                        response_msg.content = header + assistant_full_text
+                    if chunk.get("loop"):
+                        # Replace the streamed text with the trimmed answer (the repeated tail is dropped)
+                        assistant_full_text = chunk["full_content"]
+                        response_msg.content = header + assistant_full_text
+                        token_info += " *· 🔁 " + _t("Repetition stopped", lang=lang) + "*"
+                    if chunk.get("precomputed"):
+                        # Served from the playbook's stored answer; offer a full model run instead
+                        precomputed = chunk["precomputed"]
+                        token_info += " *· 📚 " + _t("Precomputed answer: {title}", lang=lang, title=precomputed["title"]) + "*"
+                        response_msg.actions = [cl.Action(name="fresh_analysis", payload={"input": user_input},
+                                                          description=_t("Run a fresh analysis", lang=lang))]
+                    await response_msg.stream_token(token_info)
+                    await response_msg.update()
+        finally:
+            # Closing the generator releases the model even when this task was cancelled mid-stream
+            await responses.aclose()
+
+    # Decision logic: Only translate the parts of a security response that are NOT in the user's target language
+    translation_plan = []
+    stored_translation = (precomputed or {}).get("translation")
+    if stored_translation and not cancel_token.cancelled:
+        # The playbook's translation was generated offline with the answer
+        await cl.Message(content=_t("### 🧠 Translated by `{author}`\n---\n", lang=lang, author="Llama3-Taiwan")
+                         + stored_translation["content"], author="Translator").send()
+    elif is_sec and target_lang_name != "English" and not cancel_token.cancelled:
+        translation_plan = plan_translation(assistant_full_text, lang, detected=lang_detector.decision)
+        if not translation_plan:
+            logger.info(f"Response already in {target_lang_name}, skipping translation.")
+
+    if translation_plan:
         trans_msg = cl.Message(content=_t("\n\n> 🔄 *Translating...*\n\n", lang=lang), author="Translator")
         await trans_msg.send()
         trans_full_text = ""
-        
-        async for chunk in services.assistant_service.translate_response(assistant_full_text, target_lang_name):
-            if chunk["type"] == "meta":
-                trans_msg.content = _t("### 🧠 Translated by `{author}`\n---\n", lang=lang, author="Llama3-Taiwan")
-                await trans_msg.update()
-            elif chunk["type"] == "token":
-                trans_full_text += chunk["content"]
-                await trans_msg.stream_token(chunk["content"])
-            elif chunk["type"] == "final":
-                token_info = (
-                    f"\n\n---\n*⚡ Tokens: {chunk['tokens']['total']} "
-                    f"· 🕐 {chunk['elapsed']:.1f}s*"
-                )
-                await trans_msg.stream_token(token_info)
-                await trans_msg.update()
-
-    chat_history.append({"role": "user", "content": user_input})
+        trans_tokens, trans_elapsed = 0, 0.0
+        trans_msg.content = _t("### 🧠 Translated by `{author}`\n---\n", lang=lang, author="Llama3-Taiwan")
+        await trans_msg.update()
+
+        for text, translate in translation_plan:
+            if cancel_token.cancelled:
+                break
+            if not translate:
+                trans_full_text += text
+                await trans_msg.stream_token(text)
+                continue
+            translation = services.assistant_service.translate_response(text, target_lang_name, cancel_token=cancel_token)
+            try:
+                async for chunk in translation:
+                    if chunk["type"] == "token":
+                        trans_full_text += chunk["content"]
+                        await trans_msg.stream_token(chunk["content"])
+                    elif chunk["type"] == "final":
+                        trans_tokens += chunk["tokens"]["total"]
+                        trans_elapsed += chunk["elapsed"]
+            finally:
+                await translation.aclose()
+
+        token_info = (
+            f"\n\n---\n*⚡ Tokens: {trans_tokens} "
+            f"· 🕐 {trans_elapsed:.1f}s*"
+        )
+        await trans_msg.stream_token(token_info)
+        await trans_msg.update()
+
+    chat_history.append({"role": "user", "content": history_input})
     chat_history.append({"role": "assistant", "content": assistant_full_text})
     cl.user_session.set("chat_history", chat_history)
-    
-    # Force flush Langfuse data to ensure it's sent before function ends
-    try:
-        services.langfuse_client.flush()
-    except Exception as e:
-        logger.error(f"Langfuse flush failed: {e}")
+    services.telemetry.set_trace_output(assistant_full_text)
 
 
+@cl.action_callback("fresh_analysis")
+async def on_action_fresh_analysis(action: cl.Action):
+    user_input = action.payload["input"]
+    await action.remove()
+    with services.telemetry.trace("Chat Message", input=user_input,
+                                  metadata={"lang": cl.user_session.get("lang", "en"), "fresh": True}):
+        await handle_message(user_input, fresh=True)
+
 @cl.action_callback("view_hw_history")
 async def on_action_view_hw_history(action: cl.Action):
     lang = cl.user_session.get("lang", "en")
@@ -193,6 +270,10 @@ async def on_action_view_hw_history(action: cl.Action):
             await cl.Message(content=msg, author="System").send()
             return
 
+        # plotly is only needed for this chart; importing it lazily keeps startup and hot reloads fast
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         titles = (_t("Usage (%)", lang=lang), _t("Power (Watt)", lang=lang))
         fig = make_subplots(rows=2, cols=1, shared_xaxes=True, subplot_titles=titles)
         for col, name in [('e_cpu_pct', 'E-CPU %'), ('p_cpu_pct', 'P-CPU %'), ('gpu_pct', 'GPU %'), ('ram_pct', 'RAM %')]:
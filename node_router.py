@@ -0,0 +1,157 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Multi-node router: subscribes to each node's watchNode GraphQL stream (hardware stats + queue depth)
+# and forwards POST /api/analyze to the least-loaded healthy node, keeping sessions on one node.
+# Usage: python node_router.py serve --nodes a=http://mac1:8000,b=http://mac2:8000 [--port 9000]
+#        python node_router.py fake-node --name a --port 8101   (stand-in node for local testing)
+# Local test: start two fake nodes on 8101/8102, then
+#        python node_router.py serve --nodes a=http://localhost:8101,b=http://localhost:8102
+import argparse
+import asyncio
+import contextlib
+import time
+import types
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from core.config import ROUTER_NODES, ROUTER_PORT, ROUTER_STALE_AFTER, ROUTER_REQUEST_TIMEOUT
+from core.logger import logger
+from core.node_router import NodeRouter, parse_nodes
+
+class RelayResponse(StreamingResponse):
+    """Streaming response that always runs `cleanup` when it ends, including when the body never
+    started streaming or sending failed (Starlette skips background tasks on a client disconnect)."""
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cleanup()
+
+def create_router_app(router: NodeRouter) -> FastAPI:
+    client = httpx.AsyncClient(timeout=httpx.Timeout(ROUTER_REQUEST_TIMEOUT, connect=2.0))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app):
+        router.start()
+        yield
+        await router.stop()
+        await client.aclose()
+
+    app = FastAPI(title="Inference node router", lifespan=lifespan)
+
+    @app.post("/api/analyze")
+    async def analyze(request: Request):
+        payload = await request.json()
+        headers = {"accept": request.headers.get("accept", "application/json")}
+        node, response = await router.send(client, payload, headers)
+        if node is None:
+            return JSONResponse({"error": "No healthy node with the required models", **router.state()}, status_code=503)
+
+        cleanup = router.release(node, response)
+
+        async def relay():
+            # Raw relay keeps JSON and SSE responses byte-identical; closing it (client gone) closes the
+            # upstream request too, which stops the generation on the node
+            try:
+                async for data in response.aiter_raw():
+                    yield data
+            finally:
+                await cleanup()
+
+        try:
+            return RelayResponse(relay(), cleanup, status_code=response.status_code,
+                                 media_type=response.headers.get("content-type"),
+                                 headers={"X-Routed-Node": node.name, "Cache-Control": "no-cache"})
+        except BaseException:
+            await cleanup()
+            raise
+
+    @app.get("/health")
+    async def health():
+        state = router.state()
+        return JSONResponse(state, status_code=200 if state["healthy"] else 503)
+
+    return app
+
+def create_fake_node_app(name: str, delay: float, tokens: int, concurrency: int, models: list) -> FastAPI:
+    """A node that publishes real watchNode status but answers with canned tokens instead of a model."""
+    from strawberry.fastapi import GraphQLRouter
+    from strawberry.subscriptions import GRAPHQL_TRANSPORT_WS_PROTOCOL, GRAPHQL_WS_PROTOCOL
+    import core.services as services
+    from core.governor import InferenceGovernor
+    from core.headless import sse_event
+    from core.schema import schema, _latest_hw_stats_ref
+
+    governor = InferenceGovernor(enabled=False, max_concurrency=concurrency)
+    services.provide("governor", governor)
+    services.provide("llm_manager", types.SimpleNamespace(
+        **{attr: (object() if role in models else None)
+           for role, attr in (("general", "llm_general"), ("security", "llm_sec"), ("router", "llm_router"))}))
+    _latest_hw_stats_ref.update(chip_label=f"stand-in {name}")
+
+    app = FastAPI(title=f"Stand-in node {name}")
+    app.include_router(GraphQLRouter(schema, subscription_protocols=[GRAPHQL_TRANSPORT_WS_PROTOCOL, GRAPHQL_WS_PROTOCOL]),
+                       prefix="/graphql")
+
+    async def events(payload: dict):
+        start = time.time()
+        async with governor.admit():
+            yield {"type": "meta", "author": f"stand-in {name}", "is_security": True}
+            text = ""
+            for i in range(tokens):
+                await asyncio.sleep(delay)
+                text += f"{name}{i} "
+                yield {"type": "token", "content": f"{name}{i} "}
+            yield {"type": "final", "full_content": text, "elapsed": time.time() - start, "tokens": {"total": tokens}}
+        yield {"type": "done", "content": text, "session_id": payload.get("session_id"), "elapsed_total": time.time() - start}
+
+    @app.post("/api/analyze")
+    async def analyze(request: Request):
+        payload = await request.json()
+        if payload.get("stream") or "text/event-stream" in request.headers.get("accept", ""):
+            async def stream():
+                async for chunk in events(payload):
+                    yield sse_event(chunk)
+            return StreamingResponse(stream(), media_type="text/event-stream")
+        chunks = [chunk async for chunk in events(payload)]
+        return JSONResponse({"node": name, "content": chunks[-1]["content"], "session_id": payload.get("session_id")})
+
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Route analysis requests across inference nodes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Run the router")
+    serve.add_argument("--nodes", default=ROUTER_NODES, help='Comma-separated "name=http://host:port" list')
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=ROUTER_PORT)
+    serve.add_argument("--stale-after", type=float, default=ROUTER_STALE_AFTER,
+                       help="Seconds without a status update before a node is skipped")
+    fake = sub.add_parser("fake-node", help="Run a stand-in node for local testing")
+    fake.add_argument("--name", required=True)
+    fake.add_argument("--host", default="127.0.0.1")
+    fake.add_argument("--port", type=int, required=True)
+    fake.add_argument("--delay", type=float, default=0.05, help="Seconds per canned token")
+    fake.add_argument("--tokens", type=int, default=40)
+    fake.add_argument("--concurrency", type=int, default=1, help="Admission limit (queue builds up beyond it)")
+    fake.add_argument("--models", default="general,security", help="Roles reported as loaded")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "serve":
+        nodes = parse_nodes(args.nodes)
+        if not nodes:
+            raise SystemExit("No nodes configured: pass --nodes or set ROUTER_NODES")
+        logger.info(f"Routing across {len(nodes)} nodes: {', '.join(f'{n}={u}' for n, u in nodes)}")
+        app = create_router_app(NodeRouter(nodes, stale_after=args.stale_after))
+    else:
+        app = create_fake_node_app(args.name, args.delay, args.tokens, args.concurrency,
+                                   [m.strip() for m in args.models.split(",") if m.strip()])
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,44 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Offline playbook answers: generates a canonical security answer for every playbook plus its
+# translations for each UI language, stores them in the playbook file, and (optionally) re-ingests
+# so the assistant can serve confident matches on short questions instantly.
+# Usage: python precompute_answers.py [playbooks.json] [--langs zh-TW,ja] [--force] [--no-ingest]
+# Only playbooks whose title/content changed since the last run are regenerated.
+import argparse
+import sys
+
+from core.config import MODEL_SEC_PATH, MODEL_LLAMA3_PATH, PLAYBOOKS_PATH, QDRANT_URL
+from core.i18n import LANG_NAMES
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute playbook answers and translations.")
+    parser.add_argument("path", nargs="?", default=PLAYBOOKS_PATH, help="JSON array or JSONL playbook file")
+    parser.add_argument("--langs", default=",".join(LANG_NAMES), help="Language codes to store (en is always kept)")
+    parser.add_argument("--force", action="store_true", help="Regenerate answers that are already up to date")
+    parser.add_argument("--no-ingest", action="store_true", help="Only update the file, do not re-ingest into Qdrant")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    from core.llm import LLMManager
+    from core.playbook_answers import PlaybookAnswerGenerator, load_playbooks, save_playbooks
+
+    langs = [lang.strip() for lang in args.langs.split(",") if lang.strip()]
+    unknown = [lang for lang in langs if lang not in LANG_NAMES]
+    if unknown:
+        raise SystemExit(f"Unknown language codes: {', '.join(unknown)} (known: {', '.join(LANG_NAMES)})")
+
+    manager = LLMManager()
+    manager.load_security_model(MODEL_SEC_PATH)
+    manager.load_general_model(MODEL_LLAMA3_PATH)
+    records, fmt = load_playbooks(args.path)
+    stats = PlaybookAnswerGenerator(manager, langs=langs).run(records, force=args.force)
+    save_playbooks(args.path, records, fmt)
+    print(f"[precompute] {args.path}: {stats['generated']} answers, {stats['translations']} translations, "
+          f"{stats['skipped']} up to date", file=sys.stderr)
+
+    if not args.no_ingest:
+        from core.database import VectorDBManager
+        vector_db = VectorDBManager(url=QDRANT_URL)
+        vector_db.setup_model()
+        vector_db.ingest_playbooks(args.path)
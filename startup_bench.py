@@ -0,0 +1,72 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Startup benchmark: measures cold import time of the app modules and summarizes `python -X importtime`.
+# Usage: python startup_bench.py [--module main] [--runs 3] [--top 20]
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def run_import(module: str, importtime: bool) -> tuple:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", f"import {module}"]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise RuntimeError(f"`import {module}` failed:\n{tail}")
+    return elapsed, proc.stderr
+
+def parse_importtime(stderr: str) -> list:
+    """Returns (cumulative_us, self_us, depth, module) tuples from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            rows.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    return rows
+
+def top_level_packages(rows: list) -> dict:
+    totals = {}
+    for cumulative_us, _, depth, name in rows:
+        if depth == 0:
+            pkg = name.split(".")[0]
+            totals[pkg] = totals.get(pkg, 0) + cumulative_us
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import/startup time.")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=3, help="Wall-clock runs (after one warm-up)")
+    parser.add_argument("--top", type=int, default=20, help="Rows to show in each table")
+    args = parser.parse_args()
+
+    # Warm-up run so the OS page cache does not skew the first measurement
+    run_import(args.module, importtime=False)
+    walls = [run_import(args.module, importtime=False)[0] for _ in range(max(1, args.runs))]
+    _, stderr = run_import(args.module, importtime=True)
+    rows = parse_importtime(stderr)
+
+    print(f"=== Startup profile: import {args.module} ===")
+    print(f"Wall clock: median {statistics.median(walls):.3f}s, min {min(walls):.3f}s over {len(walls)} runs")
+    print(f"Modules imported: {len(rows)}")
+
+    print(f"\n--- Top {args.top} top-level packages (cumulative) ---")
+    for pkg, us in sorted(top_level_packages(rows).items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{us / 1000:10.1f} ms  {pkg}")
+
+    print(f"\n--- Top {args.top} modules by self time ---")
+    for cumulative_us, self_us, depth, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:10.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
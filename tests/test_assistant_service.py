@@ -0,0 +1,200 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from core.assistant_service import AssistantService
+from core.config import STRUCTURED_OUTPUT_MAX_TOKENS
+from core.governor import InferenceGovernor
+
+def _slow(result, delay: float):
+    def call(*args):
+        time.sleep(delay)
+        return result
+    return call
+
+def _hit(score: float, answers: dict = None, analysis: dict = None) -> dict:
+    return {"id": 7, "score": score, "title": "SQLi Handling", "document": "playbook", "answers": answers or {},
+            "analysis": analysis}
+
+class TestOverlappedPreparation(unittest.TestCase):
+    def _service(self, keyword: bool, classified: bool, retrieval_delay: float = 0.1, hit: dict = None):
+        llm = MagicMock()
+        llm.keyword_intent.return_value = keyword
+        llm.classify_intent.side_effect = _slow(classified, 0.05)
+        llm.prefill_system_prompt.side_effect = _slow(42, 0.05)
+        vector_db = MagicMock()
+        vector_db.query_playbook.side_effect = _slow(hit if hit is not None else _hit(0.6), retrieval_delay)
+        return AssistantService(llm, vector_db)
+
+    def test_keyword_path_overlaps_retrieval_and_prefill(self):
+        service = self._service(keyword=True, classified=True)
+        is_security, hit, precomputed, stages = asyncio.run(service._prepare("sql injection alert"))
+        self.assertTrue(is_security)
+        self.assertEqual(hit["document"], "playbook")
+        self.assertIsNone(precomputed)
+        self.assertEqual(stages["classified_by"], "keyword")
+        self.assertEqual(stages["prefill_tokens"], 42)
+        service.llm.classify_intent.assert_not_called()
+        service.llm.prefill_system_prompt.assert_called_once_with(True)
+        # Prefill ran under retrieval instead of after it
+        self.assertLess(stages["wall_s"], 0.14)
+        self.assertGreater(stages["saved_s"], 0.03)
+
+    def test_model_classified_security_overlaps_router_call_with_retrieval(self):
+        service = self._service(keyword=False, classified=True)
+        is_security, hit, precomputed, stages = asyncio.run(service._prepare("review my deployment plan"))
+        self.assertTrue(is_security)
+        self.assertEqual(stages["classified_by"], "model")
+        self.assertLess(stages["wall_s"], 0.14)
+        self.assertGreater(stages["saved_s"], 0.03)
+
+    def test_general_chat_discards_speculative_retrieval(self):
+        service = self._service(keyword=False, classified=False, retrieval_delay=0.3)
+        is_security, hit, precomputed, stages = asyncio.run(service._prepare("hello there"))
+        self.assertFalse(is_security)
+        self.assertIsNone(hit)
+        self.assertTrue(stages["retrieval_discarded"])
+        self.assertNotIn("retrieval_s", stages)
+        # General chat does not wait for the retrieval it does not need
+        self.assertLess(stages["wall_s"], 0.2)
+        service.llm.prefill_system_prompt.assert_not_called()
+
+class TestPrecomputedFastPath(unittest.TestCase):
+    ANSWERS = {"en": "Block the source IP and patch the query.", "ja": "送信元IPをブロックしてください。"}
+
+    def _service(self, hit: dict):
+        llm = MagicMock()
+        llm.keyword_intent.return_value = True
+        llm.prefill_system_prompt.return_value = 0
+        vector_db = MagicMock()
+        vector_db.query_playbook.return_value = hit
+        return AssistantService(llm, vector_db)
+
+    def _run(self, service, user_input: str, target_lang: str = "Japanese", fresh: bool = False):
+        async def run():
+            return [c async for c in service._generate_response(user_input, [], target_lang=target_lang, fresh=fresh)]
+        return asyncio.run(run())
+
+    def test_confident_short_match_serves_stored_answer_and_translation(self):
+        service = self._service(_hit(0.93, self.ANSWERS))
+        chunks = self._run(service, "sql injection alert")
+        self.assertEqual([c["type"] for c in chunks], ["meta", "token", "final"])
+        final = chunks[-1]
+        self.assertEqual(final["full_content"], self.ANSWERS["en"])
+        self.assertEqual(final["precomputed"]["playbook_id"], 7)
+        self.assertEqual(final["precomputed"]["translation"], {"lang": "ja", "content": self.ANSWERS["ja"]})
+        self.assertEqual(service.precomputed_stats["served"], 1)
+        service.llm.get_active_model.assert_not_called()
+
+    def test_missing_translation_is_none(self):
+        service = self._service(_hit(0.93, self.ANSWERS))
+        final = self._run(service, "sql injection alert", target_lang="Korean")[-1]
+        self.assertIsNone(final["precomputed"]["translation"])
+
+    @patch("core.assistant_service.STRUCTURED_OUTPUT_ENABLED", True)
+    def test_structured_mode_serves_the_stored_analysis(self):
+        analysis = {"summary": "SQL injection attempt.", "root_causes": [], "mitigations": [], "severity": "high"}
+        final = self._run(self._service(_hit(0.93, self.ANSWERS, analysis)), "sql injection alert")[-1]
+        self.assertEqual(final["structured"], analysis)
+        # An answer stored in prose mode has no object for structured clients: generate instead
+        _, _, precomputed, _ = asyncio.run(self._service(_hit(0.93, self.ANSWERS))._prepare("sql injection alert"))
+        self.assertIsNone(precomputed)
+
+    def test_declined_for_fresh_low_score_long_input_or_missing_answer(self):
+        cases = [(_hit(0.93, self.ANSWERS), "sql injection alert", True),
+                 (_hit(0.7, self.ANSWERS), "sql injection alert", False),
+                 (_hit(0.93, self.ANSWERS), "sql injection alert " * 20, False),
+                 (_hit(0.93), "sql injection alert", False)]
+        for hit, user_input, fresh in cases:
+            service = self._service(hit)
+            is_security, _, precomputed, _ = asyncio.run(service._prepare(user_input, fresh))
+            self.assertTrue(is_security)
+            self.assertIsNone(precomputed)
+
+class TestLoopTermination(unittest.TestCase):
+    def test_looping_generation_is_stopped_and_trimmed(self):
+        produced = []
+
+        async def stream_chat(messages, **params):
+            yield {"choices": [{"delta": {"content": "Answer: "}}]}
+            for _ in range(params["max_tokens"]):
+                for word in ("block ", "the ", "address. "):
+                    produced.append(word)
+                    yield {"choices": [{"delta": {"content": word}}]}
+
+        backend = MagicMock()
+        backend.stream_chat = stream_chat
+        backend.tokenize.side_effect = lambda data: [0] * 10
+        llm = MagicMock()
+        llm.keyword_intent.return_value = False
+        llm.classify_intent.return_value = False
+        llm.get_active_model.return_value = backend
+        llm.get_active_system_message.return_value = "system"
+        service = AssistantService(llm, MagicMock())
+
+        async def run():
+            return [c async for c in service._generate_response("hello", [], target_lang="English")]
+
+        chunks = asyncio.run(run())
+        final = chunks[-1]
+        self.assertEqual(final["type"], "final")
+        self.assertEqual(final["full_content"], "Answer: block the address. ")
+        self.assertEqual(final["loop"]["method"], "suffix")
+        self.assertLess(len(produced), 100)
+        self.assertEqual(service.loop_stats["detected"], 1)
+        self.assertGreater(service.loop_stats["tokens_saved"], 1000)
+
+class TestStructuredOutput(unittest.TestCase):
+    RAW = json.dumps({"summary": "SQL injection attempt.", "root_causes": ["Unparameterized query"],
+                      "mitigations": ["Use prepared statements"], "severity": "high"})
+
+    def _run(self, governor=None):
+        raw = self.RAW
+        calls = []
+
+        async def stream_chat(messages, **params):
+            calls.append(params)
+            for i in range(0, len(raw), 4):
+                yield {"choices": [{"delta": {"content": raw[i:i + 4]}}]}
+
+        backend = MagicMock()
+        backend.stream_chat = stream_chat
+        backend.tokenize.side_effect = lambda data: [0] * 10
+        llm = MagicMock()
+        llm.keyword_intent.return_value = True
+        llm.prefill_system_prompt.return_value = 0
+        llm.get_active_model.return_value = backend
+        llm.get_active_system_message.return_value = "system"
+        vector_db = MagicMock()
+        vector_db.query_playbook.return_value = None
+        service = AssistantService(llm, vector_db, governor=governor)
+
+        async def run():
+            return [c async for c in service._generate_response("sql injection alert", [], target_lang="English")]
+
+        with patch("core.assistant_service.MAP_REDUCE_ENABLED", False):
+            return asyncio.run(run()), calls
+
+    @patch("core.assistant_service.STRUCTURED_OUTPUT_ENABLED", True)
+    def test_security_answer_is_grammar_constrained_and_rendered(self):
+        chunks, calls = self._run()
+        final = chunks[-1]
+        self.assertEqual(calls[0]["response_format"]["schema"]["required"][-1], "severity")
+        self.assertNotIn("User:", calls[0]["stop"])
+        self.assertEqual(final["structured"]["root_causes"], ["Unparameterized query"])
+        self.assertTrue(final["full_content"].startswith("**Summary**: SQL injection attempt."))
+        # Tokens stream as markdown, never as raw JSON
+        self.assertEqual("".join(c["content"] for c in chunks if c["type"] == "token"), final["full_content"])
+
+    @patch("core.assistant_service.STRUCTURED_OUTPUT_ENABLED", True)
+    def test_governor_does_not_cut_structured_output(self):
+        governor = InferenceGovernor(enabled=True)
+        governor.level = "critical"
+        chunks, calls = self._run(governor)
+        self.assertEqual(calls[0]["max_tokens"], STRUCTURED_OUTPUT_MAX_TOKENS)
+        self.assertIsNotNone(chunks[-1]["structured"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from batch_analyze import iter_inputs, load_checkpoint, load_output_ids, parse_args, run_batch
+
+class FakeService:
+    """generate_response stand-in that raises for the item texts in `fail`."""
+    def __init__(self, fail: set = None):
+        self.fail = set(fail or ())
+        self.seen = []
+
+    async def generate_response(self, user_input, chat_history, target_lang="English", cancel_token=None):
+        self.seen.append(user_input)
+        if user_input in self.fail:
+            raise RuntimeError("backend timeout")
+        yield {"type": "meta", "author": "Foundation-Sec", "is_security": True}
+        yield {"type": "final", "full_content": f"analysis of {user_input}", "elapsed": 0.1,
+               "tokens": {"total": 10, "prompt": 6, "completion": 4}}
+
+def _read_jsonl(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class TestBatchAnalyze(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.tmp.name, name)
+
+    def _write(self, name: str, text: str) -> str:
+        path = self._path(name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_iter_inputs_reads_jsonl_records(self):
+        path = self._write("alerts.jsonl", '{"id": "a1", "message": "ssh brute force"}\n\n'
+                                           'not json\n"plain string"\n{"other": 1}\n{"text": "port scan"}\n')
+        items = list(iter_inputs([path]))
+        self.assertEqual(items, [("a1", "ssh brute force"), (f"{path}:4", "plain string"), (f"{path}:6", "port scan")])
+        self.assertEqual(list(iter_inputs([path], text_field="other")), [(f"{path}:4", "plain string"), (f"{path}:5", "1")])
+
+    def test_iter_inputs_groups_log_lines(self):
+        path = self._write("auth.log", "line1\n\nline2\nline3\nline4\nline5\n")
+        items = list(iter_inputs([path], group_lines=2))
+        self.assertEqual(items, [(f"{path}:1", "line1\nline2"), (f"{path}:4", "line3\nline4"), (f"{path}:6", "line5")])
+
+    def test_load_checkpoint(self):
+        self.assertEqual(load_checkpoint(self._path("missing.ckpt")), set())
+        path = self._write("out.ckpt", "a1\n\n b2 \n")
+        self.assertEqual(load_checkpoint(path), {"a1", "b2"})
+
+    def test_resume_retries_failures_without_duplicate_records(self):
+        inputs = self._write("alerts.jsonl", "".join(json.dumps({"id": i, "text": f"alert {i}"}) + "\n"
+                                                     for i in ("a", "b", "c")))
+        output = self._path("results.jsonl")
+        args = parse_args([inputs, "-o", output, "-c", "2"])
+
+        stats = asyncio.run(run_batch(args, FakeService(fail={"alert b"})))
+        self.assertEqual((stats.done, stats.failed), (2, 1))
+        self.assertEqual(sorted(r["id"] for r in _read_jsonl(output)), ["a", "c"])
+        self.assertEqual([r["id"] for r in _read_jsonl(f"{output}.errors")], ["b"])
+        self.assertEqual(load_checkpoint(f"{output}.ckpt"), {"a", "c"})
+
+        service = FakeService()
+        stats = asyncio.run(run_batch(args, service))
+        self.assertEqual(service.seen, ["alert b"])
+        self.assertEqual((stats.done, stats.failed, stats.skipped), (1, 0, 2))
+        records = _read_jsonl(output)
+        self.assertEqual(sorted(r["id"] for r in records), ["a", "b", "c"])
+        self.assertTrue(all("error" not in r for r in records))
+        self.assertEqual(load_checkpoint(f"{output}.ckpt"), {"a", "b", "c"})
+
+    def test_resume_after_crash_before_checkpoint_does_not_duplicate(self):
+        inputs = self._write("alerts.jsonl", "".join(json.dumps({"id": i, "text": f"alert {i}"}) + "\n"
+                                                     for i in ("a", "b", "c")))
+        # Crashed after writing "a" to the output but before its checkpoint line, and in the middle of "b"
+        output = self._write("results.jsonl", json.dumps({"id": "a", "content": "done"}) + '\n{"id": "b", "con')
+        self.assertEqual(load_output_ids(output), {"a"})
+
+        service = FakeService()
+        stats = asyncio.run(run_batch(parse_args([inputs, "-o", output]), service))
+        self.assertEqual(sorted(service.seen), ["alert b", "alert c"])
+        self.assertEqual((stats.done, stats.skipped), (2, 1))
+        with open(output, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        ids = [json.loads(line)["id"] for line in lines[2:]]
+        self.assertEqual([json.loads(lines[0])["id"]] + sorted(ids), ["a", "b", "c"])
+
+    def test_restart_overwrites_output(self):
+        inputs = self._write("alerts.jsonl", json.dumps({"id": "a", "text": "alert a"}) + "\n")
+        output = self._path("results.jsonl")
+        asyncio.run(run_batch(parse_args([inputs, "-o", output]), FakeService()))
+        asyncio.run(run_batch(parse_args([inputs, "-o", output, "--restart"]), FakeService()))
+        self.assertEqual([r["id"] for r in _read_jsonl(output)], ["a"])
+
+if __name__ == "__main__":
+    unittest.main()
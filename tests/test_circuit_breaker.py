@@ -0,0 +1,121 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from core.database import VectorDBManager
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def _fail():
+    raise ConnectionError("refused")
+
+class TestCircuitBreaker(unittest.TestCase):
+    def _breaker(self, clock, rng=lambda: 0.5):
+        return CircuitBreaker("dep", failures=2, recovery_s=10.0, jitter=0.2, clock=clock, rng=rng)
+
+    def test_opens_after_threshold_and_short_circuits(self):
+        clock = FakeClock()
+        breaker = self._breaker(clock)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                breaker.call(_fail)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        fn = MagicMock()
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(fn)
+        fn.assert_not_called()
+        self.assertFalse(breaker.available())
+        self.assertEqual(breaker.snapshot()["short_circuited"], 1)
+
+    def test_success_resets_the_failure_count(self):
+        breaker = self._breaker(FakeClock())
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        clock = FakeClock()
+        breaker = self._breaker(clock)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                breaker.call(_fail)
+        clock.now += 10.0
+        with self.assertRaises(ConnectionError):
+            breaker.call(_fail)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.stats["trips"], 2)
+
+        clock.now += 10.0
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_probe_time_is_jittered(self):
+        for rng, expected in ((lambda: 0.0, 8.0), (lambda: 1.0, 12.0)):
+            clock = FakeClock()
+            breaker = self._breaker(clock, rng)
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    breaker.call(_fail)
+            self.assertAlmostEqual(breaker.probe_at - clock.now, expected)
+
+class TestQdrantBreaker(unittest.TestCase):
+    @patch("core.database.QdrantClient")
+    def test_dead_qdrant_is_skipped_without_embedding(self, mock_qdrant_client_cls):
+        mock_client = MagicMock()
+        mock_client.query_points.side_effect = ConnectionError("refused")
+        mock_qdrant_client_cls.return_value = mock_client
+        embedder = MagicMock()
+        embedder.embed.return_value = [0.1]
+        breaker = CircuitBreaker("qdrant", failures=2, recovery_s=60.0)
+        manager = VectorDBManager(embedder=embedder, breaker=breaker)
+
+        for _ in range(5):
+            self.assertIsNone(manager.query_playbook("sql injection"))
+        self.assertEqual(mock_client.query_points.call_count, 2)
+        self.assertEqual(embedder.embed.call_count, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    @patch("core.database.QdrantClient")
+    def test_bad_playbook_file_does_not_trip_breaker(self, mock_qdrant_client_cls):
+        mock_client = MagicMock()
+        mock_client.collection_exists.return_value = True
+        mock_qdrant_client_cls.return_value = mock_client
+        breaker = CircuitBreaker("qdrant", failures=2, recovery_s=60.0)
+        manager = VectorDBManager(embedder=MagicMock(), breaker=breaker)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "playbooks.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('[{"id": 1, "content": "unterminated')
+            for _ in range(3):
+                self.assertFalse(manager.ingest_playbooks(path, workers=0, embed_fn=lambda docs: [[0.1]] * len(docs)))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats["failures"], 0)
+
+    @patch("core.database.QdrantClient")
+    def test_unreachable_qdrant_trips_breaker_during_ingest(self, mock_qdrant_client_cls):
+        mock_client = MagicMock()
+        mock_client.collection_exists.side_effect = ConnectionError("refused")
+        mock_qdrant_client_cls.return_value = mock_client
+        breaker = CircuitBreaker("qdrant", failures=2, recovery_s=60.0)
+        manager = VectorDBManager(embedder=MagicMock(), breaker=breaker)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "playbooks.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('{"id": 1, "content": "Block the source IP."}\n')
+            for _ in range(3):
+                self.assertFalse(manager.ingest_playbooks(path, workers=0, embed_fn=lambda docs: [[0.1]] * len(docs)))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(mock_client.collection_exists.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import unittest
+from core.cancellation import CancellationToken
+from core.coalescing import RequestCoalescer, coalesce_key
+
+class TestRequestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.runs = 0
+
+    def _factory(self, tokens: int = 5, delay: float = 0.01):
+        async def generate(cancel_token: CancellationToken):
+            self.runs += 1
+            yield {"type": "meta", "author": "Foundation-Sec"}
+            text = ""
+            for i in range(tokens):
+                if cancel_token.cancelled:
+                    yield {"type": "final", "full_content": text, "cancelled": {"reason": cancel_token.reason}}
+                    return
+                await asyncio.sleep(delay)
+                text += f"t{i} "
+                yield {"type": "token", "content": f"t{i} "}
+            yield {"type": "final", "full_content": text, "cancelled": None}
+        return generate
+
+    async def _collect(self, coalescer, key, factory, delay: float = 0.0, cancel_token=None):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in coalescer.subscribe(key, factory, cancel_token)]
+
+    def test_key_normalizes_whitespace_only(self):
+        a = coalesce_key("alert line 1  \r\nalert line 2\n", "m", "English", [])
+        b = coalesce_key("alert line 1\nalert line 2", "m", "English", [])
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, coalesce_key("ALERT line 1\nalert line 2", "m", "English", []))
+        self.assertNotEqual(a, coalesce_key("alert line 1\nalert line 2", "m", "Japanese", []))
+        self.assertNotEqual(a, coalesce_key("alert line 1\nalert line 2", "m", "English", [{"role": "user", "content": "hi"}]))
+
+    def test_followers_share_one_generation_and_replay(self):
+        coalescer = RequestCoalescer()
+        factory = self._factory()
+
+        async def run():
+            return await asyncio.gather(
+                self._collect(coalescer, "k", factory),
+                self._collect(coalescer, "k", factory, delay=0.025),  # joins after a few tokens
+            )
+
+        leader, follower = asyncio.run(run())
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(leader[-1], follower[-1])
+        self.assertEqual([c for c in leader if c["type"] == "token"], [c for c in follower if c["type"] == "token"])
+        self.assertTrue(follower[0].get("coalesced"))
+        self.assertFalse(leader[0].get("coalesced"))
+        self.assertEqual(coalescer.active, 0)
+        self.assertEqual(coalescer.stats, {"leaders": 1, "followers": 1})
+
+    def test_finished_generation_is_not_reused(self):
+        coalescer = RequestCoalescer()
+        factory = self._factory(tokens=2)
+
+        async def run():
+            await self._collect(coalescer, "k", factory)
+            await self._collect(coalescer, "k", factory)
+
+        asyncio.run(run())
+        self.assertEqual(self.runs, 2)
+
+    def test_one_subscriber_stopping_does_not_cancel_others(self):
+        coalescer = RequestCoalescer()
+        factory = self._factory(tokens=10)
+        token = CancellationToken()
+
+        async def stopper():
+            chunks = []
+            async for chunk in coalescer.subscribe("k", factory, token):
+                chunks.append(chunk)
+                if chunk["type"] == "token":
+                    token.cancel("stopped")
+            return chunks
+
+        async def run():
+            return await asyncio.gather(stopper(), self._collect(coalescer, "k", factory, delay=0.005))
+
+        stopped, other = asyncio.run(run())
+        self.assertNotEqual(stopped[-1]["type"], "final")
+        self.assertIsNone(other[-1]["cancelled"])
+        self.assertEqual(len([c for c in other if c["type"] == "token"]), 10)
+
+    def test_last_subscriber_stopping_cancels_generation(self):
+        coalescer = RequestCoalescer()
+        token = CancellationToken()
+
+        async def run():
+            chunks = []
+            async for chunk in coalescer.subscribe("k", self._factory(tokens=50), token):
+                chunks.append(chunk)
+                if chunk["type"] == "token":
+                    token.cancel("stopped")
+            return chunks
+
+        chunks = asyncio.run(run())
+        self.assertEqual(chunks[-1]["cancelled"], {"reason": "stopped"})
+        self.assertLess(len(chunks), 10)
+
+    def _stalled_factory(self, release: asyncio.Event):
+        async def generate(cancel_token: CancellationToken):
+            self.runs += 1
+            yield {"type": "meta", "author": "Foundation-Sec"}
+            # Stuck in prefill: no further chunk until released or cancelled
+            waiters = [asyncio.ensure_future(release.wait()), asyncio.ensure_future(cancel_token.wait())]
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            yield {"type": "final", "full_content": "", "cancelled": {"reason": cancel_token.reason} if cancel_token.cancelled else None}
+        return generate
+
+    def test_cancelled_follower_detaches_from_stalled_flight(self):
+        coalescer = RequestCoalescer()
+        token = CancellationToken()
+
+        async def run():
+            release = asyncio.Event()
+            factory = self._stalled_factory(release)
+            leader = asyncio.ensure_future(self._collect(coalescer, "k", factory))
+            follower = asyncio.ensure_future(self._collect(coalescer, "k", factory, delay=0.01, cancel_token=token))
+            await asyncio.sleep(0.02)
+            token.cancel("stopped")
+            follower_chunks = await asyncio.wait_for(follower, 1.0)
+            flight = coalescer._flights["k"]
+            self.assertEqual(flight.subscribers, 1)
+            self.assertFalse(flight.cancel_token.cancelled)
+            release.set()
+            return follower_chunks, await leader
+
+        follower, leader = asyncio.run(run())
+        self.assertEqual([c["type"] for c in follower], ["meta"])
+        self.assertIsNone(leader[-1]["cancelled"])
+
+    def test_last_listener_cancel_stops_stalled_flight_at_once(self):
+        coalescer = RequestCoalescer()
+        token = CancellationToken()
+
+        async def run():
+            release = asyncio.Event()
+            subscriber = asyncio.ensure_future(self._collect(coalescer, "k", self._stalled_factory(release), cancel_token=token))
+            await asyncio.sleep(0.01)
+            token.cancel("stopped")
+            return await asyncio.wait_for(subscriber, 1.0)
+
+        chunks = asyncio.run(run())
+        self.assertEqual(chunks[-1]["cancelled"], {"reason": "stopped"})
+        self.assertEqual(coalescer.active, 0)
+
+if __name__ == '__main__':
+    unittest.main()
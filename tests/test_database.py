@@ -1,9 +1,15 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
-from core.database import VectorDBManager
+from core.database import VectorDBManager, QueryEmbeddingService
 
 class TestVectorDBManager(unittest.TestCase):
+    def _embedder(self):
+        embedder = MagicMock()
+        embedder.embed.return_value = [0.1, 0.2, 0.3]
+        return embedder
+
     @patch('core.database.QdrantClient')
     def test_query_context(self, mock_qdrant_client_cls):
         # Setup mock QdrantClient
@@ -12,30 +18,116 @@ class TestVectorDBManager(unittest.TestCase):
         
         # Setup mock search result
         mock_result = MagicMock()
-        mock_result.document = "Playbook content on how to handle SQL injection."
-        mock_result.metadata = {"title": "SQLi Handling"}
+        mock_result.payload = {"document": "Playbook content on how to handle SQL injection.", "title": "SQLi Handling"}
         mock_result.score = 0.95
         
-        mock_client.query.return_value = [mock_result]
+        mock_client.query_points.return_value.points = [mock_result]
         
         # Initialize and test
-        manager = VectorDBManager()
+        embedder = self._embedder()
+        manager = VectorDBManager(embedder=embedder)
         context = manager.query_context("How do I fix SQL injection?")
         
-        self.assertTrue(mock_client.query.called)
+        self.assertTrue(mock_client.query_points.called)
+        embedder.embed.assert_called_once_with("How do I fix SQL injection?")
+        self.assertEqual(mock_client.query_points.call_args.kwargs["query"], [0.1, 0.2, 0.3])
         self.assertIn("Internal System Context", context)
         self.assertIn("SQL injection", context)
         
+    @patch('core.database.QdrantClient')
+    def test_query_playbook_returns_score_and_answers(self, mock_qdrant_client_cls):
+        mock_client = MagicMock()
+        mock_qdrant_client_cls.return_value = mock_client
+        mock_result = MagicMock()
+        mock_result.id = 3
+        mock_result.score = 0.91
+        mock_result.payload = {"document": "Isolate the host.", "title": "Ransomware", "answers": {"en": "Isolate it."}}
+        mock_client.query_points.return_value.points = [mock_result]
+
+        hit = VectorDBManager(embedder=self._embedder()).query_playbook("ransomware note found")
+
+        self.assertEqual(hit, {"id": 3, "score": 0.91, "title": "Ransomware", "document": "Isolate the host.",
+                               "answers": {"en": "Isolate it."}, "analysis": None})
+
     @patch('core.database.QdrantClient')
     def test_query_context_no_result(self, mock_qdrant_client_cls):
         mock_client = MagicMock()
         mock_qdrant_client_cls.return_value = mock_client
-        mock_client.query.return_value = []
+        mock_client.query_points.return_value.points = []
         
-        manager = VectorDBManager()
+        manager = VectorDBManager(embedder=self._embedder())
         context = manager.query_context("Random question")
         
         self.assertEqual(context, "")
 
+class TestQueryEmbeddingService(unittest.TestCase):
+    def test_concurrent_requests_share_one_batch(self):
+        calls = []
+        def embed_fn(texts):
+            calls.append(list(texts))
+            return [[float(len(t))] for t in texts]
+
+        service = QueryEmbeddingService(embed_fn, window_ms=50, max_batch=16)
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def worker(i):
+            barrier.wait()
+            results[i] = service.embed(f"query {i % 4}")
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(calls[0]), [f"query {i}" for i in range(4)])
+        self.assertEqual(results[5], [7.0])
+
+    def test_cache_and_eviction(self):
+        calls = []
+        def embed_fn(texts):
+            calls.extend(texts)
+            return [[1.0] for _ in texts]
+
+        service = QueryEmbeddingService(embed_fn, window_ms=0, cache_size=2)
+        for text in ["a", "b", "a", "c", "b"]:
+            service.embed(text)
+        # "a" was cached on its second use; "b" had been evicted by "c" before its second use
+        self.assertEqual(calls, ["a", "b", "c", "b"])
+        self.assertEqual(service.stats["cache_hits"], 1)
+
+    def test_errors_reach_every_waiter(self):
+        def embed_fn(texts):
+            raise RuntimeError("onnx failure")
+
+        service = QueryEmbeddingService(embed_fn, window_ms=0)
+        with self.assertRaises(RuntimeError):
+            service.embed("x")
+
+    def test_cancelled_request_does_not_stop_the_worker(self):
+        def embed_fn(texts):
+            return [[1.0] for _ in texts]
+
+        service = QueryEmbeddingService(embed_fn, window_ms=100)
+        future = service.submit("abandoned")
+        # Cancelled while the worker is still collecting its batch
+        self.assertTrue(future.cancel())
+        self.assertEqual(service.embed("next", timeout=2.0), [1.0])
+        self.assertTrue(service._thread.is_alive())
+
+    def test_failed_batch_does_not_stop_the_worker(self):
+        calls = []
+        def embed_fn(texts):
+            calls.append(texts)
+            # First batch returns no vectors at all, a malformed result rather than an exception
+            return [] if len(calls) == 1 else [[2.0] for _ in texts]
+
+        service = QueryEmbeddingService(embed_fn, window_ms=0)
+        with self.assertRaises(KeyError):
+            service.embed("x", timeout=2.0)
+        self.assertEqual(service.embed("y", timeout=2.0), [2.0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,128 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from core.governor import AdmissionGate, InferenceGovernor, NORMAL, CONSTRAINED, CRITICAL
+
+def _stats(ram_pct=50.0, power=10.0, thermal="Nominal"):
+    return {"ram_pct": ram_pct, "total_power_w": power, "thermal_pressure": thermal}
+
+class TestInferenceGovernor(unittest.TestCase):
+    def _governor(self, **kwargs):
+        params = dict(enabled=True, window=3, max_concurrency=4, ram_high=88, ram_critical=95,
+                      power_high=30, hysteresis=0.05)
+        params.update(kwargs)
+        return InferenceGovernor(**params)
+
+    def test_rolling_window_smooths_single_spike(self):
+        gov = self._governor()
+        gov.observe(_stats(ram_pct=50))
+        gov.observe(_stats(ram_pct=50))
+        self.assertIsNone(gov.observe(_stats(ram_pct=99)))
+        self.assertEqual(gov.level, NORMAL)
+
+    def test_sustained_memory_pressure_escalates(self):
+        gov = self._governor()
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=90))
+        self.assertEqual(gov.level, CONSTRAINED)
+        self.assertEqual(gov.concurrency, 2)
+        self.assertEqual(gov.cap_max_tokens(1000), 750)
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=97))
+        self.assertEqual(gov.level, CRITICAL)
+        self.assertEqual(gov.concurrency, 1)
+        self.assertEqual(gov.cap_max_tokens(1000), 500)
+        self.assertEqual([d["to"] for d in gov.decisions], [CONSTRAINED, CRITICAL])
+
+    def test_hysteresis_prevents_flapping(self):
+        gov = self._governor()
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=89))
+        self.assertEqual(gov.level, CONSTRAINED)
+        # Just under the entry threshold but within the hysteresis band: stay constrained
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=86))
+        self.assertEqual(gov.level, CONSTRAINED)
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=70))
+        self.assertEqual(gov.level, NORMAL)
+        self.assertEqual(gov.concurrency, 4)
+
+    def test_power_and_thermal_thresholds(self):
+        gov = self._governor()
+        for _ in range(3):
+            gov.observe(_stats(power=40))
+        self.assertEqual(gov.level, CONSTRAINED)
+        self.assertIn("power", gov.decisions[-1]["reasons"][0])
+
+        gov = self._governor(power_high=0)
+        for _ in range(3):
+            gov.observe(_stats(power=400))
+        self.assertEqual(gov.level, NORMAL)
+        gov.observe(_stats(thermal="Critical"))
+        self.assertEqual(gov.level, CRITICAL)
+
+    def test_unavailable_power_is_ignored(self):
+        gov = self._governor()
+        for _ in range(3):
+            gov.observe(_stats(power=-1.0))
+        self.assertIsNone(gov.rolling()["power_w"])
+        self.assertEqual(gov.level, NORMAL)
+
+    def test_disabled_governor_never_changes(self):
+        gov = self._governor(enabled=False)
+        for _ in range(3):
+            gov.observe(_stats(ram_pct=99, thermal="Critical"))
+        self.assertEqual(gov.level, NORMAL)
+
+    def test_translation_backend_routing(self):
+        manager = MagicMock()
+        gov = self._governor()
+        self.assertIs(gov.translation_backend(manager), manager.llm_general)
+        gov._apply(CONSTRAINED, ["test"])
+        self.assertIs(gov.translation_backend(manager), manager.llm_router)
+        manager.llm_router = None
+        self.assertIs(gov.translation_backend(manager), manager.llm_general)
+        gov._apply(CRITICAL, ["test"])
+        self.assertIsNone(gov.translation_backend(manager))
+
+class TestAdmissionGate(unittest.TestCase):
+    def test_limit_and_dynamic_resize(self):
+        async def scenario():
+            gate = AdmissionGate(2)
+            running, peak = 0, 0
+
+            async def job():
+                nonlocal running, peak
+                await gate.acquire()
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                gate.release()
+
+            await asyncio.gather(*(job() for _ in range(6)))
+            first_peak = peak
+            gate.set_limit(1)
+            peak = 0
+            await asyncio.gather(*(job() for _ in range(4)))
+            return first_peak, peak, gate.active, gate.waiting
+
+        self.assertEqual(asyncio.run(scenario()), (2, 1, 0, 0))
+
+    def test_raising_limit_wakes_waiters(self):
+        async def scenario():
+            gate = AdmissionGate(1)
+            await gate.acquire()
+            waiter = asyncio.create_task(gate.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(gate.waiting, 1)
+            gate.set_limit(2)
+            await asyncio.wait_for(waiter, 1)
+            return gate.active
+
+        self.assertEqual(asyncio.run(scenario()), 2)
+
+if __name__ == "__main__":
+    unittest.main()
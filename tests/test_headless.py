@@ -0,0 +1,84 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import json
+import unittest
+from core.headless import analyze_events, analyze_result, sse_event
+from core.sessions import SessionStore
+
+class FakeService:
+    def __init__(self, answer: str, is_security: bool = True, precomputed: dict = None):
+        self.answer = answer
+        self.is_security = is_security
+        self.precomputed = precomputed
+        self.translated = []
+
+    async def generate_response(self, user_input, chat_history, target_lang="English", cancel_token=None, fresh=False):
+        yield {"type": "meta", "author": "Foundation-Sec", "is_security": self.is_security,
+               "compaction": None, "map_reduce": False}
+        for word in self.answer.split(" "):
+            yield {"type": "token", "content": word + " "}
+        yield {"type": "final", "full_content": self.answer + " ", "elapsed": 0.5,
+               "tokens": {"total": 12, "prompt": 8, "completion": 4}, "speculative": None, "cancelled": None,
+               "precomputed": None if fresh else self.precomputed}
+
+    async def translate_response(self, text, target_lang, cancel_token=None):
+        self.translated.append(text)
+        yield {"type": "meta", "author": "Translator"}
+        yield {"type": "token", "content": "翻譯結果"}
+        yield {"type": "final", "full_content": "翻譯結果", "elapsed": 0.2, "tokens": {"total": 5}}
+
+class TestHeadlessAnalysis(unittest.TestCase):
+    def test_json_result_includes_usage_timing_and_translation(self):
+        service = FakeService("Block the source IP at the WAF and rotate the exposed credentials.")
+        result = asyncio.run(analyze_result(analyze_events(service, "alert", [], lang="zh-TW", translate=True)))
+        self.assertEqual(result["author"], "Foundation-Sec")
+        self.assertEqual(result["usage"]["total"], 12)
+        self.assertIn("generation_s", result["timing"])
+        self.assertIn("total_s", result["timing"])
+        self.assertEqual(result["translation"]["full_content"], "翻譯結果")
+        self.assertEqual(len(service.translated), 1)
+
+    def test_no_translation_unless_asked_or_for_general_answers(self):
+        service = FakeService("Hello there, this is a friendly general answer.", is_security=False)
+        result = asyncio.run(analyze_result(analyze_events(service, "hi", [], lang="zh-TW", translate=True)))
+        self.assertIsNone(result["translation"])
+        service = FakeService("Block the source IP at the WAF.")
+        result = asyncio.run(analyze_result(analyze_events(service, "alert", [], lang="zh-TW", translate=False)))
+        self.assertIsNone(result["translation"])
+
+    def test_precomputed_translation_is_used_unless_fresh(self):
+        info = {"playbook_id": 1, "title": "SQLi", "score": 0.93, "translation": {"lang": "zh-TW", "content": "預先翻譯"}}
+        service = FakeService("Block the source IP at the WAF.", precomputed=info)
+        result = asyncio.run(analyze_result(analyze_events(service, "alert", [], lang="zh-TW", translate=True)))
+        self.assertEqual(result["precomputed"]["playbook_id"], 1)
+        self.assertEqual(result["translation"]["full_content"], "預先翻譯")
+        self.assertEqual(service.translated, [])
+
+        result = asyncio.run(analyze_result(analyze_events(service, "alert", [], lang="zh-TW", translate=True, fresh=True)))
+        self.assertIsNone(result["precomputed"])
+        self.assertEqual(result["translation"]["full_content"], "翻譯結果")
+
+    def test_sse_event_format(self):
+        event = sse_event({"type": "token", "content": "封鎖 IP"})
+        self.assertTrue(event.startswith("event: token\ndata: "))
+        self.assertTrue(event.endswith("\n\n"))
+        self.assertEqual(json.loads(event.split("data: ", 1)[1])["content"], "封鎖 IP")
+
+class TestSessionStore(unittest.TestCase):
+    def test_history_is_bounded_by_turns_and_sessions(self):
+        store = SessionStore(max_sessions=2, ttl=3600, max_turns=2)
+        for i in range(3):
+            store.append("a", f"q{i}", f"a{i}")
+        self.assertEqual([m["content"] for m in store.history("a")], ["q1", "a1", "q2", "a2"])
+        store.append("b", "q", "a")
+        store.append("c", "q", "a")
+        self.assertEqual(store.history("a"), [])
+        self.assertEqual(len(store), 2)
+
+    def test_expired_sessions_are_dropped(self):
+        store = SessionStore(max_sessions=10, ttl=-1, max_turns=2)
+        store.append("a", "q", "a")
+        self.assertEqual(store.history("a"), [])
+
+if __name__ == '__main__':
+    unittest.main()
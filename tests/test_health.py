@@ -0,0 +1,61 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import core.services as services
+from core.health import deep_health
+
+def _dep(name, ok, required):
+    return {"name": name, "url": f"http://{name}", "ok": ok, "status": 200 if ok else None,
+            "latency_ms": 1.0, "error": None if ok else "ConnectError", "required": required}
+
+class TestDeepHealth(unittest.TestCase):
+    def setUp(self):
+        self._saved = dict(services._instances)
+        services._instances.clear()
+
+    def tearDown(self):
+        services._instances.clear()
+        services._instances.update(self._saved)
+
+    def _run(self, deps):
+        async def fake_probe(*args, **kwargs):
+            return {d["name"]: d for d in deps}
+        with patch("core.health.probe_dependencies", fake_probe):
+            return asyncio.run(deep_health())
+
+    def test_ready_but_degraded_when_optional_dependency_down(self):
+        manager = MagicMock(llm_router=None)
+        manager.llm_general.kind = "llama_cpp"
+        manager.llm_general.busy = True
+        manager.llm_general.waiting = 2
+        manager.llm_sec.kind = "openai"
+        del manager.llm_sec.waiting
+        services._instances["llm_manager"] = manager
+
+        with patch.object(services, "last_hw_sample_at", time.time() - 3):
+            report = self._run([_dep("qdrant", True, True), _dep("influxdb", False, False)])
+
+        self.assertTrue(report["ready"])
+        self.assertEqual(report["status"], "degraded")
+        self.assertEqual(report["models"]["general"], {"loaded": True, "backend": "llama_cpp", "busy": True, "waiting": 2})
+        self.assertEqual(report["models"]["security"], {"loaded": True, "backend": "openai"})
+        self.assertFalse(report["models"]["router"]["loaded"])
+        self.assertGreaterEqual(report["hardware"]["last_sample_age_s"], 3)
+
+    def test_unavailable_without_models_and_never_builds_singletons(self):
+        report = self._run([_dep("qdrant", True, True)])
+        self.assertFalse(report["ready"])
+        self.assertEqual(report["status"], "unavailable")
+        self.assertNotIn("llm_manager", services._instances)
+        self.assertIsNone(report["hardware"]["last_sample_age_s"])
+        self.assertIsInstance(report["breakers"], dict)
+
+    def test_required_dependency_down_is_not_ready(self):
+        services._instances["llm_manager"] = MagicMock(llm_router=None)
+        report = self._run([_dep("qdrant", False, True), _dep("langfuse", True, False)])
+        self.assertFalse(report["ready"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from core.ingest import PlaybookIngestor, _iter_json_array, iter_records, to_point_id
+
+DOCS = [{"id": i, "title": f"Playbook {i}", "content": f"Handle incident type {i} [with] {{braces}}"} for i in range(1, 12)]
+
+class TestCorpusReading(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name: str, text: str) -> str:
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_json_array_is_decoded_across_read_boundaries(self):
+        text = json.dumps(DOCS, indent=4)
+        self.assertEqual(list(_iter_json_array(io.StringIO(text), read_size=7)), DOCS)
+
+    def test_iter_records_detects_format(self):
+        array_path = self._write("playbooks.json", "\n  " + json.dumps(DOCS))
+        jsonl_path = self._write("playbooks.jsonl", "\n".join(json.dumps(d) for d in DOCS[:3]) + "\n{broken\n\n")
+        self.assertEqual(list(iter_records(array_path)), DOCS)
+        self.assertEqual(list(iter_records(jsonl_path)), DOCS[:3])
+
+    def test_to_point_id(self):
+        self.assertEqual(to_point_id(7), 7)
+        self.assertEqual(to_point_id("42"), 42)
+        self.assertEqual(to_point_id("kb-ssh-01"), to_point_id("kb-ssh-01"))
+        self.assertNotEqual(to_point_id("kb-ssh-01"), to_point_id("kb-ssh-02"))
+
+class TestPlaybookIngestor(unittest.TestCase):
+    def test_run_batches_and_upserts_every_document(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "kb.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for d in DOCS + [{"title": "no id or content"}]:
+                    f.write(json.dumps(d) + "\n")
+
+            client = MagicMock()
+            client.embedding_model_name = "BAAI/bge-small-en-v1.5"
+            client.get_vector_field_name.return_value = "fast-bge-small-en-v1.5"
+            client.collection_exists.return_value = False
+            embedded = []
+
+            def embed(docs):
+                embedded.append(len(docs))
+                return [[0.1, 0.2] for _ in docs]
+
+            ingestor = PlaybookIngestor(client, "security_playbooks", batch_size=4, workers=0, embed_fn=embed)
+            stats = ingestor.run(path)
+
+        self.assertEqual(stats.docs, len(DOCS))
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(embedded, [4, 4, 3])
+        self.assertTrue(client.create_collection.called)
+        points = [p for call in client.upsert.call_args_list for p in call.kwargs["points"]]
+        self.assertEqual(sorted(p.id for p in points), [d["id"] for d in DOCS])
+        self.assertEqual(points[0].payload["document"], DOCS[0]["content"])
+        self.assertEqual(points[0].payload["title"], DOCS[0]["title"])
+
+if __name__ == '__main__':
+    unittest.main()
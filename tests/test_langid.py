@@ -0,0 +1,46 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import unittest
+from core.langid import detect_language, foreign_runs, split_segments, translation_plan, StreamingLanguageDetector
+
+class TestLanguageIdentification(unittest.TestCase):
+    def test_detects_every_ui_language(self):
+        samples = {
+            "en": "The attacker is probing the server for backup files and the logs show it.",
+            "zh-TW": "攻擊者正在掃描伺服器上的備份檔案，建議立即封鎖來源 IP。",
+            "ja": "攻撃者はサーバー上のバックアップファイルを探しています。",
+            "ko": "공격자가 서버의 백업 파일을 탐색하고 있습니다.",
+            "th": "ผู้โจมตีกำลังค้นหาไฟล์สำรองบนเซิร์ฟเวอร์",
+            "hi": "हमलावर सर्वर पर बैकअप फ़ाइलों की खोज कर रहा है।",
+            "es": "El atacante está buscando archivos de respaldo en el servidor de la empresa.",
+            "vi": "Kẻ tấn công đang tìm kiếm các tệp sao lưu trên máy chủ của công ty.",
+        }
+        for lang, text in samples.items():
+            self.assertEqual(detect_language(text)[0], lang, text)
+
+    def test_no_letters(self):
+        self.assertEqual(detect_language("192.168.0.1 :: 404"), (None, 0.0))
+
+    def test_streaming_decides_early(self):
+        detector = StreamingLanguageDetector()
+        decisions = [detector.feed(piece) for piece in ["攻擊者正在", "掃描伺服器上的", "備份檔案，建議", "立即封鎖來源。"]]
+        self.assertEqual(decisions[-1], "zh-TW")
+
+    def test_foreign_runs_cover_only_other_language_segments(self):
+        text = "**摘要**: 這是攻擊分析。\n\n- Root cause: the server exposes the backup file.\n- 緩解: 刪除備份檔案。"
+        runs = foreign_runs(text, "zh-TW")
+        segments = split_segments(text)
+        self.assertEqual(len(runs), 1)
+        self.assertIn("Root cause", "".join(segments[runs[0][0]:runs[0][1]]))
+        self.assertEqual("".join(segments), text)
+
+    def test_translation_plan(self):
+        english = "The attacker is probing the server for backup files."
+        self.assertEqual(translation_plan(english, "zh-TW"), [(english, True)])
+        self.assertEqual(translation_plan("這是攻擊分析，建議立即封鎖來源。", "zh-TW"), [])
+        mixed = "**摘要**: 這是攻擊分析。\n- Root cause: the server exposes the backup file.\n- 緩解: 刪除備份檔案。"
+        plan = translation_plan(mixed, "zh-TW")
+        self.assertEqual([t for _, t in plan], [False, True, False])
+        self.assertEqual("".join(part for part, _ in plan), mixed)
+
+if __name__ == '__main__':
+    unittest.main()
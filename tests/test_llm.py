@@ -1,7 +1,11 @@
 # Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import sys
+import tempfile
+import time
 import unittest
 from unittest.mock import patch, MagicMock
-from core.llm import LLMManager
+from core.llm import LLMManager, LlamaCppBackend, _parse_sse_line, _SSE_DONE, speculative_stats
 
 class TestLLMManager(unittest.TestCase):
     def setUp(self):
@@ -21,5 +25,138 @@ class TestLLMManager(unittest.TestCase):
         self.assertIn("cybersecurity", sec_msg)
         self.assertIn("helpful AI assistant", gen_msg)
 
+    def test_classify_intent_prefers_router_model(self):
+        router = MagicMock()
+        router.create_chat_completion.return_value = {"choices": [{"message": {"content": "YES"}}]}
+        self.llm_manager.llm_general = MagicMock()
+        self.llm_manager.llm_router = router
+        self.assertTrue(self.llm_manager.classify_intent("Can you review my deployment plan?"))
+        self.assertTrue(router.create_chat_completion.called)
+        self.assertFalse(self.llm_manager.llm_general.create_chat_completion.called)
+
+    @patch("core.llm.LLM_TUNING_ENABLED", False)
+    @patch("core.memory_profiles.LLM_USE_MLOCK", None)
+    def test_load_applies_memory_profile(self):
+        llama = MagicMock()
+        llama.return_value.metadata = {}
+        manager = LLMManager(memory_profile="auto", ram_total_gb=lambda: 64.0)
+        with tempfile.NamedTemporaryFile(suffix=".gguf") as f, patch.dict(sys.modules, {"llama_cpp": MagicMock(Llama=llama)}):
+            manager.load_security_model(f.name)
+        kwargs = llama.call_args.kwargs
+        self.assertEqual(manager.memory_profile, "long-context")
+        self.assertEqual(kwargs["n_ctx"], 8192)
+        self.assertEqual((kwargs["type_k"], kwargs["type_v"]), (8, 8))
+        self.assertTrue(kwargs["flash_attn"])
+        self.assertFalse(kwargs["use_mlock"])
+        self.assertEqual(manager.context_size("security"), 8192)
+
+    def test_parse_sse_line(self):
+        chunk = _parse_sse_line('data: {"choices": [{"delta": {"content": "Hi"}}]}')
+        self.assertEqual(chunk["choices"][0]["delta"]["content"], "Hi")
+        self.assertIs(_parse_sse_line("data: [DONE]"), _SSE_DONE)
+        self.assertIsNone(_parse_sse_line(": keep-alive"))
+        self.assertIsNone(_parse_sse_line("data: {broken"))
+
+    def test_speculative_stats(self):
+        # 3 verification steps emitting 9 tokens -> 6 accepted out of 12 drafted
+        stats = speculative_stats(drafted=12, draft_calls=3, generated=9)
+        self.assertEqual(stats["accepted"], 6)
+        self.assertEqual(stats["acceptance_rate"], 0.5)
+        self.assertEqual(speculative_stats(0, 0, 5)["acceptance_rate"], 0.0)
+
+class TestLlamaCppBackendCancellation(unittest.TestCase):
+    def _slow_model(self, closed: list):
+        def stream(**kwargs):
+            try:
+                for i in range(1000):
+                    time.sleep(0.01)
+                    yield {"choices": [{"delta": {"content": f"t{i} "}}]}
+            finally:
+                closed.append(True)
+        model = MagicMock()
+        model.create_chat_completion.side_effect = stream
+        return model
+
+    def test_closing_stream_releases_model(self):
+        closed = []
+        backend = LlamaCppBackend(self._slow_model(closed), name="test")
+
+        async def run():
+            stream = backend.stream_chat([{"role": "user", "content": "hi"}], max_tokens=1000)
+            received = 0
+            async for _ in stream:
+                received += 1
+                if received == 3:
+                    break
+            await stream.aclose()
+            return received
+
+        self.assertEqual(asyncio.run(run()), 3)
+        self.assertEqual(closed, [True])
+        self.assertFalse(backend._lock.locked())
+
+    def test_task_cancel_mid_token_releases_model_after_token(self):
+        closed = []
+        backend = LlamaCppBackend(self._slow_model(closed), name="test")
+
+        async def consume():
+            async for _ in backend.stream_chat([{"role": "user", "content": "hi"}], max_tokens=1000):
+                pass
+
+        async def run():
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The in-flight token finishes on the worker thread, then the lock is released
+            for _ in range(100):
+                if not backend._lock.locked():
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertFalse(backend._lock.locked())
+        self.assertEqual(closed, [True])
+
+class TestLlamaCppBackendPrefill(unittest.TestCase):
+    SYSTEM = [{"role": "system", "content": "You are a security analyst."}]
+
+    def setUp(self):
+        # prefill() only needs the chat formatter; a stub keeps these tests independent of the native wheel
+        chat_format = MagicMock()
+        modules = patch.dict(sys.modules, {"llama_cpp": MagicMock(llama_chat_format=chat_format),
+                                           "llama_cpp.llama_chat_format": chat_format})
+        modules.start()
+        self.addCleanup(modules.stop)
+
+    def _backend(self, cached: list):
+        model = MagicMock()
+        # Formatted prompt = system block [1, 2, 3, 4] + assistant header [9, 8]
+        model.tokenize.side_effect = lambda data, add_bos, special: [1, 2, 3, 4, 9, 8] if add_bos else [9, 8]
+        model.input_ids = cached + [0] * 10
+        model.n_tokens = len(cached)
+        return LlamaCppBackend(model, name="test"), model
+
+    def test_prefill_evaluates_only_uncached_suffix(self):
+        backend, model = self._backend([1, 2, 7])
+        self.assertEqual(backend.prefill(self.SYSTEM), 2)
+        self.assertEqual(model.n_tokens, 2)
+        model.eval.assert_called_once_with([3, 4])
+        self.assertFalse(backend._lock.locked())
+
+    def test_prefill_keeps_longer_cached_prefix(self):
+        # A previous turn left system prompt + history in the cache; prefilling must not truncate it
+        backend, model = self._backend([1, 2, 3, 4, 5, 6])
+        self.assertEqual(backend.prefill(self.SYSTEM), 0)
+        self.assertEqual(model.n_tokens, 6)
+        model.eval.assert_not_called()
+
+    def test_prefill_skips_busy_model(self):
+        backend, model = self._backend([])
+        backend._lock.acquire()
+        self.assertEqual(backend.prefill(self.SYSTEM), 0)
+        model.eval.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import unittest
+from core.log_compactor import LogCompactor
+
+SSH_LINE = "Oct 10 13:{m:02d}:36 web01 sshd[{pid}]: Failed password for root from 203.0.113.{ip} port {port} ssh2"
+NGINX_LINE = '198.51.100.{ip} - - [10/Oct/2024:13:55:{s:02d} +0000] "GET /backup{n}.bak HTTP/1.1" 404 153 "-" "curl/7.68"'
+
+class TestLogCompactor(unittest.TestCase):
+    def setUp(self):
+        self.compactor = LogCompactor(min_lines=8)
+
+    def test_repeated_lines_collapse_into_templates(self):
+        lines = [SSH_LINE.format(m=i % 60, pid=1000 + i, ip=i % 5, port=40000 + i) for i in range(120)]
+        lines += [NGINX_LINE.format(ip=i % 3, s=i % 60, n=i % 4) for i in range(60)]
+        result = self.compactor.compact("\n".join(lines))
+
+        self.assertIsNotNone(result)
+        self.assertEqual(result.lines, 180)
+        self.assertEqual(result.templates, 2)
+        self.assertGreater(result.ratio, 10)
+        self.assertIn("(x120)", result.text)
+        self.assertIn("(x60)", result.text)
+        self.assertIn("Failed password for root from <IP>", result.text)
+        self.assertIn("Oct 10 13:00:36 ..", result.text)
+
+    def test_prose_is_kept_verbatim(self):
+        lines = [SSH_LINE.format(m=i, pid=2000 + i, ip=1, port=50000 + i) for i in range(20)]
+        result = self.compactor.compact("Is this a brute force attack?\n" + "\n".join(lines))
+        self.assertTrue(result.text.startswith("Is this a brute force attack?"))
+
+    def test_short_or_non_log_input_is_untouched(self):
+        self.assertIsNone(self.compactor.compact("How do I rotate SSH keys?"))
+        self.assertIsNone(self.compactor.compact("\n".join(["just some prose here"] * 20)))
+
+    def test_stats_shape(self):
+        lines = [NGINX_LINE.format(ip=1, s=i, n=1) for i in range(10)]
+        stats = self.compactor.compact("\n".join(lines)).stats()
+        self.assertEqual(set(stats), {"lines", "templates", "ratio"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import logging
+import os
+import queue
+import unittest
+from unittest.mock import patch
+import structlog
+from core.config import _json_env
+from core.logger import EventSampler, NonBlockingQueueHandler
+
+class TestEventSampler(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        clock = patch("core.logger.time.monotonic", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def _kept(self, sampler, event: str, n: int, method: str = "info") -> list:
+        kept = []
+        for _ in range(n):
+            try:
+                kept.append(sampler(None, method, {"event": event}))
+            except structlog.DropEvent:
+                pass
+        return kept
+
+    def test_rate_limit_per_window_reports_suppressed(self):
+        sampler = EventSampler({"Intent classified": {"limit": 2, "per": 1.0}})
+        self.assertEqual(len(self._kept(sampler, "Intent classified as 'Security'", 5)), 2)
+        self.now += 1.0
+        kept = self._kept(sampler, "Intent classified as 'General'", 1)
+        self.assertEqual(kept[0]["suppressed"], 3)
+
+    def test_ratio_sampling_is_deterministic(self):
+        sampler = EventSampler({"Generating response": {"sample": 0.25}})
+        self.assertEqual(len(self._kept(sampler, "Generating response using Foundation-Sec", 100)), 25)
+
+    def test_warnings_and_unmatched_events_pass(self):
+        sampler = EventSampler({"Noisy": {"limit": 0}})
+        self.assertEqual(len(self._kept(sampler, "Noisy event", 3, method="warning")), 3)
+        self.assertEqual(len(self._kept(sampler, "Other event", 3)), 3)
+        self.assertEqual(len(self._kept(sampler, "Noisy event", 3)), 0)
+
+class TestNonBlockingQueueHandler(unittest.TestCase):
+    def test_full_queue_drops_and_counts(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+        for i in range(5):
+            handler.emit(logging.LogRecord("x", logging.INFO, __file__, 1, f"message {i}", None, None))
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "message 0")
+
+class TestJsonEnv(unittest.TestCase):
+    def test_malformed_values_fall_back_to_default(self):
+        for raw in ('{"Intent": {"limit": 1}', '["Intent"]'):
+            with patch.dict(os.environ, {"LOG_SAMPLE_RULES": raw}), self.assertLogs("core.config", "WARNING"):
+                self.assertEqual(_json_env("LOG_SAMPLE_RULES", {}), {})
+
+    def test_valid_object_is_parsed(self):
+        with patch.dict(os.environ, {"LOG_SAMPLE_RULES": '{"Intent": {"limit": 1}}'}):
+            self.assertEqual(_json_env("LOG_SAMPLE_RULES", {}), {"Intent": {"limit": 1}})
+
+if __name__ == "__main__":
+    unittest.main()
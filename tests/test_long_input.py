@@ -0,0 +1,83 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import re
+import unittest
+from core.long_input import LongInputAnalyzer, split_text
+
+def _tokenize(data: bytes) -> list:
+    # Prose packs about four chars per token, hex/digits one char per token
+    return re.findall(r"[0-9]|[^0-9\s]{1,4}", data.decode("utf-8"))
+
+class FakeLLM:
+    """tokenize + stream_chat backend; every map call answers with `answer_words` words."""
+    def __init__(self, answer_words: int = 100):
+        self.answer_words = answer_words
+        self.calls = []
+
+    def tokenize(self, data: bytes) -> list:
+        return _tokenize(data)
+
+    async def stream_chat(self, messages, **kwargs):
+        self.calls.append(messages)
+        yield {"choices": [{"delta": {"content": " ".join(["word"] * self.answer_words)}}]}
+
+def _run(analyzer, text):
+    async def collect():
+        return [chunk async for chunk in analyzer.analyze(text)]
+    return asyncio.run(collect())
+
+class TestSplitText(unittest.TestCase):
+    def test_splits_on_line_boundaries(self):
+        text = "\n".join(f"line {i}" for i in range(10))
+        chunks = split_text(text, 20)
+        self.assertTrue(all(len(c) <= 20 for c in chunks))
+        self.assertEqual("\n".join(chunks), text)
+
+    def test_hard_splits_overlong_lines_and_drops_blank_chunks(self):
+        self.assertEqual(split_text("a" * 25, 10), ["a" * 10, "a" * 10, "a" * 5])
+        self.assertEqual(split_text("\n   \n\n", 2), [])
+
+class TestLongInputAnalyzer(unittest.TestCase):
+    def test_fits_uses_context_minus_answer_budget(self):
+        analyzer = LongInputAnalyzer(FakeLLM(), n_ctx=1000, answer_max_tokens=400)
+        small = [{"role": "user", "content": "short alert"}]
+        large = [{"role": "user", "content": " ".join(["word"] * 700)}]
+        self.assertTrue(asyncio.run(analyzer.fits(small)))
+        self.assertFalse(asyncio.run(analyzer.fits(large)))
+
+    def test_multi_round_merge_until_findings_fit(self):
+        llm = FakeLLM(answer_words=100)
+        analyzer = LongInputAnalyzer(llm, n_ctx=1000, answer_max_tokens=400)
+        text = "\n".join(" ".join(["word"] * 10) for _ in range(1200))
+        chunks = _run(analyzer, text)
+        stages = {c["stage"] for c in chunks if c["type"] == "progress"}
+        self.assertIn("map", stages)
+        self.assertIn("merge-1", stages)
+        self.assertIn("merge-2", stages)
+        final = chunks[-1]
+        self.assertEqual(final["type"], "findings")
+        self.assertGreater(final["segments"], 1)
+        self.assertLessEqual(asyncio.run(analyzer.count_tokens("\n\n".join(final["findings"]))), 1000 - 400 - 256)
+        self.assertGreater(analyzer.usage["prompt"], 0)
+
+    def test_dense_input_after_the_sample_is_resplit(self):
+        llm = FakeLLM(answer_words=10)
+        analyzer = LongInputAnalyzer(llm, n_ctx=1000, answer_max_tokens=400)
+        prose = "\n".join(" ".join(["word"] * 10) for _ in range(100))
+        hexdump = "\n".join("0123456789" * 30 for _ in range(20))
+        _run(analyzer, prose + "\n" + hexdump)
+        budget = 1000 - 192 - 256
+        for messages in llm.calls:
+            segment = messages[1]["content"].split(":\n", 1)[1].rsplit("\n\nFINDINGS:", 1)[0]
+            self.assertLessEqual(len(_tokenize(segment.encode("utf-8"))), budget)
+
+    def test_findings_are_truncated_when_merge_rounds_run_out(self):
+        analyzer = LongInputAnalyzer(FakeLLM(answer_words=200), n_ctx=1000, answer_max_tokens=400)
+        analyzer.MAX_MERGE_ROUNDS = 0
+        text = "\n".join(" ".join(["word"] * 10) for _ in range(600))
+        final = _run(analyzer, text)[-1]
+        self.assertLessEqual(asyncio.run(analyzer.count_tokens("\n\n".join(final["findings"]))), 1000 - 400 - 256)
+        self.assertTrue(all(final["findings"]))
+
+if __name__ == "__main__":
+    unittest.main()
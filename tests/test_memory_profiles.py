@@ -0,0 +1,67 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import unittest
+from unittest.mock import patch
+from core.memory_profiles import KV_CACHE_TYPES, select_profile, resolve_profile, runtime_settings, kv_cache_bytes
+
+# GGUF metadata of a Llama-3 8B model (32 layers, 8 KV heads of 128 dims)
+LLAMA3_8B = {"general.architecture": "llama", "llama.block_count": "32", "llama.attention.head_count": "32",
+             "llama.attention.head_count_kv": "8", "llama.embedding_length": "4096"}
+
+class TestMemoryProfiles(unittest.TestCase):
+    def test_profile_selected_from_ram(self):
+        self.assertEqual(select_profile(8.0), "compact")
+        self.assertEqual(select_profile(16.0), "balanced")
+        self.assertEqual(select_profile(24.0), "balanced")
+        self.assertEqual(select_profile(64.0), "long-context")
+        self.assertEqual(resolve_profile("auto", ram_total_gb=16.0), "balanced")
+        self.assertEqual(resolve_profile("compact", ram_total_gb=64.0), "compact")
+
+    def test_ram_source_only_called_for_auto(self):
+        probes = []
+        def ram_total():
+            probes.append(1)
+            return 32.0
+        self.assertEqual(resolve_profile("balanced", ram_total_gb=ram_total), "balanced")
+        self.assertEqual(probes, [])
+        self.assertEqual(resolve_profile("auto", ram_total_gb=ram_total), "long-context")
+        self.assertEqual(probes, [1])
+
+    @patch("core.memory_profiles.LLM_USE_MLOCK", None)
+    def test_runtime_settings_follow_profile(self):
+        settings = runtime_settings("security", "long-context")
+        self.assertEqual(settings["n_ctx"], 8192)
+        self.assertEqual(settings["type_k"], KV_CACHE_TYPES["q8_0"][0])
+        self.assertTrue(settings["flash_attn"])
+        self.assertFalse(settings["use_mlock"])
+        self.assertEqual(runtime_settings("router", "long-context")["n_ctx"], 512)
+
+    @patch("core.memory_profiles.LLM_USE_MLOCK", None)
+    def test_auto_never_pins_weights(self):
+        for ram_total in (8.0, 16.0, 64.0):
+            profile = select_profile(ram_total)
+            self.assertFalse(runtime_settings("security", profile)["use_mlock"], profile)
+
+    @patch("core.memory_profiles.LLM_USE_MLOCK", True)
+    def test_explicit_overrides_win(self):
+        with patch.dict("core.memory_profiles.MODEL_ROLES", {"security": {"n_ctx": 3000}}):
+            settings = runtime_settings("security", "long-context")
+        self.assertEqual(settings["n_ctx"], 3000)
+        self.assertTrue(settings["use_mlock"])
+
+    def test_quantized_v_cache_needs_flash_attention(self):
+        profiles = {"custom": {"min_ram_gb": 0, "n_ctx": {}, "type_k": "q8_0", "type_v": "q4_0",
+                               "flash_attn": False, "use_mlock": False}}
+        with patch.dict("core.memory_profiles.MEMORY_PROFILES", profiles):
+            settings = runtime_settings("general", "custom")
+        self.assertEqual(settings["type_v"], KV_CACHE_TYPES["f16"][0])
+        self.assertEqual(settings["type_k"], KV_CACHE_TYPES["q8_0"][0])
+
+    def test_kv_cache_estimate(self):
+        f16, q8_0 = KV_CACHE_TYPES["f16"][0], KV_CACHE_TYPES["q8_0"][0]
+        self.assertEqual(kv_cache_bytes(LLAMA3_8B, 2048, f16, f16), 256 * 1024 ** 2)
+        # Twice the context in q8_0 costs only slightly more than the f16 cache
+        self.assertEqual(kv_cache_bytes(LLAMA3_8B, 4096, q8_0, q8_0), 272 * 1024 ** 2)
+        self.assertEqual(kv_cache_bytes({}, 2048, f16, f16), 0)
+
+if __name__ == "__main__":
+    unittest.main()
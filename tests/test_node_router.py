@@ -0,0 +1,120 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import httpx
+from core.node_router import NodeRouter, parse_nodes, graphql_ws_url
+
+def _status(active=0, waiting=0, ram=50.0, models=("general", "security"), level="normal"):
+    return {"stats": {"ramPct": ram}, "load": {"active": active, "waiting": waiting,
+                                                "models": list(models), "governorLevel": level}}
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class TestNodeRouter(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.router = NodeRouter([("a", "http://a:8000"), ("b", "http://b:8000"), ("c", "http://c:8000")],
+                                 stale_after=5.0, clock=self.clock)
+
+    def test_parse_nodes(self):
+        self.assertEqual(parse_nodes("a=http://h1:8000/, http://h2:8000"),
+                         [("a", "http://h1:8000"), ("node2", "http://h2:8000")])
+        self.assertEqual(parse_nodes(""), [])
+        self.assertEqual(graphql_ws_url("https://h:1"), "wss://h:1/graphql")
+
+    def test_picks_least_loaded_node_with_models(self):
+        self.router.update("a", _status(active=2, waiting=1))
+        self.router.update("b", _status(active=1))
+        self.router.update("c", _status(models=("general",)))
+        self.assertEqual(self.router.pick().name, "b")
+
+    def test_local_dispatches_count_until_next_update(self):
+        self.router.update("a", _status())
+        self.router.update("b", _status(ram=60.0))
+        picks = [self.router.pick().name for _ in range(4)]
+        self.assertEqual(picks, ["a", "b", "a", "b"])
+        self.router.update("a", _status(active=2))
+        self.assertEqual(self.router.nodes["a"].recent, 0)
+
+    def test_governor_level_penalizes_node(self):
+        self.router.update("a", _status(level="critical"))
+        self.router.update("b", _status(active=2))
+        self.assertEqual(self.router.pick().name, "b")
+
+    def test_session_sticks_then_fails_over_when_node_goes_quiet(self):
+        self.router.update("a", _status())
+        self.router.update("b", _status(active=3))
+        self.assertEqual(self.router.pick("s1").name, "a")
+        self.router.update("a", _status(active=5))
+        # Busier now, but the session keeps its history and KV cache on a
+        self.assertEqual(self.router.pick("s1").name, "a")
+        self.assertEqual(self.router.stats["sticky"], 1)
+
+        self.clock.now += 6.0
+        self.router.update("b", _status(active=3))
+        self.assertEqual(self.router.pick("s1").name, "b")
+        self.assertEqual(self.router.stats["failovers"], 1)
+        self.assertEqual(self.router.pick("s1").name, "b")
+
+    def test_no_healthy_node(self):
+        self.assertIsNone(self.router.pick())
+        self.router.update("a", _status())
+        self.clock.now += 10.0
+        self.assertIsNone(self.router.pick())
+        self.assertEqual(self.router.stats["rejected"], 2)
+        self.assertEqual(self.router.state()["healthy"], 0)
+
+    def test_session_table_is_bounded(self):
+        router = NodeRouter([("a", "http://a")], max_sessions=2, clock=self.clock)
+        router.update("a", _status())
+        for session in ("s1", "s2", "s3"):
+            router.pick(session)
+        self.assertEqual(router.state()["sessions"], 2)
+
+    def test_send_fails_over_on_connection_error_and_503(self):
+        self.router.update("a", _status())
+        self.router.update("b", _status(active=1))
+        self.router.update("c", _status(active=2))
+        ok = MagicMock(status_code=200)
+        unavailable = MagicMock(status_code=503, aclose=AsyncMock())
+        client = MagicMock()
+        client.build_request.side_effect = lambda method, url, **kw: url
+        client.send = AsyncMock(side_effect=[httpx.ConnectError("refused"), unavailable, ok])
+
+        node, response = asyncio.run(self.router.send(client, {"input": "x", "session_id": "s1"}))
+        self.assertEqual(node.name, "c")
+        self.assertIs(response, ok)
+        self.assertIsNone(self.router.nodes["a"].last_seen)
+        self.assertEqual(self.router.nodes["b"].error, "HTTP 503")
+        self.assertEqual([n.inflight for n in self.router.nodes.values()], [0, 0, 1])
+        self.router.finish(node)
+        self.assertEqual(node.inflight, 0)
+
+        client.send = AsyncMock(side_effect=httpx.ConnectError("refused"))
+        self.assertEqual(asyncio.run(self.router.send(client, {"input": "x"})), (None, None))
+
+    def test_release_closes_and_finishes_once(self):
+        self.router.update("a", _status())
+        client = MagicMock()
+        response = MagicMock(status_code=200, aclose=AsyncMock())
+        client.send = AsyncMock(return_value=response)
+        node, _ = asyncio.run(self.router.send(client, {"input": "x"}))
+        self.router.nodes["a"].inflight += 1  # another request still running on the node
+        cleanup = self.router.release(node, response)
+
+        async def run():
+            # Relay finally and response teardown both call it; the stream may also never have started
+            await cleanup()
+            await cleanup()
+        asyncio.run(run())
+        response.aclose.assert_awaited_once()
+        self.assertEqual(node.inflight, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from core.playbook_answers import PlaybookAnswerGenerator, content_hash, load_playbooks, save_playbooks
+
+def _completion(text: str) -> dict:
+    return {"choices": [{"message": {"content": text}}]}
+
+class TestPlaybookAnswerGenerator(unittest.TestCase):
+    def _manager(self):
+        manager = MagicMock()
+        manager.get_active_system_message.return_value = "system"
+        manager.llm_sec.create_chat_completion.return_value = _completion(" Block the IP. ")
+        manager.llm_general.create_chat_completion.side_effect = lambda messages, **kw: _completion(
+            f"[{messages[0]['content'][-20:]}]")
+        return manager
+
+    def test_generates_answer_and_translations(self):
+        manager = self._manager()
+        records = [{"id": 1, "title": "SQLi", "content": "Use parameterized queries."}]
+        stats = PlaybookAnswerGenerator(manager, langs=["en", "ja", "ko"]).run(records)
+
+        self.assertEqual(stats, {"generated": 1, "translations": 2, "skipped": 0})
+        self.assertEqual(records[0]["answers"]["en"], "Block the IP.")
+        self.assertEqual(set(records[0]["answers"]), {"en", "ja", "ko"})
+        self.assertEqual(records[0]["answers_hash"], content_hash(records[0], "system", False))
+        prompt = manager.llm_sec.create_chat_completion.call_args.kwargs["messages"][1]["content"]
+        self.assertIn("Use parameterized queries.", prompt)
+
+    def test_unchanged_records_are_skipped_and_edits_regenerate(self):
+        manager = self._manager()
+        records = [{"id": 1, "title": "SQLi", "content": "Use parameterized queries."}]
+        generator = PlaybookAnswerGenerator(manager, langs=["ja"])
+        generator.run(records)
+        self.assertEqual(generator.run(records)["skipped"], 1)
+
+        records[0]["content"] = "Use an ORM."
+        stats = generator.run(records)
+        self.assertEqual(stats["generated"], 1)
+        self.assertEqual(manager.llm_sec.create_chat_completion.call_count, 2)
+
+    def test_prompt_or_output_mode_change_regenerates(self):
+        manager = self._manager()
+        records = [{"id": 1, "title": "SQLi", "content": "Use parameterized queries."}]
+        generator = PlaybookAnswerGenerator(manager, langs=["ja"])
+        generator.run(records)
+        with patch("core.playbook_answers.STRUCTURED_OUTPUT_ENABLED", True):
+            self.assertNotEqual(generator.fingerprint(records[0]), records[0]["answers_hash"])
+
+        manager.get_active_system_message.return_value = "revised system"
+        self.assertEqual(generator.run(records)["generated"], 1)
+        self.assertEqual(generator.run(records)["skipped"], 1)
+
+    @patch("core.playbook_answers.STRUCTURED_OUTPUT_ENABLED", True)
+    def test_structured_mode_stores_the_parsed_analysis(self):
+        analysis = {"summary": "SQL injection attempt.", "root_causes": ["String-built query"],
+                    "mitigations": ["Use parameterized queries"], "severity": "high"}
+        manager = self._manager()
+        manager.llm_sec.create_chat_completion.return_value = _completion(json.dumps(analysis))
+        records = [{"id": 1, "title": "SQLi", "content": "Use parameterized queries.", "analysis": {"stale": True}}]
+        PlaybookAnswerGenerator(manager, langs=["ja"]).run(records)
+        self.assertEqual(records[0]["analysis"], analysis)
+        self.assertTrue(records[0]["answers"]["en"].startswith("**Summary**: SQL injection attempt."))
+
+    def test_missing_language_is_added_without_regenerating(self):
+        manager = self._manager()
+        records = [{"id": 1, "title": "SQLi", "content": "Use parameterized queries."}]
+        PlaybookAnswerGenerator(manager, langs=["ja"]).run(records)
+        stats = PlaybookAnswerGenerator(manager, langs=["ja", "ko"]).run(records)
+        self.assertEqual(stats, {"generated": 0, "translations": 1, "skipped": 0})
+
+class TestPlaybookFiles(unittest.TestCase):
+    def test_round_trip_keeps_format(self):
+        records = [{"id": 1, "content": "日本語", "answers": {"en": "x"}}]
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, text in [("a.json", json.dumps(records)), ("a.jsonl", json.dumps(records[0]) + "\n")]:
+                path = os.path.join(tmp, name)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                loaded, fmt = load_playbooks(path)
+                self.assertEqual(fmt, "json" if name.endswith(".json") else "jsonl")
+                save_playbooks(path, loaded, fmt)
+                self.assertEqual(load_playbooks(path), (records, fmt))
+
+if __name__ == "__main__":
+    unittest.main()
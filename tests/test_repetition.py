@@ -0,0 +1,61 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import unittest
+from core.repetition import RepetitionDetector
+
+def _words(text: str) -> list:
+    return [w + " " for w in text.split()]
+
+ANSWER = _words(
+    "1. Risk: the alert shows repeated failed SSH logins from one external address against the bastion host. "
+    "2. Impact: a successful brute force would expose the internal management network and stored credentials. "
+    "3. Mitigation: block the source at the firewall, enforce key based authentication, enable fail2ban, "
+    "rotate exposed credentials and review the authentication logs of every host reachable from the bastion. "
+    "4. Follow up: add an alert rule for bursts of failures from new addresses and document the response."
+)
+
+class TestRepetitionDetector(unittest.TestCase):
+    def _feed(self, detector, tokens):
+        for i, token in enumerate(tokens, 1):
+            if detector.feed(token):
+                return i
+        return None
+
+    def test_normal_answer_is_not_flagged(self):
+        detector = RepetitionDetector()
+        self.assertIsNone(self._feed(detector, ANSWER))
+        self.assertLess(detector.ngram_score(), 0.2)
+        self.assertEqual(detector.kept_text(), "".join(ANSWER))
+
+    def test_sentence_loop_is_stopped_and_trimmed(self):
+        sentence = _words("Check the firewall logs for the source address and block it.")
+        detector = RepetitionDetector(min_span=48)
+        stopped_at = self._feed(detector, ANSWER[:20] + sentence * 30)
+        loop = detector.detected
+        self.assertEqual(loop["method"], "suffix")
+        self.assertEqual(loop["period"], len(sentence))
+        # Stopped after ~48 repeated tokens instead of running through all 30 copies
+        self.assertLessEqual(stopped_at, 20 + len(sentence) * 5)
+        self.assertEqual(detector.kept_text(), "".join(ANSWER[:20] + sentence))
+
+    def test_short_period_needs_a_long_run(self):
+        detector = RepetitionDetector(min_span=48)
+        self.assertIsNone(self._feed(detector, ["-"] * 20))
+        self.assertIsNotNone(self._feed(detector, ["-"] * 30))
+        self.assertEqual(detector.detected["period"], 1)
+        self.assertEqual(detector.kept_text(), "-")
+
+    def test_near_loop_caught_by_ngram_score(self):
+        # The counter changes each time, so the tail is never an exact repeat
+        tokens = list(ANSWER[:10])
+        for i in range(40):
+            tokens += _words(f"Step {i}: review the firewall rules and block the suspicious address now.")
+        detector = RepetitionDetector(max_period=4, window=128, ngram_threshold=0.6)
+        self.assertIsNotNone(self._feed(detector, tokens))
+        loop = detector.detected
+        self.assertEqual(loop["method"], "ngram")
+        self.assertGreaterEqual(loop["score"], 0.6)
+        self.assertLess(loop["keep_tokens"], len(detector.tokens))
+        self.assertTrue(detector.kept_text().startswith("".join(ANSWER[:10])))
+
+if __name__ == "__main__":
+    unittest.main()
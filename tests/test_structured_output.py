@@ -0,0 +1,37 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import json
+import unittest
+from core.structured_output import MarkdownStream, close_partial_json, parse_analysis, render_markdown
+
+ANALYSIS = {"summary": "Brute-force SSH attempts against the bastion host.",
+            "root_causes": ["Password authentication is enabled", "No rate limiting on port 22"],
+            "mitigations": ["Disable password logins", "Enable fail2ban"], "severity": "high"}
+
+class TestStructuredOutput(unittest.TestCase):
+    def test_close_partial_json(self):
+        self.assertEqual(json.loads(close_partial_json('{"summary": "Brute')), {"summary": "Brute"})
+        self.assertEqual(json.loads(close_partial_json('{"a": ["x", "y\\')), {"a": ["x", "y"]})
+        with self.assertRaises(ValueError):
+            json.loads(close_partial_json('{"summary": "x", "root_'))
+
+    def test_parse_analysis(self):
+        self.assertEqual(parse_analysis(json.dumps(ANALYSIS)), ANALYSIS)
+        self.assertIsNone(parse_analysis('{"summary": "cut off", "root_causes": ["a"'))
+        self.assertIsNone(parse_analysis('{"summary": "no lists"}'))
+        self.assertIsNone(parse_analysis(json.dumps({**ANALYSIS, "severity": "apocalyptic"}))["severity"])
+
+    def test_render_markdown(self):
+        text = render_markdown(ANALYSIS)
+        self.assertTrue(text.startswith("**Summary**: Brute-force SSH"))
+        self.assertIn("**RCA**:\n- Password authentication is enabled\n- No rate limiting on port 22", text)
+        self.assertTrue(text.endswith("**Severity**: HIGH"))
+
+    def test_streamed_markdown_matches_final_rendering(self):
+        raw = json.dumps(ANALYSIS)
+        stream = MarkdownStream()
+        streamed = "".join(stream.feed(raw[i:i + 3]) for i in range(0, len(raw), 3))
+        self.assertEqual(streamed, render_markdown(ANALYSIS))
+        self.assertEqual(stream.text, streamed)
+
+if __name__ == "__main__":
+    unittest.main()
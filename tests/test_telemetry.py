@@ -0,0 +1,103 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import unittest
+import uuid
+from core.telemetry import Telemetry, _sampled
+
+class FakeObservation:
+    """Langfuse span/generation stand-in that records updates and whether it was ended."""
+    def __init__(self, client, kind: str, **fields):
+        self.client = client
+        self.kind = kind
+        self.fields = fields
+        self.id = f"{kind}-{len(client.observations)}"
+        self.trace = None
+        self.ended = False
+
+    def update(self, **fields):
+        self.fields.update(fields)
+        return self
+
+    def update_trace(self, **fields):
+        self.trace = fields
+        return self
+
+    def end(self):
+        self.ended = True
+        return self
+
+class FakeLangfuse:
+    def __init__(self):
+        self.observations = []
+        self.shut_down = False
+
+    def _start(self, kind: str, **fields) -> FakeObservation:
+        observation = FakeObservation(self, kind, **fields)
+        self.observations.append(observation)
+        return observation
+
+    def start_span(self, **fields):
+        return self._start("span", **fields)
+
+    def start_observation(self, as_type: str, **fields):
+        return self._start(as_type, **fields)
+
+    def shutdown(self):
+        self.shut_down = True
+
+class TestLangfuseRecording(unittest.TestCase):
+    def _telemetry(self, **kwargs):
+        self.client = FakeLangfuse()
+        return Telemetry(enabled=True, client=self.client, **kwargs)
+
+    def test_generations_attach_to_the_trace_root(self):
+        telemetry = self._telemetry()
+        with telemetry.trace("Chat Message", input="ssh brute force", metadata={"lang": "en"}) as state:
+            generation = telemetry.start_generation("generate_response", "Foundation-Sec", input="ssh brute force")
+            telemetry.finish_generation(generation, "analysis", usage={"prompt": 6, "completion": 4, "total": 10})
+            telemetry.set_trace_output("analysis")
+        root, recorded = self.client.observations
+        self.assertEqual(root.fields["trace_context"], {"trace_id": state["id"]})
+        self.assertEqual(recorded.fields["trace_context"], {"trace_id": state["id"], "parent_span_id": root.id})
+        self.assertEqual(recorded.fields["usage_details"], {"input": 6, "output": 4, "total": 10})
+        self.assertTrue(root.ended and recorded.ended)
+        self.assertEqual(root.trace["output"], "analysis")
+        self.assertEqual(telemetry.stats(), {"traces": 1, "generations": 1, "unsampled": 0})
+
+    def test_unsampled_model_drops_the_whole_trace(self):
+        telemetry = self._telemetry(model_sample_ratios={"Router": 0.0})
+        with telemetry.trace("Chat Message"):
+            self.assertIsNone(telemetry.start_generation("translate_response", "Router", input="text"))
+            # The first generation decided, so later ones in the trace follow it
+            self.assertIsNone(telemetry.start_generation("generate_response", "Foundation-Sec", input="text"))
+        [root] = self.client.observations
+        self.assertFalse(root.ended)
+        self.assertEqual(telemetry.stats(), {"traces": 0, "generations": 0, "unsampled": 1})
+
+    def test_disabled_telemetry_records_nothing(self):
+        telemetry = Telemetry(enabled=False, client=FakeLangfuse())
+        with telemetry.trace("Chat Message"):
+            generation = telemetry.start_generation("generate_response", "Foundation-Sec", input="x")
+            telemetry.finish_generation(generation, "y")
+        self.assertIsNone(generation)
+        self.assertEqual(telemetry._client.observations, [])
+
+class TestSampling(unittest.TestCase):
+    def test_sampling_is_deterministic_per_trace_id(self):
+        trace_id = str(uuid.uuid4())
+        self.assertEqual(_sampled(trace_id, 0.5), _sampled(trace_id, 0.5))
+        self.assertTrue(_sampled(trace_id, 1.0))
+        self.assertFalse(_sampled(trace_id, 0.0))
+
+    def test_model_ratio_only_thins_the_global_decision(self):
+        telemetry = Telemetry(enabled=False, sample_ratio=0.5, model_sample_ratios={"m": 0.2})
+        telemetry.enabled = True
+        ids = [str(uuid.uuid4()) for _ in range(2000)]
+        for trace_id in ids:
+            if telemetry._should_record(trace_id, "m"):
+                # Langfuse-sampled traces are always a subset of the Phoenix (global ratio) decision
+                self.assertTrue(telemetry._should_record(trace_id))
+        sampled = sum(telemetry._should_record(t) for t in ids) / len(ids)
+        self.assertAlmostEqual(sampled, 0.5, delta=0.06)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from core import tuning
+
+class TestTuningProfile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.profile_path = os.path.join(self.tmpdir.name, "llm_tuning.json")
+        self.model_path = os.path.join(self.tmpdir.name, "model.gguf")
+        with open(self.model_path, "wb") as f:
+            f.write(b"\0" * 16)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_and_load_roundtrip(self):
+        params = {"n_gpu_layers": -1, "n_threads": 6, "n_threads_batch": 10, "n_batch": 1024, "n_ubatch": 256}
+        tuning.save_model_result(self.model_path, params, {"decode_tps": 42.0}, self.profile_path)
+        self.assertEqual(tuning.tuned_params(self.model_path, self.profile_path), params)
+
+    def test_profile_from_other_machine_is_ignored(self):
+        tuning.save_model_result(self.model_path, {"n_threads": 6}, {}, self.profile_path)
+        with patch("core.tuning.machine_key", return_value="other-host|arm64|8"):
+            self.assertEqual(tuning.tuned_params(self.model_path, self.profile_path), {})
+
+    def test_changed_model_file_is_not_matched(self):
+        tuning.save_model_result(self.model_path, {"n_threads": 6}, {}, self.profile_path)
+        with open(self.model_path, "ab") as f:
+            f.write(b"\0")
+        self.assertEqual(tuning.tuned_params(self.model_path, self.profile_path), {})
+
+    def test_missing_or_corrupt_profile(self):
+        self.assertEqual(tuning.tuned_params(self.model_path, self.profile_path), {})
+        with open(self.profile_path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(tuning.tuned_params(self.model_path, self.profile_path), {})
+
+class TestCandidates(unittest.TestCase):
+    def test_thread_candidates_include_performance_cores(self):
+        candidates = tuning.thread_candidates(10, 6)
+        self.assertIn(6, candidates)
+        self.assertIn(10, candidates)
+        self.assertTrue(all(1 <= c <= 10 for c in candidates))
+
+    def test_batch_candidates_respect_context(self):
+        for n_batch, n_ubatch in tuning.batch_candidates(512):
+            self.assertLessEqual(n_batch, 512)
+            self.assertLessEqual(n_ubatch, n_batch)
+
+    def test_estimate_seconds(self):
+        self.assertAlmostEqual(tuning.estimate_seconds(768, 256), 2.0)
+        self.assertEqual(tuning.estimate_seconds(0, 10), float("inf"))
+
+if __name__ == '__main__':
+    unittest.main()
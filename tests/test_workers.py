@@ -0,0 +1,64 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+import asyncio
+import sys
+import unittest
+from unittest.mock import AsyncMock, patch
+from core.workers import WorkerSupervisor, memory_note, worker_plan
+
+class TestWorkerPlan(unittest.TestCase):
+    @patch("core.workers.LLM_THREADS", 0)
+    def test_cores_are_split_between_workers(self):
+        plan = worker_plan(3, 8100, cpu_count=12)
+        self.assertEqual([w["port"] for w in plan], [8100, 8101, 8102])
+        self.assertEqual([w["env"]["WORKER_ID"] for w in plan], ["0", "1", "2"])
+        self.assertTrue(all(w["env"]["LLM_THREADS"] == "4" for w in plan))
+        self.assertEqual(worker_plan(16, 8100, cpu_count=8)[0]["env"]["LLM_THREADS"], "1")
+
+    @patch("core.workers.LLM_THREADS", 6)
+    def test_explicit_thread_count_wins(self):
+        self.assertEqual(worker_plan(2, 8100, cpu_count=12)[1]["env"]["LLM_THREADS"], "6")
+
+@patch("core.workers.shared_weight_bytes", lambda: 5 * 1024 ** 3)
+class TestMemoryNote(unittest.TestCase):
+    @patch("core.workers.LLM_USE_MMAP", True)
+    def test_mmap_weights_are_counted_once(self):
+        with patch("core.memory_profiles.LLM_USE_MLOCK", None):
+            self.assertTrue(memory_note(3, "balanced").startswith("5.0 GB of weights mmap'd and shared by 3 workers"))
+        with patch("core.memory_profiles.LLM_USE_MLOCK", True):
+            note = memory_note(3, "balanced")
+        # mlock pins the shared pages, it does not copy them
+        self.assertIn("mlock pins that one copy (~5.0 GB)", note)
+        self.assertNotIn("15.0 GB", note)
+
+    @patch("core.workers.LLM_USE_MMAP", False)
+    def test_without_mmap_every_worker_has_a_copy(self):
+        self.assertIn("private copy of the weights (~15.0 GB for 3 workers)", memory_note(3, "balanced"))
+
+class TestWorkerSupervisor(unittest.TestCase):
+    def test_exited_worker_is_restarted_and_stop_terminates(self):
+        async def run():
+            plan = worker_plan(2, 8100, cpu_count=4)
+
+            def command(port):
+                # Worker 8100 crashes right away, worker 8101 stays up
+                code = "import sys; sys.exit(3)" if port == 8100 else "import time; time.sleep(30)"
+                return [sys.executable, "-c", code]
+
+            supervisor = WorkerSupervisor(plan, command=command, max_backoff=0.05)
+            supervisor._warm_up = AsyncMock(return_value=True)
+            supervisor.start()
+            for _ in range(100):
+                if supervisor.restarts[0] >= 2:
+                    break
+                await asyncio.sleep(0.05)
+            long_running = supervisor.procs[1]
+            await supervisor.stop(grace=2.0)
+            return supervisor.restarts, long_running.returncode
+
+        restarts, returncode = asyncio.run(run())
+        self.assertGreaterEqual(restarts[0], 2)
+        self.assertEqual(restarts[1], 0)
+        self.assertIsNotNone(returncode)
+
+if __name__ == "__main__":
+    unittest.main()
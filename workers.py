@@ -0,0 +1,40 @@
+# Maintainer: Willis Chen <misweyu2007@gmail.com>
+# Multi-worker mode: starts N app processes (Chainlit headless, each with its own KV cache and singletons)
+# that mmap the same GGUF files, plus a front router that keeps each API session on one worker.
+# Usage: python workers.py [--workers 3] [--base-port 8100] [--port 9000]
+# Clients send POST /api/analyze to the front port; worker UIs stay reachable on their own ports.
+import argparse
+import asyncio
+
+import uvicorn
+
+from core.config import WORKERS, WORKER_BASE_PORT, ROUTER_PORT, ROUTER_STALE_AFTER
+from core.logger import logger
+from core.node_router import NodeRouter
+from core.workers import WorkerSupervisor, worker_plan, memory_note
+from node_router import create_router_app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run several app workers behind a session-affine front router.")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS)
+    parser.add_argument("--base-port", type=int, default=WORKER_BASE_PORT, help="Worker i listens on base-port + i")
+    parser.add_argument("--host", default="0.0.0.0", help="Front router bind address")
+    parser.add_argument("--port", type=int, default=ROUTER_PORT, help="Front router port")
+    return parser.parse_args(argv)
+
+async def main(args):
+    plan = worker_plan(args.workers, args.base_port)
+    logger.info(f"Starting {len(plan)} workers ({plan[0]['env']['LLM_THREADS']} llama threads each): "
+                f"{memory_note(len(plan))}")
+    supervisor = WorkerSupervisor(plan)
+    supervisor.start()
+    # Workers publish watchNode like any node; the router only places work on warm, healthy ones
+    router = NodeRouter([(w["name"], f"http://127.0.0.1:{w['port']}") for w in plan], stale_after=ROUTER_STALE_AFTER)
+    server = uvicorn.Server(uvicorn.Config(create_router_app(router), host=args.host, port=args.port))
+    try:
+        await server.serve()
+    finally:
+        await supervisor.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))